@@ -0,0 +1,401 @@
+"""
+Backtester for the deal_finder strategies over market_sales history.
+
+Sales are loaded once into per-platform NumPy arrays sorted by card then time,
+with prefix sums, so every simulated tick finds each card's trailing windows
+with a single vectorised searchsorted instead of filtering a DataFrame. At each
+tick the drop and icon fluctuation rules from strategies.py run on those
+windows exactly as the live bot would see them, and every signal is replayed
+against the sales that followed it:
+
+* the buy fills if a sale at or below the suggested buy price happens within
+  FILL_HOURS of the signal (we pay our own buy price, not the cheaper sale);
+* the card is then listed at the suggested sell price and counts as sold the
+  first time a sale reaches that price within HOLD_HOURS; otherwise it is
+  dumped at the last traded price when the hold runs out;
+* EA's 5% tax comes off every sale, and a card is not re-bought while a
+  position (or an unfilled order) on it is still open.
+
+    python analysis/backtesting.py --start 2025-09-26 --end 2025-12-01 [--trades trades.csv]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "data_scraping"))
+
+from market_data import load_sales, load_cards, SOURCES
+from strategies import (
+    drop_rules, fluctuation_rules,
+    SHORT_HOURS, LONG_HOURS, SHORT_TRADES, LONG_TRADES, MIN_SHORT_SALES, MIN_LONG_SALES, THRESHOLD_BANDS,
+    FLUCTUATION_MIN_SALES, FLUCTUATION_LATEST_TRADES, ICON_VERSION, ICON_HOURS, MIN_DROP_PRICE,
+)
+
+PLATFORMS = ["pc", "ps"]
+STRATEGIES = ["drop", "fluctuation"]
+EA_TAX = 0.05
+TICK_HOURS = 1
+FILL_HOURS = 1
+HOLD_HOURS = 24
+
+# Dip rule settings run_backtest(params=...) can override; defaults are the live bot's
+DROP_PARAMS = {
+    "short_hours": SHORT_HOURS,
+    "long_hours": LONG_HOURS,
+    "short_trades": SHORT_TRADES,
+    "long_trades": LONG_TRADES,
+    "min_short_sales": MIN_SHORT_SALES,
+    "min_long_sales": MIN_LONG_SALES,
+    "bands": THRESHOLD_BANDS,
+}
+
+TRADE_COLUMNS = [
+    "strategy", "platform", "card_id", "name", "signal_time", "buy_time", "buy_price",
+    "sell_target", "sell_time", "sell_price", "proceeds", "profit", "exit",
+]
+
+HOUR = 3600
+
+
+class SaleArrays:
+    """
+    One platform's sales as arrays sorted by card then time. keys packs
+    (card, time) into one sorted int64 so a cutoff can be searched for every
+    card at once; cum holds prefix sums of prices for O(1) window sums.
+    """
+
+    def __init__(self, card, times, prices, n_cards, t0, span):
+        # Callers pass rows already in (card, time) order
+        self.card = card
+        self.times = times
+        self.prices = prices
+        self.n_cards = n_cards
+        self.t0 = t0
+        self.span = span
+        self.offsets = np.searchsorted(card, np.arange(n_cards + 1))
+        # Only cards with sales here are searched each tick
+        self.cards = np.flatnonzero(np.diff(self.offsets))
+        self.cum = np.r_[0.0, np.cumsum(prices)]
+        self.keys = card * span + (times - t0)
+        self.by_time = np.sort(times)
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_after(self, cutoff, side="left"):
+        """For each of self.cards, the index of its first sale at (side="left") or after (side="right") cutoff."""
+        rel = min(max(cutoff - self.t0, 0), self.span)
+        return np.searchsorted(self.keys, self.cards * self.span + rel, side)
+
+    def latest_before(self, t):
+        """Newest sale time at or before t, or None."""
+        i = np.searchsorted(self.by_time, t, "right")
+        return int(self.by_time[i - 1]) if i else None
+
+    def last_sum(self, start, end, n):
+        """Sum and count of the last n prices in each [start, end) window."""
+        taken = np.minimum(end - start, n)
+        return self.cum[end] - self.cum[end - taken], taken
+
+    def window_min_max(self, start, end):
+        """Min and max price of each non-empty [start, end) window."""
+        # Gather just the window rows so the cost doesn't grow with each card's history
+        lengths = end - start
+        heads = np.r_[0, np.cumsum(lengths)[:-1]]
+        prices = self.prices[np.repeat(start - heads, lengths) + np.arange(lengths.sum())]
+        return np.minimum.reduceat(prices, heads), np.maximum.reduceat(prices, heads)
+
+
+class PlatformHistory:
+
+    def __init__(self, platform, card, times, prices, card_ids, names, versions, sale_ids=None):
+        self.platform = platform
+        self.card_ids = card_ids
+        self.names = names
+        n_cards = len(card_ids)
+        self.start = int(times.min()) if len(times) else None
+        self.end = int(times.max()) if len(times) else None
+
+        # Relative times start at 1, so cutoffs clipped to [0, span] never reach a neighbouring card
+        t0 = self.start - 1 if len(times) else 0
+        span = self.end - t0 + 2 if len(times) else 2
+        keys = card * span + (times - t0)
+        # Same-minute sales go oldest sale_id (or earliest row) first, so "last N trades" matches strategies.card_features
+        if sale_ids is None:
+            order = np.argsort(keys, kind="stable")
+        elif len(keys) and int(keys.max()).bit_length() + int(sale_ids.max()).bit_length() < 63:
+            id_bits = int(sale_ids.max()).bit_length()
+            order = np.argsort((keys << id_bits) | sale_ids)  # sale_ids are unique, so no ties left
+        else:
+            order = np.lexsort((sale_ids, keys))
+        card, times, prices = card[order], times[order], prices[order]
+
+        icon = (versions == ICON_VERSION)[card]
+        gold = ~icon & (prices > MIN_DROP_PRICE)
+        self.drop = SaleArrays(card[gold], times[gold], prices[gold], n_cards, t0, span)
+        self.icons = SaleArrays(card[icon], times[icon], prices[icon], n_cards, t0, span)
+        # Fills are checked against every sale of the card, whatever its price
+        self.fills = SaleArrays(card, times, prices, n_cards, t0, span)
+
+
+class MarketHistory:
+    """
+    Sales history split per platform, ready to replay. df needs card_id,
+    platform, sale_time and sold_price, plus name and version unless a
+    market_data cards dimension table is passed. With a sale_id column,
+    sales at the same time are ordered by it rather than by row order.
+    """
+
+    def __init__(self, df, cards=None):
+        df = df[df["sold_price"] > 0]
+        if cards is None:
+            cards = df.drop_duplicates("card_id")
+        cards = cards[cards["card_id"].isin(df["card_id"].unique())].sort_values("card_id")
+        card_ids = cards["card_id"].to_numpy()
+        names = cards["name"].to_numpy(dtype=object)
+        versions = cards["version"].to_numpy(dtype=object)
+
+        card = np.searchsorted(card_ids, df["card_id"].to_numpy())
+        times = _epoch_seconds(df["sale_time"])
+        prices = df["sold_price"].to_numpy(dtype=np.float64)
+        sale_ids = df["sale_id"].to_numpy(dtype=np.int64) if "sale_id" in df.columns else None
+        codes, platforms = pd.factorize(df["platform"])
+        self.platforms = {}
+        for code, plat in enumerate(platforms):
+            mask = codes == code
+            plat = plat.lower()
+            self.platforms[plat] = PlatformHistory(plat, card[mask], times[mask], prices[mask], card_ids, names, versions,
+                                                   None if sale_ids is None else sale_ids[mask])
+        self.rows = len(df)
+
+
+def _epoch_seconds(sale_time):
+    sale_time = pd.to_datetime(sale_time)
+    if sale_time.dt.tz is not None:
+        sale_time = sale_time.dt.tz_localize(None)  # keep the wall-clock time, like market_sales
+    return sale_time.to_numpy("datetime64[s]").astype(np.int64)
+
+
+def _seconds(t):
+    return int(pd.Timestamp(t).to_datetime64().astype("datetime64[s]").astype(np.int64))
+
+
+def _to_datetime(seconds):
+    return pd.to_datetime(np.asarray(seconds, dtype=np.int64), unit="s")
+
+
+def load_history(start, end, platforms=PLATFORMS, source="db"):
+    """MarketHistory of start <= sale_time < end from MySQL or the local Parquet cache."""
+    sales = load_sales(start, end, platforms, columns=["sale_id", "card_id", "platform", "sale_time", "sold_price"],
+                       source=source)
+    return MarketHistory(sales, load_cards(source=source))
+
+
+# ------------------- SIGNALS -------------------
+
+def drop_signals(history, t, params=DROP_PARAMS):
+    """(card index, buy price, sell price) for every card the dip rules flag at tick t."""
+    sales = history.drop
+    latest = sales.latest_before(t)
+    if latest is None:
+        return None
+    # Same cutoffs as strategies.drop_features: relative to the newest sale, strictly after
+    end = sales.index_after(latest, "right")
+    long_start = sales.index_after(latest - int(params["long_hours"] * HOUR), "right")
+    short_start = sales.index_after(latest - int(params["short_hours"] * HOUR), "right")
+    volume = end - long_start
+    short_count = end - short_start
+    active = np.flatnonzero((short_count >= params["min_short_sales"]) & (volume >= params["min_long_sales"]))
+    if not len(active):
+        return None
+
+    end = end[active]
+    short_sum, short_taken = sales.last_sum(short_start[active], end, params["short_trades"])
+    long_sum, long_taken = sales.last_sum(long_start[active], end, params["long_trades"])
+    r = drop_rules(short_count[active], short_sum, short_taken, long_sum, long_taken, volume[active],
+                   params["min_short_sales"], params["min_long_sales"], params["bands"])
+    keep = r["keep"]
+    return sales.cards[active[keep]], r["buy"][keep], r["raw_sell"][keep]
+
+
+def fluctuation_signals(history, t, params=None):
+    """(card index, buy price, sell price) for every icon the fluctuation rules flag at tick t."""
+    sales = history.icons
+    end = sales.index_after(t, "right")
+    start = sales.index_after(t - ICON_HOURS * HOUR, "left")
+    volume = end - start
+    active = np.flatnonzero(volume >= FLUCTUATION_MIN_SALES)
+    if not len(active):
+        return None
+
+    start, end, volume = start[active], end[active], volume[active]
+    price_sum = sales.cum[end] - sales.cum[start]
+    min_price, max_price = sales.window_min_max(start, end)
+    latest_price = np.median(sales.prices[end[:, None] - np.arange(FLUCTUATION_LATEST_TRADES, 0, -1)], axis=1)
+    r = fluctuation_rules(volume, price_sum, min_price, max_price, latest_price)
+    keep = r["keep"]
+    return sales.cards[active[keep]], r["buy"][keep], r["sell"][keep]
+
+
+SIGNALS = {"drop": drop_signals, "fluctuation": fluctuation_signals}
+
+
+# ------------------- FILLS -------------------
+
+def simulate_trade(fills, card, t, buy, sell, fill_hours=FILL_HOURS, hold_hours=HOLD_HOURS, data_end=None):
+    """
+    Replay one signal against the card's later sales. Returns None if the buy
+    never fills, else (buy_time, sell_time, sell_price, exit) where exit is
+    "target", "timeout" or "open" (the hold runs past the end of the data).
+    """
+    lo, hi = fills.offsets[card], fills.offsets[card + 1]
+    times = fills.times[lo:hi]
+    prices = fills.prices[lo:hi]
+
+    i0 = np.searchsorted(times, t, "right")
+    i1 = np.searchsorted(times, t + fill_hours * HOUR, "right")
+    hit = np.flatnonzero(prices[i0:i1] <= buy)
+    if not len(hit):
+        return None
+    b = i0 + hit[0]
+    buy_time = times[b]
+
+    horizon = buy_time + hold_hours * HOUR
+    j1 = np.searchsorted(times, horizon, "right")
+    hit = np.flatnonzero(prices[b + 1:j1] >= sell)
+    if len(hit):
+        return buy_time, times[b + 1 + hit[0]], sell, "target"
+    if data_end is not None and horizon > data_end:
+        # Still held when the data runs out: marked at the last traded price
+        return buy_time, times[j1 - 1], prices[j1 - 1], "open"
+    return buy_time, horizon, prices[j1 - 1], "timeout"
+
+
+# ------------------- ENGINE -------------------
+
+def run_backtest(history, start=None, end=None, strategies=STRATEGIES, tick_hours=TICK_HOURS,
+                 fill_hours=FILL_HOURS, hold_hours=HOLD_HOURS, tax=EA_TAX, params=None):
+    """
+    Replay every platform tick by tick. Returns (trades, signals): one row per
+    filled trade, and the number of signals / unfilled orders per strategy and platform.
+    params overrides entries of DROP_PARAMS.
+    """
+    params = {**DROP_PARAMS, **(params or {})}
+    trades = []
+    signals = []
+    for plat, ph in history.platforms.items():
+        if ph.start is None:
+            continue
+        # By default start once the longest window is full of history
+        first = ph.start + int(max(params["long_hours"], ICON_HOURS) * HOUR) if start is None else _seconds(start)
+        last = ph.end if end is None else _seconds(end)
+        first = -(-first // HOUR) * HOUR  # ticks on the hour
+        ticks = np.arange(first, last + 1, int(tick_hours * HOUR))
+
+        for strategy in strategies:
+            find = SIGNALS[strategy]
+            busy_until = np.full(len(ph.card_ids), np.iinfo(np.int64).min)
+            count = unfilled = 0
+            for t in ticks:
+                found = find(ph, t, params)
+                if found is None:
+                    continue
+                for card, buy, sell in zip(*found):
+                    if busy_until[card] > t:
+                        continue
+                    count += 1
+                    result = simulate_trade(ph.fills, card, t, buy, sell, fill_hours, hold_hours, ph.end)
+                    if result is None:
+                        unfilled += 1
+                        busy_until[card] = t + fill_hours * HOUR
+                        continue
+                    buy_time, sell_time, sell_price, exit = result
+                    busy_until[card] = sell_time
+                    proceeds = np.floor(sell_price * (1 - tax))
+                    trades.append((strategy, plat, ph.card_ids[card], ph.names[card], t, buy_time, buy,
+                                   sell, sell_time, sell_price, proceeds, proceeds - buy, exit))
+            signals.append({"strategy": strategy, "platform": plat, "signals": count, "unfilled": unfilled})
+
+    trades = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    for col in ["signal_time", "buy_time", "sell_time"]:
+        trades[col] = _to_datetime(trades[col])
+    return trades, pd.DataFrame(signals, columns=["strategy", "platform", "signals", "unfilled"])
+
+
+def max_drawdown(trades):
+    """Largest fall of realised P&L from its running peak, trades booked at their sell time."""
+    if trades.empty:
+        return 0.0
+    equity = np.cumsum(trades.sort_values("sell_time", kind="stable")["profit"].to_numpy())
+    peak = np.maximum.accumulate(np.r_[0.0, equity])[1:]
+    return float((peak - equity).max())
+
+
+def peak_capital(trades):
+    """Most coins tied up in open positions at any one time."""
+    if trades.empty:
+        return 0.0
+    times = np.r_[trades["buy_time"].to_numpy(), trades["sell_time"].to_numpy()]
+    flows = np.r_[trades["buy_price"].to_numpy(), -trades["buy_price"].to_numpy()]
+    # Sales before buys at the same instant, so a card bought as another sells doesn't double count
+    order = np.lexsort((flows, times))
+    return float(np.cumsum(flows[order]).max())
+
+
+def summarize(trades, signals):
+    """P&L, hit rate and drawdown per strategy and platform, plus an overall row."""
+    rows = []
+    groups = [((s, p), trades[(trades["strategy"] == s) & (trades["platform"] == p)],
+               signals[(signals["strategy"] == s) & (signals["platform"] == p)])
+              for s, p in signals[["strategy", "platform"]].itertuples(index=False)]
+    groups.append((("all", "all"), trades, signals))
+    for (strategy, plat), t, s in groups:
+        n_signals = int(s["signals"].sum())
+        invested = float(t["buy_price"].sum())
+        pnl = float(t["profit"].sum())
+        rows.append({
+            "strategy": strategy,
+            "platform": plat,
+            "signals": n_signals,
+            "fill_%": round(len(t) / n_signals * 100, 2) if n_signals else 0.0,
+            "trades": len(t),
+            "hit_rate_%": round((t["profit"] > 0).mean() * 100, 2) if len(t) else 0.0,
+            "target_%": round((t["exit"] == "target").mean() * 100, 2) if len(t) else 0.0,
+            "pnl": pnl,
+            "avg_profit": round(pnl / len(t), 2) if len(t) else 0.0,
+            "roi_%": round(pnl / invested * 100, 2) if invested else 0.0,
+            "max_drawdown": max_drawdown(t),
+            "peak_capital": peak_capital(t),
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", required=True, help="first sale_time to load, e.g. 2025-09-26")
+    ap.add_argument("--end", default=None, help="load sales before this time (default: now)")
+    ap.add_argument("--strategy", choices=STRATEGIES, action="append", help="repeat for several (default: all)")
+    ap.add_argument("--platform", choices=PLATFORMS, action="append", help="repeat for several (default: all)")
+    ap.add_argument("--fill-hours", type=float, default=FILL_HOURS)
+    ap.add_argument("--hold-hours", type=float, default=HOLD_HOURS)
+    ap.add_argument("--source", choices=SOURCES, default="db", help="MySQL or the sales_cache.py Parquet cache")
+    ap.add_argument("--trades", help="write every simulated trade to this CSV")
+    args = ap.parse_args()
+
+    started = time.perf_counter()
+    history = load_history(args.start, args.end or pd.Timestamp.now(), args.platform or PLATFORMS, args.source)
+    print(f"Loaded {history.rows:,} sales in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    trades, signals = run_backtest(history, strategies=args.strategy or STRATEGIES,
+                                   fill_hours=args.fill_hours, hold_hours=args.hold_hours)
+    print(f"Replayed in {time.perf_counter() - started:.2f}s")
+    print(summarize(trades, signals).to_string(index=False))
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+        print(f"Wrote {len(trades)} trades to {args.trades}")
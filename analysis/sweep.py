@@ -0,0 +1,213 @@
+"""
+Parallel parameter sweep for the dip strategy.
+
+deal_finder and the notebook disagree on the dip settings (2h/8h windows and
+10 short trades in the bot, 6h/16h and 20 in the notebook), so this runs the
+backtester over a grid of SHORT_HOURS, LONG_HOURS, SHORT_TRADES, LONG_TRADES,
+MIN_SHORT_SALES, MIN_LONG_SALES and a scale on the get_thresholds bands, and
+ranks every combination.
+
+History is loaded and sorted once in the parent, then the arrays the dip rule
+and the fill model read are copied into one shared-memory block that every
+worker maps read-only, so workers start instantly and memory does not grow
+with the pool size:
+
+    python analysis/sweep.py --start 2025-09-26 --end 2025-12-01 [--samples 2000] [--workers 8]
+
+Without --samples the full grid runs. Results go to --out (sweep_results.csv),
+best first; the bot's and the notebook's settings are always included and
+labelled so the ranking shows how far off they are.
+"""
+import argparse
+import itertools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtesting import (
+    MarketHistory, PlatformHistory, SaleArrays, DROP_PARAMS, FILL_HOURS, HOLD_HOURS,
+    load_history, run_backtest, summarize,
+)
+from market_data import SOURCES
+from strategies import THRESHOLD_BANDS
+
+GRID = {
+    "short_hours": [1, 2, 3, 4, 6],
+    "long_hours": [6, 8, 12, 16, 24],
+    "short_trades": [5, 10, 20],
+    "long_trades": [50, 100, 200],
+    "min_short_sales": [10, 15, 20],
+    "min_long_sales": [20, 40, 60],
+    # Multiplies every medium/high dip % in THRESHOLD_BANDS
+    "band_scale": [0.75, 1.0, 1.25, 1.5],
+}
+
+BASELINES = {
+    "bot": {**{k: v for k, v in DROP_PARAMS.items() if k != "bands"}, "band_scale": 1.0},
+    "notebook": {"short_hours": 6, "long_hours": 16, "short_trades": 20, "long_trades": 100,
+                 "min_short_sales": 15, "min_long_sales": 40, "band_scale": 1.0},
+}
+
+METRICS = ["signals", "fill_%", "trades", "hit_rate_%", "target_%", "pnl", "avg_profit", "roi_%",
+           "max_drawdown", "peak_capital"]
+RANK_BY = ["pnl", "roi_%", "hit_rate_%", "avg_profit"]
+
+# Arrays of each SaleArrays the dip signals and the fill model read
+SHARED_FIELDS = ["card", "times", "prices", "offsets", "cards", "cum", "keys", "by_time"]
+SHARED_SETS = ["drop", "fills"]
+
+
+def combinations(grid=GRID):
+    """Every grid point where the short window and trade count fit inside the long ones."""
+    keys = list(grid)
+    for values in itertools.product(*grid.values()):
+        combo = dict(zip(keys, values))
+        if combo["short_hours"] < combo["long_hours"] and combo["short_trades"] <= combo["long_trades"]:
+            yield combo
+
+
+def to_params(combo):
+    scale = combo["band_scale"]
+    params = {k: v for k, v in combo.items() if k != "band_scale"}
+    params["bands"] = tuple((floor, medium * scale, high * scale) for floor, medium, high in THRESHOLD_BANDS)
+    return params
+
+
+# ------------------- SHARED HISTORY -------------------
+
+def share_history(history):
+    """
+    Copy the swept arrays of every platform into one shared-memory block.
+    Returns the block and a small picklable spec workers rebuild the history from.
+    """
+    arrays = []
+    size = 0
+    spec = {"platforms": {}}
+    for plat, ph in history.platforms.items():
+        entry = {"start": ph.start, "end": ph.end, "card_ids": ph.card_ids, "names": ph.names, "sets": {}}
+        for part in SHARED_SETS:
+            sale_arrays = getattr(ph, part)
+            fields = {}
+            for field in SHARED_FIELDS:
+                arr = np.ascontiguousarray(getattr(sale_arrays, field))
+                size = -(-size // 64) * 64  # keep every array cache-line aligned
+                fields[field] = (size, arr.dtype.str, arr.shape)
+                arrays.append((size, arr))
+                size += arr.nbytes
+            entry["sets"][part] = {"fields": fields, "n_cards": sale_arrays.n_cards,
+                                   "t0": sale_arrays.t0, "span": sale_arrays.span}
+        spec["platforms"][plat] = entry
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for offset, arr in arrays:
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf, offset=offset)[...] = arr
+    spec["name"] = shm.name
+    return shm, spec
+
+
+def attach_history(shm, spec):
+    """MarketHistory backed by the shared block, without copying or re-sorting anything."""
+    history = MarketHistory.__new__(MarketHistory)  # skip __init__: the arrays are already built
+    history.platforms = {}
+    history.rows = 0
+    for plat, entry in spec["platforms"].items():
+        ph = PlatformHistory.__new__(PlatformHistory)
+        ph.platform = plat
+        ph.start, ph.end = entry["start"], entry["end"]
+        ph.card_ids, ph.names = entry["card_ids"], entry["names"]
+        ph.icons = None  # only the dip strategy is swept
+        for part, desc in entry["sets"].items():
+            sale_arrays = SaleArrays.__new__(SaleArrays)
+            sale_arrays.n_cards, sale_arrays.t0, sale_arrays.span = desc["n_cards"], desc["t0"], desc["span"]
+            for field, (offset, dtype, shape) in desc["fields"].items():
+                arr = np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+                arr.flags.writeable = False
+                setattr(sale_arrays, field, arr)
+            setattr(ph, part, sale_arrays)
+        history.rows += len(ph.fills)
+        history.platforms[plat] = ph
+    return history
+
+
+# ------------------- WORKERS -------------------
+
+_shm = None
+_history = None
+_settings = None
+
+
+def _init_worker(spec, settings):
+    global _shm, _history, _settings
+    _shm = shared_memory.SharedMemory(name=spec["name"])
+    _history = attach_history(_shm, spec)
+    _settings = settings
+
+
+def evaluate(job):
+    label, combo = job
+    trades, signals = run_backtest(_history, strategies=["drop"], params=to_params(combo), **_settings)
+    overall = summarize(trades, signals).iloc[-1]
+    return {"label": label, **combo, **{metric: overall[metric] for metric in METRICS}}
+
+
+def rank(results, rank_by="pnl", min_trades=20):
+    """Best first by rank_by, shallower drawdown breaking ties; combos with too few trades rank last."""
+    results = results.assign(enough_trades=results["trades"] >= min_trades)
+    results = results.sort_values(["enough_trades", rank_by, "max_drawdown"], ascending=[False, False, True], kind="stable")
+    results.insert(0, "rank", np.arange(1, len(results) + 1))
+    return results.drop(columns="enough_trades").reset_index(drop=True)
+
+
+def run_sweep(history, jobs, workers=None, settings=None):
+    """Evaluate (label, combo) jobs on a process pool sharing history; returns one result row per job."""
+    settings = settings or {"fill_hours": FILL_HOURS, "hold_hours": HOLD_HOURS}
+    shm, spec = share_history(history)
+    rows = []
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(spec, settings)) as pool:
+            for i, row in enumerate(pool.map(evaluate, jobs, chunksize=4), 1):
+                rows.append(row)
+                if i % 100 == 0 or i == len(jobs):
+                    elapsed = time.perf_counter() - started
+                    print(f"{i}/{len(jobs)} combos in {elapsed:.0f}s ({elapsed / i:.2f}s each)")
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", required=True, help="first sale_time to load, e.g. 2025-09-26")
+    ap.add_argument("--end", default=None, help="load sales before this time (default: now)")
+    ap.add_argument("--samples", type=int, help="random search over this many grid points instead of the full grid")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None, help="default: one per CPU")
+    ap.add_argument("--fill-hours", type=float, default=FILL_HOURS)
+    ap.add_argument("--hold-hours", type=float, default=HOLD_HOURS)
+    ap.add_argument("--rank-by", choices=RANK_BY, default="pnl")
+    ap.add_argument("--min-trades", type=int, default=20)
+    ap.add_argument("--source", choices=SOURCES, default="db", help="MySQL or the sales_cache.py Parquet cache")
+    ap.add_argument("--out", default="sweep_results.csv")
+    args = ap.parse_args()
+
+    combos = [c for c in combinations() if c not in BASELINES.values()]
+    if args.samples is not None and args.samples < len(combos):
+        combos = random.Random(args.seed).sample(combos, args.samples)
+    jobs = list(BASELINES.items()) + [("", combo) for combo in combos]
+
+    started = time.perf_counter()
+    history = load_history(args.start, args.end or pd.Timestamp.now(), source=args.source)
+    print(f"Loaded {history.rows:,} sales in {time.perf_counter() - started:.1f}s; sweeping {len(jobs)} combos")
+
+    results = run_sweep(history, jobs, args.workers, {"fill_hours": args.fill_hours, "hold_hours": args.hold_hours})
+    results = rank(results, args.rank_by, args.min_trades)
+    results.to_csv(args.out, index=False)
+    print(results.head(10).to_string(index=False))
+    print(results[results["label"] != ""].to_string(index=False))
+    print(f"Wrote {len(results)} combos to {args.out}")
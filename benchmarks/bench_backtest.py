@@ -0,0 +1,116 @@
+"""
+Parity check and benchmark for analysis/backtesting.py.
+
+Run from the repository root:
+    python benchmarks/bench_backtest.py [--cards 800] [--days 30] [--checks 6]
+
+Builds a synthetic season (random-walk prices with short dips, busy and quiet
+cards, icons every fifth card, minute-precise sale times with sale_ids) and first checks that the backtester's array
+signals at a few ticks flag the same cards at the same prices as the
+strategies.py candidate functions run on the matching DataFrame slice. Then
+it times loading the history and replaying every hourly tick.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "data_scraping"))
+sys.path.append(os.path.join(HERE, "..", "analysis"))
+
+from strategies import drop_candidates, fluctuation_candidates
+from backtesting import (
+    MarketHistory, drop_signals, fluctuation_signals, run_backtest, summarize, _seconds,
+    ICON_VERSION, ICON_HOURS, LONG_HOURS, MIN_DROP_PRICE,
+)
+
+START = pd.Timestamp("2025-09-26")
+
+
+def synthetic_season(cards, days, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = days * 24
+    frames = []
+    for plat in ["pc", "ps"]:
+        rate = np.exp(rng.uniform(np.log(1), np.log(40), cards))  # sales per hour
+        counts = rng.poisson(rate * hours)
+        card = np.repeat(np.arange(cards), counts)
+        # Whole minutes, like scraped sale_times, so busy cards have same-time sales
+        offsets = rng.integers(0, hours * 60, counts.sum()) * 60
+        base = np.exp(rng.uniform(np.log(3_000), np.log(800_000), cards))
+        walk = np.exp(np.cumsum(rng.normal(0, 0.01, (cards, hours)), axis=1))
+        # Roughly one dip a card every four days, each lasting about three hours
+        dips = np.where(rng.random((cards, hours)) < 0.01, rng.uniform(0.80, 0.93, (cards, hours)), 1.0)
+        dips = np.minimum.reduce([np.roll(dips, k, axis=1) for k in range(3)])
+        price = (base[:, None] * walk * dips)[card, offsets // 3600] * rng.normal(1.0, 0.05, counts.sum())
+        frames.append(pd.DataFrame({
+            "card_id": card + 1,
+            "platform": plat,
+            "sale_time": START + pd.to_timedelta(offsets, unit="s"),
+            "sold_price": np.maximum(price.round(), 0).astype(np.int64),
+        }))
+    cards_df = pd.DataFrame({
+        "card_id": np.arange(1, cards + 1),
+        "name": [f"Player {i}" for i in range(1, cards + 1)],
+        "version": np.where(np.arange(1, cards + 1) % 5 == 0, ICON_VERSION, "Gold Rare"),
+    })
+    df = pd.concat(frames, ignore_index=True).merge(cards_df, on="card_id")
+    # Ids follow insert order, which breaks same-minute ties at random; rows are then
+    # shuffled so neither side can lean on row order to break ties
+    df["sale_id"] = np.lexsort((rng.random(len(df)), df["sale_time"].to_numpy())).argsort() + 1
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def check_tick(df, history, plat, tick):
+    """Signals at one tick against the candidate functions on the rows the live queries would return."""
+    ph = history.platforms[plat]
+    t = _seconds(tick)
+    sales = df[(df["platform"] == plat) & (df["sale_time"] <= tick)]
+
+    gold = sales[(sales["version"] != ICON_VERSION) & (sales["sold_price"] > MIN_DROP_PRICE)
+                 & (sales["sale_time"] >= tick - pd.Timedelta(hours=LONG_HOURS))]
+    expected = drop_candidates(gold, plat)
+    expected = dict(zip(expected["name"], zip(expected["suggested_buy"], expected["suggested_sell_raw"])))
+    found = drop_signals(ph, t)
+    actual = {} if found is None else {ph.names[c]: (b, s) for c, b, s in zip(*found)}
+    assert expected == actual, f"drop {plat} {tick}: {set(expected) ^ set(actual)}"
+
+    icons = sales[(sales["version"] == ICON_VERSION) & (sales["sale_time"] >= tick - pd.Timedelta(hours=ICON_HOURS))]
+    expected = fluctuation_candidates(icons)
+    expected = dict(zip(expected["name"], zip(expected["best_buy"], expected["best_sell"])))
+    found = fluctuation_signals(ph, t)
+    actual = {} if found is None else {ph.names[c]: (b, s) for c, b, s in zip(*found)}
+    assert expected == actual, f"fluctuation {plat} {tick}: {set(expected) ^ set(actual)}"
+    return len(actual)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cards", type=int, default=800)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--checks", type=int, default=6, help="ticks per platform to check against strategies.py")
+    args = ap.parse_args()
+
+    df = synthetic_season(args.cards, args.days)
+
+    started = time.perf_counter()
+    history = MarketHistory(df)
+    load_time = time.perf_counter() - started
+
+    ticks = pd.date_range(START + pd.Timedelta(days=1), START + pd.Timedelta(days=args.days), periods=args.checks).floor("h")
+    for plat in ["pc", "ps"]:
+        for tick in ticks:
+            check_tick(df, history, plat, tick)
+    print(f"parity ok: {args.checks} ticks per platform")
+
+    started = time.perf_counter()
+    trades, signals = run_backtest(history)
+    replay_time = time.perf_counter() - started
+    print(summarize(trades, signals).to_string(index=False))
+    print(f"{len(df):,} sales, {args.days * 24} hourly ticks per platform")
+    print(f"  load:   {load_time:>8.2f} s")
+    print(f"  replay: {replay_time:>8.2f} s")
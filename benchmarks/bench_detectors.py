@@ -0,0 +1,301 @@
+"""
+Parity check and benchmark for the shared feature table in strategies.py.
+
+Run from the repository root:
+    python benchmarks/bench_detectors.py [--cards 3000] [--sales 300] [--repeat 3]
+
+The rising trend, low-volatility snipe and range detectors are compared
+against the per-card loops from fc26_data.ipynb (kept below as the
+reference) on a synthetic day of trading; the dip and icon fluctuation
+detectors are checked against bench_strategies.py's loops the same way.
+It also checks that a past now= hides the sales after it, and that
+deal_finder's pandas mode anchors each strategy on its own rows when gold and
+icon sales are fetched together. Then it times
+every detector on its own against all of them sharing one feature table. Sale times are unique per card so "last N trades" never
+depends on how ties are broken.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "data_scraping"))
+
+from strategies import (
+    DETECTORS, DIP_PARAMS, MIN_DROP_PRICE, ICON_VERSION, ICON_HOURS,
+    LONG_HOURS, build_features, card_features, detect, run_strategies, live_features,
+    drop_candidates_from_features, fluctuation_candidates_from_features,
+)
+from bench_strategies import reference_drop_candidates, reference_fluctuation_candidates, check_parity
+
+NOW = pd.Timestamp("2025-10-01 12:00:00")
+VERSIONS = ["Gold Rare", ICON_VERSION, "Team of the Week"]
+
+
+def synthetic_day(cards, sales, seed=0):
+    """24 hours on pc and ps: calm and choppy cards, slow risers, recent dips and the odd undercut."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for plat in ["pc", "ps"]:
+        base = np.exp(rng.uniform(np.log(2_000), np.log(1_500_000), cards))
+        base[0] = 100_000
+        volatility = rng.choice([0.01, 0.02, 0.08, 0.15], cards)
+        trend = np.where(rng.random(cards) < 0.2, rng.uniform(0.05, 0.3, cards), 0.0)
+        dip = np.where(rng.random(cards) < 0.3, rng.uniform(0.80, 0.97, cards), 1.0)
+        counts = rng.integers(sales // 10, sales * 2, cards)
+        card_id = np.repeat(np.arange(1, cards + 1), counts)
+        offsets = np.concatenate([rng.choice(24 * 3600, n, replace=False) for n in counts])
+        # Card 1 is a gold card that trades at NOW, so every reference's latest sale is NOW
+        offsets[np.argmin(offsets[:counts[0]])] = 0
+        age = offsets / (24 * 3600)   # 0 newest, 1 a day old
+        price = np.repeat(base, counts) * rng.normal(1.0, np.repeat(volatility, counts))
+        # Risers climb towards now, dips hit the last two hours
+        price *= 1 + np.repeat(trend, counts) * (1 - age) ** 4
+        price *= np.where(offsets < 2 * 3600, np.repeat(dip, counts), 1.0)
+        price *= np.where(rng.random(len(price)) < 0.01, 0.85, 1.0)
+        version = np.array(VERSIONS)[rng.choice(3, cards, p=[0.7, 0.15, 0.15])]
+        version[0] = "Gold Rare"
+        frames.append(pd.DataFrame({
+            "card_id": card_id,
+            "name": [f"Player {i}" for i in card_id],
+            "version": version[card_id - 1],
+            "sale_time": NOW - pd.to_timedelta(offsets, unit="s"),
+            "sold_price": np.maximum(price.round().astype(np.int64), 200),
+            "platform": plat,
+        }))
+    return pd.concat(frames).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def reference_rising(df_26, plat):
+    """Notebook "Rising Cards Detector" cell for one platform."""
+    recent_df = df_26[
+        (df_26['sale_time'] > df_26['sale_time'].max() - pd.Timedelta(hours=12))
+        & (df_26['sold_price'] > 0)
+        & (df_26['platform'] == plat)
+        & (df_26['version'] == "Gold Rare")
+    ]
+    rising_candidates = []
+    for card_id, group in recent_df.groupby('card_id'):
+        group = group.sort_values('sale_time', ascending=False)
+        if len(group) >= 60:
+            last_short_avg = group.head(10)['sold_price'].mean()
+            last_long_avg = group.head(200)['sold_price'].mean()
+            sales_volume = group.shape[0]
+            if last_short_avg > 1.05 * last_long_avg and sales_volume >= 20:
+                suggested_buy = round(last_short_avg * 0.99)
+                suggested_sell = round(last_short_avg * 1.03)
+                potential_profit = suggested_sell - suggested_buy
+                rise_percent = (last_short_avg - last_long_avg) / last_long_avg * 100
+                if rise_percent >= 15 and (potential_profit / suggested_buy) * 100 >= 5 and sales_volume >= 30:
+                    rating = "🔥 High"
+                elif rise_percent >= 10 and (potential_profit / suggested_buy) * 100 >= 3 and sales_volume >= 20:
+                    rating = "⚡ Medium"
+                else:
+                    rating = "⚠️ Low"
+                rising_candidates.append({
+                    "platform": plat,
+                    "name": group.iloc[0]["name"],
+                    "version": group.iloc[0]["version"],
+                    "last_short_avg": round(last_short_avg, 2),
+                    "last_long_avg": round(last_long_avg, 2),
+                    "rise_%": round(rise_percent, 2),
+                    "sales_volume": sales_volume,
+                    "suggested_buy": suggested_buy,
+                    "suggested_sell": suggested_sell,
+                    "potential_profit": potential_profit,
+                    "investment_rating": rating
+                })
+    return pd.DataFrame(rising_candidates)
+
+
+def reference_snipe(df_26, plat):
+    """Notebook "Low Volatility Sniping" cell for one platform (names are unique per card here)."""
+    recent_df = df_26[(df_26['sale_time'] > df_26['sale_time'].max() - pd.Timedelta(hours=24))
+                      & (df_26['sold_price'] > 6000)
+                      & (df_26['platform'] == plat)]
+    volatility_candidates = []
+    for name, group in recent_df.groupby('name'):
+        group = group.sort_values('sale_time', ascending=False)
+        if len(group) >= 200:
+            last_200 = group.head(200)['sold_price']
+            avg_price = last_200.mean()
+            std_dev = last_200.std()
+            cv = std_dev / avg_price
+            lowest_sale = last_200.min()
+            if cv < 0.05 and (lowest_sale < 0.9 * avg_price):
+                suggested_buy = round(lowest_sale * 0.97)
+                suggested_sell = round(avg_price * 0.98)
+                ea_tax = round(suggested_sell * 0.05)
+                net_profit = suggested_sell - suggested_buy - ea_tax
+                volatility_candidates.append({
+                    "platform": plat,
+                    "name": name,
+                    "avg_price": round(avg_price, 2),
+                    "std_dev": round(std_dev, 2),
+                    "volatility_%": round(cv * 100, 2),
+                    "lowest_sale": lowest_sale,
+                    "undercut_%": round((avg_price - lowest_sale) / avg_price * 100, 2),
+                    "sales_volume": len(last_200),
+                    "suggested_buy": suggested_buy,
+                    "suggested_sell": suggested_sell,
+                    "net_profit": net_profit
+                })
+    return pd.DataFrame(volatility_candidates)
+
+
+def reference_range(df_26, plat):
+    """Notebook "Fluctuation Trading Strategy" cell for one platform."""
+    latest_time = df_26['sale_time'].max()
+    recent_df = df_26[
+        (df_26['sale_time'] > latest_time - pd.Timedelta(hours=8)) &
+        (df_26['platform'] == plat) &
+        (df_26['sold_price'] > 1)
+    ]
+    fluctuation_candidates = []
+    for name, group in recent_df.groupby("card_id"):
+        group = group.sort_values('sale_time', ascending=False)
+        latest_price = group.sort_values('sale_time', ascending=False)['sold_price'].head(5).median()
+        if len(group) < 20:
+            continue
+        prices = group['sold_price'].sort_values()
+        low = prices.quantile(0.05)
+        high = prices.quantile(0.95)
+        clean_prices = prices[(prices >= low) & (prices <= high)]
+        clean_prices = clean_prices[clean_prices <= latest_price * 1.05]
+        if clean_prices.empty:
+            continue
+        avg_price = clean_prices.mean()
+        min_price = clean_prices.min()
+        max_price = clean_prices.max()
+        spread = (max_price - min_price) / avg_price * 100
+        sales_volume = len(clean_prices)
+        if spread >= 15 and sales_volume >= 20 and avg_price > 5000:
+            buy_price = round(min_price * 1.02)
+            sell_price = round(avg_price * 0.98)
+            profit_margin = round(((sell_price - buy_price) / buy_price) * 100, 2)
+            if profit_margin > 5 and buy_price <= latest_price:
+                fluctuation_candidates.append({
+                    "platform": plat,
+                    "name": group.iloc[0]["name"],
+                    "latest_sale": latest_price,
+                    "avg_price": int(avg_price),
+                    "min_price": int(min_price),
+                    "max_price": int(max_price),
+                    "spread_%": round(spread, 2),
+                    "sales_volume": sales_volume,
+                    "best_buy": buy_price,
+                    "best_sell": sell_price,
+                    "profit_margin_%": profit_margin,
+                })
+    return pd.DataFrame(fluctuation_candidates)
+
+
+def reference_dip(df, plat):
+    """bench_strategies' deal_finder loop on the gold sales above MIN_DROP_PRICE in the dip window."""
+    gold = df[(df["version"] != ICON_VERSION) & (df["sold_price"] > MIN_DROP_PRICE) & (df["platform"] == plat)
+              & (df["sale_time"] >= NOW - pd.Timedelta(hours=DIP_PARAMS["long_hours"]))]
+    found = reference_drop_candidates(gold, plat)
+    if not found.empty:
+        found.insert(0, "platform", plat)
+    return found
+
+
+def reference_fluctuation(df, plat):
+    icons = df[(df["version"] == ICON_VERSION) & (df["platform"] == plat)
+               & (df["sale_time"] > NOW - pd.Timedelta(hours=ICON_HOURS))]
+    return reference_fluctuation_candidates(icons)
+
+
+REFERENCES = {
+    "dip": (reference_dip, ["platform", "name"]),
+    "rising": (reference_rising, ["platform", "name"]),
+    "snipe": (reference_snipe, ["platform", "name"]),
+    "range": (reference_range, ["platform", "name"]),
+    "fluctuation": (reference_fluctuation, ["platform", "name"]),
+}
+
+
+def check_now(df, now):
+    """Features at a past now= must not see the sales after it."""
+    tiny = pd.DataFrame({"platform": "pc", "card_id": 1, "sold_price": [10, 20, 30],
+                         "sale_time": [now - pd.Timedelta(hours=1), now, now + pd.Timedelta(hours=3)]})
+    counted = card_features(tiny, {(2, 0): {"last": [5]}}, now=now)["2h_count"].tolist()
+    assert counted == [2], f"sales after now counted: {counted}"
+
+    found = run_strategies(df, now=now)
+    past = run_strategies(df[df["sale_time"] <= now], now=now)
+    for name in DETECTORS:
+        pd.testing.assert_frame_equal(found[name].reset_index(drop=True), past[name].reset_index(drop=True),
+                                      check_dtype=False)
+    print(f"now= ok: no detector sees sales after {now}")
+
+
+def check_live(df):
+    """
+    deal_finder's pandas mode on gold and icon sales mixed in one fetch, with the
+    newest sale an icon's: the dip windows must still end at the latest gold sale
+    above MIN_DROP_PRICE (as the SQL mode and the daemon anchor them) and the icon
+    window must end at the fetch's NOW(), not at the latest icon sale.
+    """
+    is_icon = df["version"] == ICON_VERSION
+    mixed = df.copy()
+    mixed.loc[~is_icon, "sale_time"] -= pd.Timedelta(minutes=40)
+    # Half a second past a whole second, so no sale sits exactly on a window edge
+    now = NOW + pd.Timedelta(seconds=30.5)
+    assert mixed.loc[is_icon, "sale_time"].max() > mixed.loc[~is_icon, "sale_time"].max()
+    features = live_features(mixed, now)
+
+    gold = mixed[~is_icon & (mixed["sold_price"] > MIN_DROP_PRICE)
+                 & (mixed["sale_time"] >= now - pd.Timedelta(hours=LONG_HOURS))]
+    for plat in ["pc", "ps"]:
+        expected = reference_drop_candidates(gold[gold["platform"] == plat], plat)
+        actual = drop_candidates_from_features(features["dip"][plat])
+        check_parity(f"live dip {plat}, icon sale newest", expected,
+                     actual[expected.columns] if not expected.empty else actual, ["name"])
+
+    icons = mixed[is_icon & (mixed["sale_time"] >= now - pd.Timedelta(hours=ICON_HOURS))]
+    expected = reference_fluctuation_candidates(icons)
+    actual = fluctuation_candidates_from_features(features["fluctuation"])
+    check_parity("live fluctuation, window ending at NOW()", expected,
+                 actual[expected.columns] if not expected.empty else actual, ["platform", "name"])
+
+
+def timed(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cards", type=int, default=3000)
+    ap.add_argument("--sales", type=int, default=300, help="typical sales per card per day")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    df = synthetic_day(args.cards, args.sales)
+    found = run_strategies(df)
+    for name, (reference, sort_by) in REFERENCES.items():
+        expected = pd.concat([reference(df, plat) for plat in ["pc", "ps"]])
+        actual = found[name].drop(columns=["rating_priority"], errors="ignore")
+        expected = expected.drop(columns=["rating_priority"], errors="ignore")
+        check_parity(name, expected, actual[expected.columns] if not expected.empty else actual, sort_by)
+    check_now(df, NOW - pd.Timedelta(hours=3))
+    check_live(df)
+
+    print(f"{len(df):,} sales, {args.cards:,} cards per platform")
+    alone = 0.0
+    for name in DETECTORS:
+        seconds = timed(lambda: detect(build_features(df, [name]), name), args.repeat)
+        alone += seconds
+        print(f"  {name:<12} {seconds * 1000:>8.1f} ms")
+    shared = timed(lambda: run_strategies(df), args.repeat)
+    table = timed(lambda: build_features(df), args.repeat)
+    print(f"  {'one by one':<12} {alone * 1000:>8.1f} ms")
+    print(f"  {'all, shared':<12} {shared * 1000:>8.1f} ms (feature table {table * 1000:.1f} ms)")
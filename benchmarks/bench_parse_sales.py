@@ -0,0 +1,87 @@
+"""
+Parity check and micro-benchmark for the parse_sales backends.
+
+Run from the repository root:
+    python benchmarks/bench_parse_sales.py [--rows 2000] [--repeat 20]
+
+The stored fixture (fixtures/futbin_sales.html) covers the awkward rows seen
+on futbin: missing or "-" sold prices, "0" prices, rows without a sale time,
+HTML comments and nested popups. Both backends must return identical output
+for it and for a large synthetic page before any timings are reported.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "data_scraping"))
+
+from futbin_scraper import parse_sales, _sale_time_to_adelaide, lxml_html
+
+FIXTURE = os.path.join(HERE, "fixtures", "futbin_sales.html")
+BACKENDS = ["bs4", "lxml"]
+
+
+def synthetic_sales_page(rows, seed=0):
+    rng = random.Random(seed)
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    body = []
+    for _ in range(rows):
+        listed = rng.randint(1_000, 900_000)
+        sold = f"{listed:,}" if rng.random() < 0.8 else rng.choice(["", "-", "0"])
+        body.append(
+            "<tr>"
+            f'<td><span class="sales-date-time">{rng.choice(months)} {rng.randint(1, 28)}, '
+            f'{rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(["AM", "PM"])}</span></td>'
+            f"<td> {listed:,} </td><td>{sold}</td><td></td><td></td>"
+            f'<td><div class="inline-popup"><div class="inline-popup-content"> {rng.choice(["Buy Now", "Bid"])} </div></div></td>'
+            "</tr>"
+        )
+    return ("<html><body><table><tbody>" + "".join(body) + "</tbody></table></body></html>").encode()
+
+
+def check_parity(pages):
+    for label, html in pages:
+        expected = parse_sales(html, backend="bs4")
+        actual = parse_sales(html, backend="lxml")
+        if expected != actual:
+            mismatch = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b), min(len(expected), len(actual)))
+            raise SystemExit(f"Parity failure on {label}: first difference at row {mismatch} "
+                             f"({len(expected)} bs4 rows vs {len(actual)} lxml rows)")
+        print(f"parity ok: {label} ({len(expected)} rows)")
+
+
+def bench(html, repeat):
+    results = {}
+    for backend in BACKENDS:
+        _sale_time_to_adelaide.cache_clear()
+        rows = len(parse_sales(html, backend=backend))  # warm up
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parse_sales(html, backend=backend)
+        elapsed = time.perf_counter() - started
+        results[backend] = rows * repeat / elapsed
+        print(f"{backend:>5}: {results[backend]:>12,.0f} rows/sec  ({elapsed / repeat * 1000:.2f} ms/page)")
+    print(f"speedup: {results['lxml'] / results['bs4']:.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2000, help="rows in the synthetic page")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    if lxml_html is None:
+        raise SystemExit("lxml is not installed")
+
+    with open(FIXTURE, "rb") as f:
+        fixture = f.read()
+    synthetic = synthetic_sales_page(args.rows)
+
+    check_parity([("stored fixture", fixture), (f"synthetic {args.rows} rows", synthetic)])
+    print(f"\nfixture page x{args.repeat * 10}")
+    bench(fixture, args.repeat * 10)
+    print(f"\nsynthetic page ({args.rows} rows) x{args.repeat}")
+    bench(synthetic, args.repeat)
@@ -0,0 +1,247 @@
+"""
+Parity check and benchmark for the columnar deal_finder strategies.
+
+Run from the repository root:
+    python benchmarks/bench_strategies.py [--cards 5000] [--sales 200] [--repeat 3]
+
+Each strategy is compared against the original per-card groupby loop from
+deal_finder (kept below as the reference) on a synthetic market, and must
+return the same candidates before any timings are reported. Sale times are
+unique per card so "last N trades" never depends on how ties are broken.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "data_scraping"))
+
+from strategies import (
+    drop_candidates, fluctuation_candidates, get_thresholds,
+    SHORT_HOURS, LONG_HOURS, SHORT_TRADES, LONG_TRADES, MIN_SHORT_SALES, MIN_LONG_SALES,
+)
+
+NOW = pd.Timestamp("2025-10-01 12:00:00")
+
+
+def synthetic_drop_sales(cards, sales, seed=0):
+    """Gold cards over the last 8 hours; roughly a third dip in the last two."""
+    rng = np.random.default_rng(seed)
+    base = np.exp(rng.uniform(np.log(4_000), np.log(600_000), cards))
+    dip = np.where(rng.random(cards) < 0.35, rng.uniform(0.80, 0.99, cards), 1.0)
+    # How much of each card's activity falls in the short window
+    recent_share = rng.uniform(0.02, 0.5, cards)
+
+    card_id = np.repeat(np.arange(1, cards + 1), sales)
+    # Unique second offsets per card, split between the short window and the rest of the long one
+    offsets = np.empty(cards * sales, dtype=np.int64)
+    for i in range(cards):
+        n_short = rng.binomial(sales, recent_share[i])
+        offsets[i * sales:(i + 1) * sales] = np.r_[
+            rng.choice(SHORT_HOURS * 3600, n_short, replace=False),
+            SHORT_HOURS * 3600 + rng.choice((LONG_HOURS - SHORT_HOURS) * 3600 - 600, sales - n_short, replace=False),
+        ]
+    in_short = offsets < SHORT_HOURS * 3600
+    noise = rng.normal(1.0, 0.03, cards * sales)
+    price = np.repeat(base, sales) * noise * np.where(in_short, np.repeat(dip, sales), 1.0)
+
+    df = pd.DataFrame({
+        "card_id": card_id,
+        "name": [f"Player {i}" for i in card_id],
+        "version": "Gold Rare",
+        "sale_time": NOW - pd.to_timedelta(offsets, unit="s"),
+        "sold_price": np.maximum(price.round().astype(np.int64), 10_001),
+        "platform": "pc",
+    })
+    # fetch_drop_candidates returns rows in no particular order
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def reference_drop_candidates(df, plat="pc"):
+    """The original deal_finder.drop_strategy loop, minus the Discord posting."""
+    df = df.sort_values("sale_time")
+
+    cutoff_short = df['sale_time'].max() - pd.Timedelta(hours=SHORT_HOURS)
+    cutoff_long = df['sale_time'].max() - pd.Timedelta(hours=LONG_HOURS)
+
+    short_df = df[(df['sale_time'] > cutoff_short) & (df['platform'] == plat) & (df['sold_price'] > 0)]
+    long_df = df[(df['sale_time'] > cutoff_long) & (df['platform'] == plat) & (df['sold_price'] > 0)]
+
+    buy_candidates = []
+    for card_id, group in short_df.groupby('card_id'):
+        group = group.sort_values('sale_time', ascending=False)
+        if len(group) >= MIN_SHORT_SALES:
+            last_short_avg = group.head(SHORT_TRADES)['sold_price'].mean()
+            long_group = long_df[long_df['card_id'] == card_id].sort_values('sale_time', ascending=False)
+            if len(long_group) < MIN_LONG_SALES:
+                continue
+            last_long_avg = long_group.head(LONG_TRADES)['sold_price'].mean()
+            sales_volume = len(long_group)
+            drop_pct = (last_long_avg - last_short_avg) / last_long_avg * 100
+            if last_short_avg < 5000:
+                continue
+            low, high = get_thresholds(last_long_avg)
+            if drop_pct >= high:
+                rating = "🔥 High"
+            elif drop_pct >= low:
+                rating = "⚡ Medium"
+            else:
+                continue
+            buy_price = round(last_short_avg * 0.97)
+            raw_sell_price = round(last_long_avg * 0.98)
+            sell_price_after_tax = int(raw_sell_price * 0.95)
+            potential_profit = sell_price_after_tax - buy_price
+            profit_margin_pct = (potential_profit / buy_price) * 100
+            if profit_margin_pct < 3:
+                continue
+            buy_candidates.append({
+                "name": group.iloc[0]["name"],
+                "version": group.iloc[0]["version"],
+                "last_short_avg": round(last_short_avg, 2),
+                "last_long_avg": round(last_long_avg, 2),
+                "drop_%": round(drop_pct, 2),
+                "sales_volume": sales_volume,
+                "suggested_buy": buy_price,
+                "suggested_sell_raw": raw_sell_price,
+                "suggested_sell_after_tax": sell_price_after_tax,
+                "potential_profit": potential_profit,
+                "profit_margin_%": round(profit_margin_pct, 2),
+                "investment_rating": rating
+            })
+
+    buy_df = pd.DataFrame(buy_candidates)
+    if not buy_df.empty:
+        rating_order = {"🔥 High": 2, "⚡ Medium": 1}
+        buy_df["rating_priority"] = buy_df["investment_rating"].map(rating_order)
+        buy_df = buy_df.sort_values(["rating_priority", "drop_%"], ascending=[False, False])
+    return buy_df
+
+
+def synthetic_icon_sales(cards, sales, seed=1):
+    """Icons on both platforms over the last 6 hours, with a mix of calm and choppy cards."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for plat in ["pc", "ps"]:
+        base = np.exp(rng.uniform(np.log(20_000), np.log(3_000_000), cards))
+        volatility = rng.choice([0.02, 0.06, 0.12], cards)
+        # Quiet cards with fewer sales than the minimum as well as busy ones
+        counts = rng.integers(2, sales + 1, cards)
+        card_id = np.repeat(np.arange(1, cards + 1), counts)
+        offsets = np.concatenate([rng.choice(6 * 3600, n, replace=False) for n in counts])
+        price = np.repeat(base, counts) * rng.normal(1.0, np.repeat(volatility, counts))
+        frames.append(pd.DataFrame({
+            "card_id": card_id,
+            "name": [f"Icon {i}" for i in card_id],
+            "version": "All Icons",
+            "sale_time": NOW - pd.to_timedelta(offsets, unit="s"),
+            "sold_price": np.maximum(price.round().astype(np.int64), 1_000),
+            "platform": plat,
+        }))
+    return pd.concat(frames).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def reference_fluctuation_candidates(df):
+    """The original per-platform deal_finder.icon_fluctuation_strategy loop, minus the Discord posting."""
+    results = []
+    for plat in ["pc", "ps"]:
+        recent_df = df[df["platform"] == plat]
+        fluctuation_candidates = []
+        for card_id, group in recent_df.groupby("card_id"):
+            if len(group) < 5:
+                continue
+            latest_price = group.sort_values('sale_time', ascending=False)['sold_price'].head(5).median()
+            latest_name = group.sort_values('sale_time', ascending=False).iloc[0]['name']
+            avg_price = group['sold_price'].mean()
+            min_price = group['sold_price'].min()
+            max_price = group['sold_price'].max()
+            spread = (max_price - min_price) / avg_price * 100
+            sales_volume = len(group)
+            if spread >= 15 and sales_volume >= 3 and avg_price > 10000:
+                buy_price = round(min_price * 1.02)
+                sell_price = round(avg_price * 0.98)
+                profit_margin = round((sell_price*0.95 - buy_price) / buy_price * 100, 2)
+                if profit_margin > 8 and latest_price < 500000:
+                    fluctuation_candidates.append({
+                        "name": latest_name,
+                        "latest_sale": latest_price,
+                        "avg_price": int(avg_price),
+                        "min_price": int(min_price),
+                        "max_price": int(max_price),
+                        "spread_%": round(spread, 2),
+                        "sales_volume": sales_volume,
+                        "best_buy": buy_price,
+                        "best_sell": sell_price,
+                        "profit_margin_%": profit_margin,
+                    })
+        fluctuation_df = pd.DataFrame(fluctuation_candidates)
+        if not fluctuation_df.empty:
+            fluctuation_df['buy_diff'] = abs(fluctuation_df['latest_sale'] - fluctuation_df['best_buy'])
+            fluctuation_df = fluctuation_df.sort_values('buy_diff')
+            display_cols = [
+                "name", "latest_sale", "best_buy", "best_sell",
+                "avg_price", "min_price", "max_price", "spread_%",
+                "sales_volume", "profit_margin_%"
+            ]
+            fluctuation_df = fluctuation_df[display_cols]
+            fluctuation_df.insert(0, "platform", plat)
+            results.append(fluctuation_df)
+    return pd.concat(results) if results else pd.DataFrame()
+
+
+def check_parity(label, expected, actual, sort_by=None):
+    if expected.empty or actual.empty:
+        assert expected.empty and actual.empty, f"{label}: {len(expected)} vs {len(actual)} candidates"
+        print(f"parity ok: {label} (no candidates)")
+        return
+    if sort_by:
+        # The original single-key quicksort leaves equal keys in arbitrary order
+        expected = expected.sort_values(sort_by, kind="stable")
+        actual = actual.sort_values(sort_by, kind="stable")
+    expected = expected.reset_index(drop=True)
+    actual = actual.reset_index(drop=True)
+    # The loop builds ints from Python scalars, so compare values rather than dtypes
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+    print(f"parity ok: {label} ({len(actual)} candidates)")
+
+
+def timed(fn, repeat, warm_up=True):
+    if warm_up:
+        fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def bench(label, reference, columnar, rows, repeat):
+    # The loop is slow enough that one timed run is plenty at full size,
+    # and the parity check has already warmed it up
+    ref_time = timed(reference, 1, warm_up=False)
+    new_time = timed(columnar, repeat)
+    print(f"{label}: {rows:,} rows")
+    print(f"  loop:     {ref_time * 1000:>10.1f} ms")
+    print(f"  columnar: {new_time * 1000:>10.1f} ms")
+    print(f"  speedup:  {ref_time / new_time:>10.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cards", type=int, default=5000)
+    ap.add_argument("--sales", type=int, default=200, help="sales per card")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    drop_df = synthetic_drop_sales(args.cards, args.sales)
+    check_parity("drop_strategy", reference_drop_candidates(drop_df), drop_candidates(drop_df, platform="pc"))
+    bench("drop_strategy", lambda: reference_drop_candidates(drop_df),
+          lambda: drop_candidates(drop_df, platform="pc"), len(drop_df), args.repeat)
+
+    icon_df = synthetic_icon_sales(args.cards, args.sales)
+    check_parity("icon_fluctuation_strategy", reference_fluctuation_candidates(icon_df),
+                 fluctuation_candidates(icon_df), sort_by=["platform", "latest_sale", "best_buy", "name"])
+    bench("icon_fluctuation_strategy (pc + ps)", lambda: reference_fluctuation_candidates(icon_df),
+          lambda: fluctuation_candidates(icon_df), len(icon_df), args.repeat)
@@ -0,0 +1,294 @@
+"""
+Non-blocking Discord webhook dispatcher for deal alerts.
+
+submit() only queues. A background thread running its own event loop drains
+the queue, packs up to EMBEDS_PER_POST alerts into one webhook post, follows
+Discord's rate-limit headers and retries 429/5xx responses with backoff.
+close() waits for the queue to drain.
+
+A batch still unsent after MAX_RETRIES errors/5xx responses, or after
+MAX_RATE_LIMIT_WAIT seconds of 429s, is held: it goes out in front of the
+next batch, and close() saves what is still held to the state file so the
+next run sends it, until it is older than the cooldown. Alerts are only
+dropped when Discord rejects them outright (any other 4xx) or no webhook is set.
+
+Repeat alerts for the same card and price band are suppressed for a cooldown
+window; a held alert keeps its slot, a dropped one gives it back so the next
+run can send it again. "No candidates" notes from every strategy and platform in a run
+are coalesced into a single message.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import aiohttp
+
+EMBEDS_PER_POST = 10          # Discord's limit per webhook message
+BATCH_WAIT_SECONDS = 1.0      # how long to wait for more alerts before posting a partial batch
+COOLDOWN_SECONDS = 2 * 3600
+PRICE_BAND = 0.05             # alerts within 5% of the previous alert's price are repeats
+MAX_RETRIES = 5
+MAX_RATE_LIMIT_WAIT = 300.0   # seconds of 429s before a batch is held for later
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+EMBED_COLOR = 0x2ECC71
+SENT, REJECTED, UNSENT = "sent", "rejected", "unsent"
+
+
+def same_price_band(price, previous):
+    if not price or not previous:
+        return True
+    return abs(price - previous) <= PRICE_BAND * previous
+
+
+def to_embed(message):
+    """First line of a formatted alert becomes the embed title, the rest its body."""
+    title, _, body = message.partition("\n")
+    return {"title": title.replace("**", "")[:256], "description": body[:4096], "color": EMBED_COLOR}
+
+
+class AlertDispatcher:
+
+    def __init__(self, webhook_url, cooldown=COOLDOWN_SECONDS, state_path=None):
+        self.webhook_url = webhook_url
+        self.cooldown = cooldown
+        self.state_path = state_path
+        self.stats = {"submitted": 0, "deduped": 0, "posts": 0, "embeds": 0, "rate_limited": 0, "retries": 0,
+                      "held": 0, "failed": 0}
+        self._held = []             # [queued_at, embed, reservation] of batches Discord has not taken yet
+        self._last_sent = self._load_state()
+        self._empty_notes = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._blocked_until = 0.0
+
+    # ------------------- PRODUCER SIDE -------------------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+        return self
+
+    def submit(self, message, key=None, price=None):
+        """
+        Queue an alert. key identifies the card (e.g. (strategy, platform, name)); a repeat
+        for the same key within the cooldown, at a price within PRICE_BAND of the last one, is skipped.
+        """
+        reservation = None
+        if key is not None:
+            dedupe_key = json.dumps([str(part) for part in key])
+            price = float(price) if price else None  # numpy scalars from candidate frames
+            now = time.time()
+            with self._lock:
+                last = self._last_sent.get(dedupe_key)
+                if last is not None and now - last[0] < self.cooldown and same_price_band(price, last[1]):
+                    self.stats["deduped"] += 1
+                    return False
+                # Held from now so repeats queued meanwhile are skipped; _release undoes it if the post fails
+                entry = [now, price]
+                self._last_sent[dedupe_key] = entry
+                reservation = (dedupe_key, entry, last)
+        with self._lock:
+            self.stats["submitted"] += 1
+        self._put(to_embed(message), reservation)
+        return True
+
+    def note_empty(self, text):
+        """Record a "no candidates" note; all notes go out as one message on flush()/close()."""
+        with self._lock:
+            self._empty_notes.append(text)
+
+    def flush_notes(self):
+        with self._lock:
+            notes, self._empty_notes = self._empty_notes, []
+        if notes:
+            self._put({"title": "No candidates this run", "description": "\n".join(notes)[:4096], "color": 0x95A5A6})
+
+    def close(self, timeout=None):
+        """Send pending notes and held alerts, wait for the queue to drain and stop the worker."""
+        self.flush_notes()
+        if self._held:
+            self.start()
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)  # sentinel after everything queued
+            self._thread.join(timeout)
+            self._thread = None
+        self._save_state()
+        if self._held:
+            print(f"Alert dispatcher: {len(self._held)} unsent alerts held for the next run")
+        print(f"Alert dispatcher: {self.stats}")
+
+    def _put(self, embed, reservation=None):
+        self.start()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (embed, reservation))
+
+    # ------------------- COOLDOWN STATE -------------------
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if "last_sent" not in state:
+            state = {"last_sent": state, "held": []}  # written before alerts were held
+        cutoff = time.time() - self.cooldown
+        last_sent = {key: last for key, last in state["last_sent"].items() if last[0] >= cutoff}
+        # A held alert keeps its card's cooldown slot, so it goes stale with it
+        for queued_at, embed, dedupe_key in state["held"]:
+            if queued_at >= cutoff:
+                entry = last_sent.get(dedupe_key) if dedupe_key is not None else None
+                self._held.append([queued_at, embed, (dedupe_key, entry, None) if entry else None])
+        return last_sent
+
+    def _release(self, reservations):
+        """Give back the cooldown slots of alerts that were never posted."""
+        with self._lock:
+            for dedupe_key, entry, previous in reservations:
+                if self._last_sent.get(dedupe_key) is not entry:
+                    continue  # a later alert for the card holds the slot now
+                if previous is None:
+                    del self._last_sent[dedupe_key]
+                else:
+                    self._last_sent[dedupe_key] = previous
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        cutoff = time.time() - self.cooldown
+        with self._lock:
+            last_sent = {key: last for key, last in self._last_sent.items() if last[0] >= cutoff}
+        held = [[queued_at, embed, reservation[0] if reservation else None]
+                for queued_at, embed, reservation in self._held if queued_at >= cutoff]
+        with open(self.state_path, "w") as f:
+            json.dump({"last_sent": last_sent, "held": held}, f)
+
+    # ------------------- WORKER -------------------
+
+    def _take_held(self, room):
+        """Held alerts still inside the cooldown, oldest first, to go out ahead of new ones."""
+        cutoff = time.time() - self.cooldown
+        self._held = [held for held in self._held if held[0] >= cutoff]
+        taken, self._held = self._held[:room], self._held[room:]
+        return [(embed, reservation, queued_at) for queued_at, embed, reservation in taken]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._worker())
+        finally:
+            self._loop.close()
+
+    async def _worker(self):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            # One pass over what an earlier run held; anything still unsent waits for the next batch
+            for _ in range(-(-len(self._held) // EMBEDS_PER_POST)):
+                await self._send(session, self._take_held(EMBEDS_PER_POST))
+            closing = False
+            while not closing:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                batch = self._take_held(EMBEDS_PER_POST - 1) + [(*item, time.time())]
+                # Give a burst a moment to fill the batch
+                deadline = time.monotonic() + BATCH_WAIT_SECONDS
+                while len(batch) < EMBEDS_PER_POST:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(self._queue.get(), remaining)
+                    except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                        break
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append((*item, time.time()))
+                await self._send(session, batch)
+
+    async def _send(self, session, batch):
+        """Post (embed, reservation, queued_at) items; hold them if Discord may take them later."""
+        if not batch:
+            return
+        result = await self._post(session, [embed for embed, _, _ in batch])
+        if result == REJECTED:
+            self._release([reservation for _, reservation, _ in batch if reservation is not None])
+        elif result == UNSENT:
+            self.stats["held"] += len(batch)
+            self._held.extend([queued_at, embed, reservation] for embed, reservation, queued_at in batch)
+
+    async def _post(self, session, embeds):
+        """SENT, REJECTED (dropped for good) or UNSENT (worth sending again later)."""
+        if not self.webhook_url:
+            print("⚠️ No Discord webhook set.")
+            self.stats["failed"] += len(embeds)
+            return REJECTED
+        # Errors and 5xx responses use up MAX_RETRIES, 429s MAX_RATE_LIMIT_WAIT
+        failures = 0
+        rate_limited_for = 0.0
+        while True:
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with session.post(self.webhook_url, json={"embeds": embeds}) as resp:
+                    self._track_bucket(resp.headers)
+                    if resp.status < 300:
+                        self.stats["posts"] += 1
+                        self.stats["embeds"] += len(embeds)
+                        return SENT
+                    if resp.status == 429:
+                        self.stats["rate_limited"] += 1
+                        delay = await self._retry_after(resp)
+                        rate_limited_for += delay
+                    elif resp.status >= 500:
+                        failures += 1
+                        delay = self._backoff(failures)
+                    else:
+                        print(f"Discord rejected alert batch: HTTP {resp.status} {await resp.text()}")
+                        self.stats["failed"] += len(embeds)
+                        return REJECTED
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Discord post failed ({type(e).__name__}), retrying")
+                failures += 1
+                delay = self._backoff(failures)
+            if failures > MAX_RETRIES or rate_limited_for > MAX_RATE_LIMIT_WAIT:
+                print(f"Holding {len(embeds)} alerts for later after {failures} failures "
+                      f"and {rate_limited_for:.0f}s rate limited")
+                return UNSENT
+            self.stats["retries"] += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def _track_bucket(self, headers):
+        # Pause before the next post once the current rate-limit bucket is used up
+        if headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                reset_after = float(headers.get("X-RateLimit-Reset-After", "1"))
+            except ValueError:
+                reset_after = 1.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + reset_after)
+
+    async def _retry_after(self, resp):
+        try:
+            body = await resp.json(content_type=None)
+            return float(body.get("retry_after", 1.0))
+        except (ValueError, AttributeError, aiohttp.ContentTypeError):
+            pass
+        try:
+            return float(resp.headers.get("Retry-After", "1"))
+        except ValueError:
+            return 1.0
+
+    @staticmethod
+    def _backoff(failures):
+        return min(BACKOFF_BASE * (2 ** (failures - 1)), BACKOFF_MAX) * random.uniform(0.5, 1.0)
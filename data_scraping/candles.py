@@ -0,0 +1,84 @@
+"""
+Read API for the market_candles table maintained by db_utils.insert_sale_db.
+
+Candles cover sold trades only: open/high/low/close/median are sold prices,
+volume is coins traded, trades is the sold count and listings counts every
+row (sold or not) that fell in the bucket. Bucket times are naive Adelaide
+wall-clock times, the same as market_sales.sale_time.
+"""
+import pandas as pd
+from db_utils import pooled_connection, CANDLE_RESOLUTIONS, bucket_start, rebuild_candles
+
+CANDLE_COLUMNS = [
+    "card_id", "platform", "resolution", "bucket_start", "open_price", "high_price",
+    "low_price", "close_price", "median_price", "volume", "trades", "listings",
+]
+
+
+def _check_resolution(resolution):
+    if resolution not in CANDLE_RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {list(CANDLE_RESOLUTIONS)}")
+
+
+def get_candles(card_id, platform, resolution="1h", start=None, end=None, limit=None):
+    """Candles for one card in time order. start/end bound bucket_start (inclusive/exclusive)."""
+    _check_resolution(resolution)
+    sql = f"""
+        SELECT {', '.join(CANDLE_COLUMNS)} FROM market_candles
+        WHERE card_id = %s AND platform = %s AND resolution = %s
+    """
+    params = [card_id, platform.lower(), resolution]
+    if start is not None:
+        sql += " AND bucket_start >= %s"
+        params.append(bucket_start(start, resolution))
+    if end is not None:
+        sql += " AND bucket_start < %s"
+        params.append(end)
+    if limit is not None:
+        # Most recent `limit` candles, returned oldest first
+        sql = f"SELECT * FROM ({sql} ORDER BY bucket_start DESC LIMIT %s) recent"
+        params.append(limit)
+    sql += " ORDER BY bucket_start"
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+
+def get_platform_candles(platform, resolution="1h", start=None, end=None, card_ids=None):
+    """Candles for every card (or just card_ids) on a platform, ordered by card then time."""
+    _check_resolution(resolution)
+    sql = f"""
+        SELECT {', '.join(CANDLE_COLUMNS)} FROM market_candles
+        WHERE platform = %s AND resolution = %s
+    """
+    params = [platform.lower(), resolution]
+    if start is not None:
+        sql += " AND bucket_start >= %s"
+        params.append(bucket_start(start, resolution))
+    if end is not None:
+        sql += " AND bucket_start < %s"
+        params.append(end)
+    if card_ids is not None:
+        if not card_ids:
+            return []
+        sql += f" AND card_id IN ({', '.join(['%s'] * len(card_ids))})"
+        params.extend(card_ids)
+    sql += " ORDER BY card_id, bucket_start"
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+
+def candles_frame(rows):
+    """DataFrame of candle rows with bucket_start parsed, ready for resampling or plotting."""
+    df = pd.DataFrame(rows, columns=CANDLE_COLUMNS)
+    df["bucket_start"] = pd.to_datetime(df["bucket_start"])
+    return df
+
+
+if __name__ == "__main__":
+    rebuild_candles()
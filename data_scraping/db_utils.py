@@ -1,15 +1,29 @@
 import pymysql
+from pymysql.constants import SERVER_STATUS
 from dotenv import load_dotenv
 import os
 import asyncio
+import datetime
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from dateutil import parser
 import pytz
+from sale_events import publish_sales
 
 load_dotenv()
 
+# Connection pool settings
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # seconds before a connection is recycled
+POOL_PING_AFTER = int(os.getenv("DB_POOL_PING_AFTER", "30"))  # idle seconds before a health check
+POOL_ACQUIRE_TIMEOUT = int(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "30"))
+
 def get_connection():
     return pymysql.connect(
         host = os.getenv("DB_HOST"),
+        port = int(os.getenv("DB_PORT", "3306")),
         user = os.getenv("DB_USER"),
         password = os.getenv("DB_PASSWORD"),
         database = os.getenv("DB_NAME"),
@@ -17,6 +31,206 @@ def get_connection():
         cursorclass=pymysql.cursors.DictCursor
     )
 
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of long-lived MySQL connections.
+    Idle connections are pinged before reuse once they have been idle for
+    ping_after seconds and are replaced once they are older than max_lifetime.
+    """
+
+    def __init__(self, max_size=POOL_MAX_SIZE, max_lifetime=POOL_MAX_LIFETIME,
+                 ping_after=POOL_PING_AFTER, acquire_timeout=POOL_ACQUIRE_TIMEOUT):
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()    # (conn, created_at, last_used)
+        self._created_at = {}   # id(conn) -> created_at for checked out connections
+        self._size = 0
+        self._closed = False
+        self.stats = {
+            "acquired": 0,
+            "created": 0,
+            "reused": 0,
+            "recycled": 0,
+            "failed_checks": 0,
+            "discarded": 0,
+            "waits": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+        }
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()  # LIFO keeps the warmest connection in use
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No DB connection available after {self.acquire_timeout}s")
+                self.stats["waits"] += 1
+                self._cond.wait(remaining)
+
+        events = []
+        try:
+            conn, created_at = self._checkout(entry, events)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                for event in events:
+                    self.stats[event] += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            for event in events:
+                self.stats[event] += 1
+            self._created_at[id(conn)] = created_at
+            self.stats["acquired"] += 1
+            self.stats["in_use"] += 1
+            self.stats["peak_in_use"] = max(self.stats["peak_in_use"], self.stats["in_use"])
+        return conn
+
+    def _checkout(self, entry, events):
+        """Validate an idle entry (or open a new connection) outside the pool lock."""
+        now = time.monotonic()
+        if entry is not None:
+            conn, created_at, last_used = entry
+            if now - created_at > self.max_lifetime:
+                self._close_quietly(conn)
+                events.append("recycled")
+            elif now - last_used > self.ping_after and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                events.append("failed_checks")
+            else:
+                events.append("reused")
+                return conn, created_at
+
+        conn = get_connection()
+        events.append("created")
+        return conn, time.monotonic()
+
+    def release(self, conn, discard=False):
+        # Close any open read snapshot so the next user sees fresh data
+        if not discard and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                conn.rollback()
+            except pymysql.MySQLError:
+                discard = True
+
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+            self.stats["in_use"] -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self.stats["discarded"] += 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def snapshot(self):
+        with self._cond:
+            return {**self.stats, "size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the shared pool, returning it when the block exits."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    except Exception:
+        # A connection that cannot roll back is in an unknown state, so drop it
+        try:
+            conn.rollback()
+            discard = False
+        except Exception:
+            discard = True
+        pool.release(conn, discard=discard)
+        raise
+    else:
+        pool.release(conn)
+
+
+def pool_stats():
+    return get_pool().snapshot()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def index_exists(cur, table, index_name):
+    cur.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, index_name))
+    return cur.fetchone() is not None
+
+
+def ensure_index(cur, table, index_name, columns, unique=False):
+    """Create an index unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS)."""
+    if not index_exists(cur, table, index_name):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cur.execute(f"CREATE {kind} {index_name} ON {table} ({', '.join(columns)})")
+        print(f"Created index {index_name} on {table}")
+
+
 def initcardTable():
     conn = get_connection()
     cur = conn.cursor()
@@ -161,9 +375,12 @@ def initcardTable():
     """)
 
     # market_sales
+    # Range partitioned by day on sale_time (see market_storage.py). MySQL requires the
+    # partition column in every unique key and does not allow foreign keys on
+    # partitioned tables, hence the (sale_id, sale_time) key and no FK to cards.
     cur.execute("""
         CREATE TABLE IF NOT EXISTS market_sales (
-            sale_id INT AUTO_INCREMENT PRIMARY KEY,
+            sale_id INT AUTO_INCREMENT,
             card_id INT,
             platform VARCHAR(20),
             sale_type VARCHAR(10),
@@ -171,7 +388,88 @@ def initcardTable():
             listed_price INT NOT NULL,
             sold_price INT,
             was_sold TINYINT(1) AS (sold_price IS NOT NULL AND sold_price <> 0) STORED,
-            FOREIGN KEY (card_id) REFERENCES cards(card_id) ON DELETE CASCADE
+            PRIMARY KEY (sale_id, sale_time)
+        )
+        PARTITION BY RANGE (TO_DAYS(sale_time)) (
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+    """)
+    # Serves the per-card high-water-mark lookups in SaleWatermarks
+    ensure_index(cur, "market_sales", "idx_sales_card_platform_time", ["card_id", "platform", "sale_time"])
+    # Serves the deal finder's recent-window scans per platform
+    ensure_index(cur, "market_sales", "idx_sales_platform_time_card", ["platform", "sale_time", "card_id"])
+
+    # market_sales_daily: per card/platform/day aggregates of raw sales dropped by retention
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS market_sales_daily (
+            card_id INT NOT NULL,
+            platform VARCHAR(20) NOT NULL,
+            sale_date DATE NOT NULL,
+            listings INT NOT NULL,
+            sold_count INT NOT NULL,
+            avg_sold_price INT,
+            min_sold_price INT,
+            max_sold_price INT,
+            avg_listed_price INT,
+            PRIMARY KEY (card_id, platform, sale_date),
+            INDEX idx_sales_daily_platform_date (platform, sale_date)
+        )
+    """)
+
+    # card_price_summary: latest median sold price per card/platform, kept current on ingest
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS card_price_summary (
+            card_id INT NOT NULL,
+            platform VARCHAR(20) NOT NULL,
+            median_price INT,
+            sample_size INT,
+            last_sale_time DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (card_id, platform)
+        )
+    """)
+
+    # market_candles: per card/platform OHLCV candles of sold prices, maintained on ingest
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS market_candles (
+            card_id INT NOT NULL,
+            platform VARCHAR(20) NOT NULL,
+            resolution VARCHAR(4) NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            open_price INT,
+            high_price INT,
+            low_price INT,
+            close_price INT,
+            median_price INT,
+            volume BIGINT NOT NULL,
+            trades INT NOT NULL,
+            listings INT NOT NULL,
+            PRIMARY KEY (card_id, platform, resolution, bucket_start),
+            INDEX idx_candles_platform_resolution_time (platform, resolution, bucket_start)
+        )
+    """)
+    ensure_index(cur, "hrefs", "idx_hrefs_version", ["version", "card_id"])
+    # hrefs needs a unique key on href for ON DUPLICATE KEY UPDATE to dedupe,
+    # so drop older duplicate rows (keeping the lowest card_id) before adding it
+    if not index_exists(cur, "hrefs", "uq_hrefs_href"):
+        cur.execute("""
+            DELETE h1 FROM hrefs h1
+            JOIN hrefs h2 ON h1.href = h2.href AND h1.card_id > h2.card_id
+        """)
+        ensure_index(cur, "hrefs", "uq_hrefs_href", ["href"], unique=True)
+
+    # card_fetch_state: per card/platform refresh schedule used by fetch_planner
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS card_fetch_state (
+            card_id INT NOT NULL,
+            platform VARCHAR(20) NOT NULL,
+            last_sale_time DATETIME,
+            trades_per_hour DOUBLE,
+            last_fetched DATETIME,
+            content_hash CHAR(40),
+            etag VARCHAR(255),
+            last_modified VARCHAR(64),
+            PRIMARY KEY (card_id, platform)
         )
     """)
 
@@ -204,126 +502,477 @@ def initcardTable():
 
 
 
-def insert_sale_db(card_id, sale_data):
-    conn = get_connection()
-    try:
+ADELAIDE = pytz.timezone("Australia/Adelaide")
+
+def _as_adelaide(sale_time):
+    # Convert string to datetime if needed
+    if isinstance(sale_time, str):
+        sale_time = parser.isoparse(sale_time)
+
+    # Localize naive datetimes
+    if sale_time.tzinfo is None:
+        sale_time = ADELAIDE.localize(sale_time)
+    return sale_time
+
+
+class SaleWatermarks:
+    """
+    In-memory high-water mark of the latest stored sale_time per (card_id, platform).
+    Loaded with one grouped query at the start of a run and advanced after each
+    committed insert, so duplicate suppression never has to query market_sales.
+    """
+
+    def __init__(self):
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        latest = {}
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                # Resolved from idx_sales_card_platform_time without touching table rows
+                cur.execute("""
+                    SELECT card_id, platform, MAX(sale_time) AS max_time
+                    FROM market_sales
+                    GROUP BY card_id, platform
+                """)
+                for row in cur.fetchall():
+                    if row['max_time']:
+                        latest[(row['card_id'], row['platform'].lower())] = _as_adelaide(row['max_time'])
+
+        with self._lock:
+            self._latest = latest
+            self.loaded = True
+        print(f"Loaded sale watermarks for {len(latest)} card/platform pairs")
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with _watermark_load_lock:
+                if not self.loaded:
+                    self.load()
+
+    def get(self, card_id, platform):
+        return self._latest.get((card_id, platform))
+
+    def advance(self, card_id, platform, sale_time):
+        key = (card_id, platform)
+        with self._lock:
+            current = self._latest.get(key)
+            if current is None or sale_time > current:
+                self._latest[key] = sale_time
+
+    def __len__(self):
+        return len(self._latest)
+
+
+_watermark_load_lock = threading.Lock()
+sale_watermarks = SaleWatermarks()
+
+def load_sale_watermarks():
+    sale_watermarks.load()
+
+
+# Number of most recent sold trades the price summary median is taken over
+SUMMARY_SALES = 10
+
+PRICE_SUMMARY_UPSERT_SQL = """
+    INSERT INTO card_price_summary (card_id, platform, median_price, sample_size, last_sale_time, updated_at)
+    VALUES (%s, %s, %s, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE
+        median_price=VALUES(median_price),
+        sample_size=VALUES(sample_size),
+        last_sale_time=VALUES(last_sale_time),
+        updated_at=VALUES(updated_at)
+"""
+
+
+def _median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return round((ordered[mid - 1] + ordered[mid]) / 2)
+
+
+def _price_summary_rows(card_id, sales):
+    """sales: (platform, sale_time, sold_price) tuples; returns one summary row per platform with a sold trade."""
+    by_platform = {}
+    for platform, sale_time, sold_price in sales:
+        if sold_price and sold_price > 0:
+            by_platform.setdefault(platform, []).append((sale_time, sold_price))
+
+    rows = []
+    for platform, trades in by_platform.items():
+        latest = sorted(trades, reverse=True)[:SUMMARY_SALES]
+        rows.append((card_id, platform, _median([p for _, p in latest]), len(latest), latest[0][0]))
+    return rows
+
+
+def _refresh_price_summary(cur, card_id, platforms):
+    """Recompute the summary of card_id on platforms from its latest SUMMARY_SALES stored trades."""
+    cur.execute(f"""
+        SELECT platform, sale_time, sold_price
+        FROM (
+            SELECT platform, sale_time, sold_price,
+                   ROW_NUMBER() OVER (PARTITION BY platform ORDER BY sale_time DESC, sale_id DESC) AS rn
+            FROM market_sales
+            WHERE card_id = %s AND platform IN ({', '.join(['%s'] * len(platforms))}) AND sold_price > 0
+        ) latest
+        WHERE rn <= %s
+    """, (card_id, *platforms, SUMMARY_SALES))
+    rows = _price_summary_rows(card_id, [
+        (row['platform'].lower(), row['sale_time'], row['sold_price']) for row in cur.fetchall()
+    ])
+    if rows:
+        cur.executemany(PRICE_SUMMARY_UPSERT_SQL, rows)
+
+
+def rebuild_price_summary():
+    """Backfill card_price_summary from market_sales (one-off, e.g. when the table is first created)."""
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            # Get current max sale_time per platform
-            cur.execute(
-                "SELECT platform, MAX(sale_time) as max_time FROM market_sales WHERE card_id = %s GROUP BY platform",
-                (card_id,)
-            )
-            adelaide = pytz.timezone("Australia/Adelaide")
-            max_times = {}
+            cur.execute("""
+                SELECT card_id, platform, sale_time, sold_price
+                FROM (
+                    SELECT card_id, platform, sale_time, sold_price,
+                           ROW_NUMBER() OVER (PARTITION BY card_id, platform ORDER BY sale_time DESC, sale_id DESC) AS rn
+                    FROM market_sales
+                    WHERE sold_price > 0
+                ) latest
+                WHERE rn <= %s
+            """, (SUMMARY_SALES,))
+            by_card = {}
             for row in cur.fetchall():
-                if row['max_time']:
-                    # ensure max_time is timezone aware
-                    if row['max_time'].tzinfo is None:
-                        max_times[row['platform'].lower()] = adelaide.localize(row['max_time'])
-                    else:
-                        max_times[row['platform'].lower()] = row['max_time']
-
-            values = []
-            for point in sale_data:
-                platform = point['platform'].lower()
-                sale_time = point['sale_time']
-
-                # Convert string to datetime if needed
-                if isinstance(sale_time, str):
-                    sale_time = parser.isoparse(sale_time)
-
-                # Localize naive datetimes
-                if sale_time.tzinfo is None:
-                    sale_time = adelaide.localize(sale_time)
-
-                # Skip older/duplicate entries
-                if platform in max_times and sale_time <= max_times[platform]:
-                    continue
-
-                values.append((
-                    card_id,
-                    platform,
-                    point['listed_price'],
-                    point['sale_type'],
-                    sale_time,
-                    point['sold_price']
-                ))
-
-            if values:
-                sql = """
-                INSERT INTO market_sales (card_id, platform, listed_price, sale_type, sale_time, sold_price)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                cur.executemany(sql, values)
+                by_card.setdefault(row['card_id'], []).append(
+                    (row['platform'].lower(), row['sale_time'], row['sold_price'])
+                )
 
+            rows = []
+            for card_id, sales in by_card.items():
+                rows.extend(_price_summary_rows(card_id, sales))
+            if rows:
+                cur.executemany(PRICE_SUMMARY_UPSERT_SQL, rows)
         conn.commit()
+    print(f"Rebuilt price summary for {len(rows)} card/platform pairs")
+
+
+def ensure_price_summary():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM card_price_summary LIMIT 1")
+            populated = cur.fetchone() is not None
+    if not populated:
+        rebuild_price_summary()
+
+
+# Candle widths in minutes. Buckets are aligned to Adelaide wall-clock time, like sale_time itself.
+CANDLE_RESOLUTIONS = {"15m": 15, "1h": 60, "1d": 1440}
+# Candle rows rebuild_candles writes per transaction
+CANDLE_WRITE_BATCH = 1000
+
+CANDLE_UPSERT_SQL = """
+    INSERT INTO market_candles (
+        card_id, platform, resolution, bucket_start, open_price, high_price,
+        low_price, close_price, median_price, volume, trades, listings
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        open_price=VALUES(open_price),
+        high_price=VALUES(high_price),
+        low_price=VALUES(low_price),
+        close_price=VALUES(close_price),
+        median_price=VALUES(median_price),
+        volume=VALUES(volume),
+        trades=VALUES(trades),
+        listings=VALUES(listings)
+"""
+
+
+def bucket_start(sale_time, resolution):
+    minutes = CANDLE_RESOLUTIONS[resolution]
+    midnight = sale_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = (sale_time.hour * 60 + sale_time.minute) // minutes * minutes
+    return midnight + datetime.timedelta(minutes=offset)
+
+
+def _candle_rows(card_id, platform, sales, since=None):
+    """
+    sales: (sale_time, sold_price) tuples in time order, sold_price falsy for unsold
+    listings. Returns one upsert row per resolution and bucket, skipping buckets
+    that end before `since` so callers only rewrite the candles they touched.
+    """
+    buckets = {}
+    for sale_time, sold_price in sales:
+        for resolution in CANDLE_RESOLUTIONS:
+            start = bucket_start(sale_time, resolution)
+            if since is not None and start < bucket_start(since, resolution):
+                continue
+            buckets.setdefault((resolution, start), []).append(sold_price)
+
+    rows = []
+    for (resolution, start), prices in buckets.items():
+        sold = [p for p in prices if p and p > 0]
+        rows.append((
+            card_id, platform, resolution, start,
+            sold[0] if sold else None,
+            max(sold) if sold else None,
+            min(sold) if sold else None,
+            sold[-1] if sold else None,
+            _median(sold) if sold else None,
+            sum(sold),
+            len(sold),
+            len(prices),
+        ))
+    return rows
+
+
+def _refresh_candles(cur, card_id, earliest):
+    """
+    Recompute every candle touched by sales at or after earliest[platform].
+    The touched day is re-read from market_sales inside the caller's transaction,
+    which keeps medians exact; it is a short range scan on idx_sales_card_platform_time.
+    """
+    rows = []
+    for platform, since in earliest.items():
+        cur.execute("""
+            SELECT sale_time, sold_price FROM market_sales
+            WHERE card_id = %s AND platform = %s AND sale_time >= %s
+            ORDER BY sale_time, sale_id
+        """, (card_id, platform, bucket_start(since, "1d")))
+        sales = [(row['sale_time'], row['sold_price']) for row in cur.fetchall()]
+        rows.extend(_candle_rows(card_id, platform, sales, since))
+    if rows:
+        cur.executemany(CANDLE_UPSERT_SQL, rows)
+
+
+def rebuild_candles():
+    """Backfill market_candles from all of market_sales (one-off, e.g. when the table is first created)."""
+    conn = get_connection()
+    total = 0
+    rows = []
+
+    def flush(write_conn, write_cur):
+        nonlocal total, rows
+        if rows:
+            write_cur.executemany(CANDLE_UPSERT_SQL, rows)
+            write_conn.commit()
+            total += len(rows)
+            rows = []
+
+    try:
+        # The unbuffered read cursor keeps its connection busy until it is exhausted,
+        # so candles are written in chunks over a second connection as they are built
+        with pooled_connection() as write_conn, write_conn.cursor() as write_cur:
+            # Unbuffered cursor so the full sales history is streamed rather than held in memory
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+                cur.execute("""
+                    SELECT card_id, platform, sale_time, sold_price FROM market_sales
+                    ORDER BY card_id, platform, sale_time, sale_id
+                """)
+                key, sales = None, []
+                for row in cur:
+                    row_key = (row['card_id'], row['platform'].lower())
+                    if row_key != key:
+                        if sales:
+                            rows.extend(_candle_rows(key[0], key[1], sales))
+                            if len(rows) >= CANDLE_WRITE_BATCH:
+                                flush(write_conn, write_cur)
+                        key, sales = row_key, []
+                    sales.append((row['sale_time'], row['sold_price']))
+                if sales:
+                    rows.extend(_candle_rows(key[0], key[1], sales))
+            flush(write_conn, write_cur)
     finally:
         conn.close()
+    print(f"Rebuilt {total} candles")
+
+
+def ensure_candles():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM market_candles LIMIT 1")
+            populated = cur.fetchone() is not None
+    if not populated:
+        rebuild_candles()
+
+
+def insert_sale_db(card_id, sale_data):
+    sale_watermarks.ensure_loaded()
+
+    values = []
+    newest = {}
+    for point in sale_data:
+        platform = point['platform'].lower()
+        sale_time = _as_adelaide(point['sale_time'])
+
+        # Skip older/duplicate entries
+        max_time = sale_watermarks.get(card_id, platform)
+        if max_time is not None and sale_time <= max_time:
+            continue
+
+        if platform not in newest or sale_time > newest[platform]:
+            newest[platform] = sale_time
+
+        values.append((
+            card_id,
+            platform,
+            point['listed_price'],
+            point['sale_type'],
+            sale_time,
+            point['sold_price']
+        ))
+
+    if not values:
+        return
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            sql = """
+            INSERT INTO market_sales (card_id, platform, listed_price, sale_type, sale_time, sold_price)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """
+            cur.executemany(sql, values)
+
+            # Keep the per-card price summary current in the same transaction. The new rows
+            # may be just one or two trades, so the median is re-taken over the stored latest ones
+            _refresh_price_summary(cur, card_id, sorted(newest))
+
+            # ...and the 15m/1h/1d candles the new sales fall into
+            _refresh_candles(cur, card_id, {
+                platform: min(v[4] for v in values if v[1] == platform).replace(tzinfo=None)
+                for platform in newest
+            })
+
+        conn.commit()
+
+    # Only move the watermark once the rows are durable
+    for platform, sale_time in newest.items():
+        sale_watermarks.advance(card_id, platform, sale_time)
+
+    # Let listeners (e.g. the deal daemon) react to the card that just traded
+    publish_sales(card_id, newest.keys(), len(values))
 
 
 async def async_insert_sale_db(card_id, sale_data):
     await asyncio.to_thread(insert_sale_db, card_id, sale_data)
 
 
+def card_exists(card_id):
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM cards WHERE card_id=%s LIMIT 1", (card_id,))
+            return cur.fetchone() is not None
+
+
+CARD_UPSERT_SQL = """
+    INSERT INTO cards (
+        card_id, name, game, version, nationality, league, club, position,
+        rating, weak_foot, skill_move, height, accelerate
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        name=VALUES(name),
+        game=VALUES(game),
+        version=VALUES(version),
+        nationality=VALUES(nationality),
+        league=VALUES(league),
+        club=VALUES(club),
+        position=VALUES(position),
+        rating=VALUES(rating),
+        weak_foot=VALUES(weak_foot),
+        skill_move=VALUES(skill_move),
+        height=VALUES(height),
+        accelerate=VALUES(accelerate);
+"""
+
+PLAYSTYLE_UPSERT_SQL = """
+    INSERT INTO card_playstyles (card_id, playstyle, plus)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE plus=VALUES(plus);
+"""
+
+# MySQL ON DUPLICATE KEY requires a UNIQUE constraint
+# Assuming (card_id, position, role) is UNIQUE
+ROLE_UPSERT_SQL = """
+    INSERT INTO card_roles (card_id, position, role, plus)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE plus = VALUES(plus)
+"""
+
+STATS_TABLE_MAPPING = {
+    "card_pace_stats": "pace",
+    "card_shooting_stats": "shooting",
+    "card_passing_stats": "passing",
+    "card_dribbling_stats": "dribbling",
+    "card_defending_stats": "defending",
+    "card_physical_stats": "physical"
+}
+
+
+def _card_row(card_id, card_details, game_num):
+    return (
+        card_id,
+        card_details.get("name"),
+        game_num,
+        card_details.get("version"),
+        card_details.get("nation"),
+        card_details.get("league"),
+        card_details.get("club"),
+        card_details.get("position"),
+        card_details.get("rating"),
+        card_details.get("weakfoot"),
+        card_details.get("skills"),
+        card_details.get("height"),
+        card_details.get("accelerate")
+    )
+
+
+def _playstyle_rows(card_id, playstyles_list):
+    return [(card_id, ps.get("playstyle"), ps.get("plus")) for ps in playstyles_list or []]
+
+
+def _role_rows(card_id, roles):
+    return [(card_id, r.get("position"), r.get("role"), r.get("plus")) for r in roles or []]
+
+
+def _stats_sql(table, columns):
+    # Build MySQL INSERT ... ON DUPLICATE KEY UPDATE dynamically
+    all_columns = ["card_id"] + list(columns)
+    placeholders = ", ".join(["%s"] * len(all_columns))
+    update_clause = ", ".join([f"{col}=VALUES({col})" for col in columns])
+
+    return f"""
+        INSERT INTO {table} ({', '.join(all_columns)})
+        VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE {update_clause}
+    """
+
+
+def _group_stats_rows(card_id, stats_list, grouped):
+    """Add one card's stats to grouped, keyed by (table, columns) so each group shares one statement."""
+    for table, category in STATS_TABLE_MAPPING.items():
+        substats = (stats_list or {}).get(category, {})
+        if not substats:
+            continue
+        columns = tuple(substats.keys())
+        grouped.setdefault((table, columns), []).append([card_id] + list(substats.values()))
+
+
 def insert_card(card_id, card_details, game_num):
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO cards (
-                    card_id, name, game, version, nationality, league, club, position,
-                    rating, weak_foot, skill_move, height, accelerate
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    name=VALUES(name),
-                    game=VALUES(game),
-                    version=VALUES(version),
-                    nationality=VALUES(nationality),
-                    league=VALUES(league),
-                    club=VALUES(club),
-                    position=VALUES(position),
-                    rating=VALUES(rating),
-                    weak_foot=VALUES(weak_foot),
-                    skill_move=VALUES(skill_move),
-                    height=VALUES(height),
-                    accelerate=VALUES(accelerate);
-            """, (
-                card_id,
-                card_details.get("name"),
-                game_num,
-                card_details.get("version"),
-                card_details.get("nation"),
-                card_details.get("league"),
-                card_details.get("club"),
-                card_details.get("position"),
-                card_details.get("rating"),
-                card_details.get("weakfoot"),
-                card_details.get("skills"),
-                card_details.get("height"),
-                card_details.get("accelerate")
-            ))
+            cur.execute(CARD_UPSERT_SQL, _card_row(card_id, card_details, game_num))
         conn.commit()
-    finally:
-        conn.close()
 
 
 def insert_card_playstyles(card_id, playstyles_list):
-    conn = get_connection()
-    try:
+    rows = _playstyle_rows(card_id, playstyles_list)
+    if not rows:
+        return
+
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            for ps in playstyles_list:
-                cur.execute("""
-                    INSERT INTO card_playstyles (card_id, playstyle, plus)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE plus=VALUES(plus);
-                """, (
-                    card_id,
-                    ps.get("playstyle"),
-                    ps.get("plus")
-                ))
+            cur.executemany(PLAYSTYLE_UPSERT_SQL, rows)
         conn.commit()
-    finally:
-        conn.close()
 
 
 def insert_card_roles(card_id, roles):
@@ -331,28 +980,14 @@ def insert_card_roles(card_id, roles):
     Insert or update card roles.
     roles: list of dicts with keys: position, role, plus
     """
-    if not roles:
+    rows = _role_rows(card_id, roles)
+    if not rows:
         return
 
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            for r in roles:
-                # MySQL ON DUPLICATE KEY requires a UNIQUE constraint
-                # Assuming (card_id, position, role) is UNIQUE
-                cur.execute("""
-                    INSERT INTO card_roles (card_id, position, role, plus)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE plus = VALUES(plus)
-                """, (
-                    card_id,
-                    r.get("position"),
-                    r.get("role"),
-                    r.get("plus")
-                ))
+            cur.executemany(ROLE_UPSERT_SQL, rows)
         conn.commit()
-    finally:
-        conn.close()
 
 
 def insert_card_stats(card_id, stats_list):
@@ -363,42 +998,136 @@ def insert_card_stats(card_id, stats_list):
     if not stats_list:
         return
 
-    conn = get_connection()
-    try:
+    grouped = {}
+    _group_stats_rows(card_id, stats_list, grouped)
+
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            stats_table_mapping = {
-                "card_pace_stats": "pace",
-                "card_shooting_stats": "shooting",
-                "card_passing_stats": "passing",
-                "card_dribbling_stats": "dribbling",
-                "card_defending_stats": "defending",
-                "card_physical_stats": "physical"
-            }
-
-            for table, category in stats_table_mapping.items():
-                substats = stats_list.get(category, {})
-                if not substats:
-                    continue
-
-                columns = list(substats.keys())
-                values = list(substats.values())
-
-                # Build MySQL INSERT ... ON DUPLICATE KEY UPDATE dynamically
-                all_columns = ["card_id"] + columns
-                placeholders = ", ".join(["%s"] * len(all_columns))
-                update_clause = ", ".join([f"{col}=VALUES({col})" for col in columns])
-
-                sql = f"""
-                    INSERT INTO {table} ({', '.join(all_columns)})
-                    VALUES ({placeholders})
-                    ON DUPLICATE KEY UPDATE {update_clause}
-                """
-
-                cur.execute(sql, [card_id] + values)
+            for (table, columns), rows in grouped.items():
+                cur.execute(_stats_sql(table, columns), rows[0])
+        conn.commit()
+
 
+def insert_card_metadata_batch(metadata_list, game_num):
+    """
+    Write many scraped players in a single transaction.
+    metadata_list: dicts shaped like scrape_futbin_player output (id, details, stats, roles, playstyles)
+    Every table gets one executemany, which pymysql sends as multi-row INSERTs.
+    """
+    if not metadata_list:
+        return
+
+    card_rows = []
+    stats_rows = {}
+    role_rows = []
+    playstyle_rows = []
+
+    for metadata in metadata_list:
+        card_id = metadata["id"]
+        card_rows.append(_card_row(card_id, metadata["details"], game_num))
+        _group_stats_rows(card_id, metadata.get("stats"), stats_rows)
+        role_rows.extend(_role_rows(card_id, metadata.get("roles")))
+        playstyle_rows.extend(_playstyle_rows(card_id, metadata.get("playstyles")))
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # cards first so the child rows satisfy their foreign keys
+            cur.executemany(CARD_UPSERT_SQL, card_rows)
+            for (table, columns), rows in stats_rows.items():
+                cur.executemany(_stats_sql(table, columns), rows)
+            if role_rows:
+                cur.executemany(ROLE_UPSERT_SQL, role_rows)
+            if playstyle_rows:
+                cur.executemany(PLAYSTYLE_UPSERT_SQL, playstyle_rows)
         conn.commit()
-    finally:
-        conn.close()
+
+
+class CardMetadataBatcher:
+    """
+    Collects metadata from concurrent scraper tasks and writes it with
+    insert_card_metadata_batch once batch_size cards are queued or max_delay
+    seconds have passed. add() returns a future that resolves after the
+    card's batch has been committed; work that has to wait for that commit
+    can be handed to after_commit() so the caller does not block on it.
+    """
+
+    def __init__(self, game_num, batch_size=50, max_delay=1.0):
+        self.game_num = game_num
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+        self._followups = set()
+
+    def add(self, metadata):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((metadata, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._schedule_flush)
+        return future
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _schedule_flush(self):
+        task = asyncio.ensure_future(self._write(self._take_batch()))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def after_commit(self, written, coro):
+        """Run coro once the future add() returned resolves, in the background; close() waits for it."""
+        async def follow():
+            try:
+                await written
+            except BaseException:
+                coro.close()  # the batch failed, so coro never runs
+                raise
+            await coro
+
+        task = asyncio.ensure_future(follow())
+        self._followups.add(task)
+        task.add_done_callback(self._followup_done)
+        return task
+
+    def _followup_done(self, task):
+        self._followups.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Failed to store data after metadata commit: {task.exception()}")
+
+    async def flush(self):
+        await self._write(self._take_batch())
+
+    async def _write(self, batch):
+        if not batch:
+            return
+
+        try:
+            await asyncio.to_thread(insert_card_metadata_batch, [m for m, _ in batch], self.game_num)
+        except Exception as e:
+            print(f"Failed to write metadata batch of {len(batch)} cards: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        if self._followups:
+            await asyncio.gather(*self._followups, return_exceptions=True)
 
 
 
@@ -0,0 +1,361 @@
+"""
+Resident deal finder.
+
+Instead of re-reading hours of market_sales every run, the daemon keeps a
+rolling window of recent sold prices per (card, platform) in memory, pulls
+only rows above its sale_id watermark every poll, and re-evaluates the dip
+and icon fluctuation rules for the cards that just traded. The scraper pushes
+an event over a Unix socket after each committed insert (see sale_events.py),
+which re-reads just that card's new rows straight away; the timed full poll
+only catches up on events that were dropped:
+
+    python deal_daemon.py [--poll 30] [--socket /tmp/fifa_sale_events.sock]
+
+The rules themselves are the ones in strategies.py, fed with features read
+straight off the windows, so alerts match what deal_finder would compute.
+"""
+import argparse
+import asyncio
+import bisect
+import datetime
+import time
+import pandas as pd
+import sale_events
+from db_utils import pooled_connection, ADELAIDE
+from strategies import (
+    drop_candidates_from_features, fluctuation_candidates_from_features,
+    DROP_FEATURE_COLUMNS, FLUCTUATION_FEATURE_COLUMNS,
+    SHORT_HOURS, LONG_HOURS, SHORT_TRADES, LONG_TRADES, FLUCTUATION_LATEST_TRADES, FLUCTUATION_MIN_SALES,
+    ICON_VERSION, ICON_HOURS, MIN_DROP_PRICE,
+)
+
+PLATFORMS = ["pc", "ps"]
+WINDOW_HOURS = max(LONG_HOURS, ICON_HOURS)
+MAX_WINDOW_SALES = 5000     # per card/platform, oldest sales go first
+POLL_SECONDS = 30
+EVENT_COALESCE_SECONDS = 0.2
+# Rows with sale_ids just below the watermark can commit after it has moved
+# past them, so each poll re-reads this many ids and skips the ones already seen
+SALE_ID_LAG = 1000
+
+
+def _now():
+    # sale_time is stored as naive Adelaide wall time
+    return datetime.datetime.now(ADELAIDE).replace(tzinfo=None)
+
+
+class SaleWindow:
+    """
+    Time-ordered sold prices for one card/platform with prefix sums, so the
+    mean of the last N trades after any time cutoff is O(log n). Old entries
+    are dropped by advancing a start offset and compacting occasionally.
+    """
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.times = []
+        self.prices = []
+        self.cum = [0]
+        self.start = 0
+
+    def add(self, sale_time, price):
+        if self.times and sale_time < self.times[-1]:
+            # Late row: keep time order and rebuild the prefix sums
+            i = bisect.bisect_right(self.times, sale_time, self.start)
+            self.times.insert(i, sale_time)
+            self.prices.insert(i, price)
+            self.cum = [0]
+            for p in self.prices:
+                self.cum.append(self.cum[-1] + p)
+        else:
+            self.times.append(sale_time)
+            self.prices.append(price)
+            self.cum.append(self.cum[-1] + price)
+
+    def expire(self, cutoff):
+        self.start = max(self.start, bisect.bisect_left(self.times, cutoff, self.start))
+        self.start = max(self.start, len(self.times) - MAX_WINDOW_SALES)
+        if self.start > 1024 and self.start * 2 > len(self.times):
+            base = self.cum[self.start]
+            self.times = self.times[self.start:]
+            self.prices = self.prices[self.start:]
+            self.cum = [c - base for c in self.cum[self.start:]]
+            self.start = 0
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+    def index_after(self, cutoff, inclusive=True):
+        search = bisect.bisect_left if inclusive else bisect.bisect_right
+        return search(self.times, cutoff, self.start)
+
+    def last_sum(self, since, n):
+        """(sum, count) of the last n prices at or after index since."""
+        end = len(self.times)
+        taken = min(n, end - since)
+        return self.cum[end] - self.cum[end - taken], taken
+
+
+class DealDaemon:
+
+    def __init__(self, notify=None):
+        self.windows = {}           # (card_id, platform) -> SaleWindow
+        self.latest = {}            # platform -> newest gold sale_time seen, the drop rule's reference point
+        self.watermark = 0
+        self._seen = set()
+        self._active = set()        # (rule, platform, card_id) currently qualifying
+        # notify(message, key=None, price=None), e.g. AlertDispatcher.submit
+        self.notify = notify or (lambda message, **kwargs: print(message))
+        self._loop = None
+        self._wake = None
+        self._event_cards = set()    # card_ids from sale events since the last refresh, None for "unknown"
+        self.stats = {"polls": 0, "events": 0, "rows": 0, "evaluations": 0, "alerts": 0, "eval_ms": 0.0}
+
+    # ------------------- INGEST -------------------
+
+    def poll(self, card_ids=None):
+        """
+        Load sales committed since the last poll; returns the (card_id, platform) keys that changed.
+        With card_ids only those cards are read, and the watermark stays put so the
+        next full poll still picks up every other card's rows.
+        """
+        since = _now() - datetime.timedelta(hours=WINDOW_HOURS)
+        card_filter = ""
+        params = [max(self.watermark - SALE_ID_LAG, 0), since, *PLATFORMS]
+        if card_ids:
+            card_filter = f"AND ms.card_id IN ({', '.join(['%s'] * len(card_ids))})"
+            params.extend(sorted(card_ids))
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT ms.sale_id, ms.card_id, ms.platform, ms.sale_time, ms.sold_price, c.name, c.version
+                    FROM market_sales ms
+                    JOIN cards c ON ms.card_id = c.card_id
+                    WHERE ms.sale_id > %s
+                      AND ms.sale_time >= %s
+                      AND ms.sold_price > 0
+                      AND ms.platform IN ({', '.join(['%s'] * len(PLATFORMS))})
+                      {card_filter}
+                    ORDER BY ms.sale_id
+                """, params)
+                rows = cur.fetchall()
+            conn.commit()  # end the read snapshot so the next poll sees new commits
+        self.stats["polls"] += 1
+        return self.ingest(rows, advance=not card_ids)
+
+    def ingest(self, rows, advance=True):
+        """advance=False keeps the watermark, for rows read for only some cards."""
+        changed = set()
+        for row in rows:
+            if advance:
+                self.watermark = max(self.watermark, row["sale_id"])
+            if row["sale_id"] in self._seen:
+                continue
+            self._seen.add(row["sale_id"])
+
+            platform = row["platform"].lower()
+            is_icon = row["version"] == ICON_VERSION
+            if not is_icon and row["sold_price"] <= MIN_DROP_PRICE:
+                continue
+
+            key = (row["card_id"], platform)
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = SaleWindow(row["name"], row["version"])
+            window.add(row["sale_time"], row["sold_price"])
+            if not is_icon and (platform not in self.latest or row["sale_time"] > self.latest[platform]):
+                self.latest[platform] = row["sale_time"]
+            changed.add(key)
+
+        floor = self.watermark - SALE_ID_LAG
+        if len(self._seen) > 4 * SALE_ID_LAG:
+            self._seen = {sale_id for sale_id in self._seen if sale_id > floor}
+        self.stats["rows"] += len(rows)
+        return changed
+
+    def expire(self):
+        cutoff = _now() - datetime.timedelta(hours=WINDOW_HOURS)
+        for key in list(self.windows):
+            window = self.windows[key]
+            window.expire(cutoff)
+            if not len(window):
+                del self.windows[key]
+
+    # ------------------- RULES -------------------
+
+    def drop_features(self, keys, platform, now):
+        """strategies.drop_features, read off the windows for the given cards."""
+        latest = self.latest.get(platform)
+        if latest is None:
+            return pd.DataFrame(columns=DROP_FEATURE_COLUMNS)
+        cutoff_long = now - datetime.timedelta(hours=LONG_HOURS)
+        cutoff_short = latest - datetime.timedelta(hours=SHORT_HOURS)
+
+        rows = []
+        for card_id, plat in sorted(keys):
+            window = self.windows.get((card_id, plat))
+            if plat != platform or window is None or window.version == ICON_VERSION:
+                continue
+            long_start = window.index_after(cutoff_long)
+            short_start = max(long_start, window.index_after(cutoff_short, inclusive=False))
+            volume = len(window.times) - long_start
+            if not volume:
+                continue
+            short_sum, short_taken = window.last_sum(short_start, SHORT_TRADES)
+            long_sum, long_taken = window.last_sum(long_start, LONG_TRADES)
+            rows.append((card_id, window.name, window.version, len(window.times) - short_start,
+                         short_sum, short_taken, long_sum, long_taken, volume))
+        return pd.DataFrame(rows, columns=DROP_FEATURE_COLUMNS)
+
+    def fluctuation_features(self, keys, now):
+        """strategies.fluctuation_features, read off the windows for the given icons."""
+        cutoff = now - datetime.timedelta(hours=ICON_HOURS)
+        rows = []
+        for card_id, platform in sorted(keys, key=lambda k: (k[1], k[0])):
+            window = self.windows.get((card_id, platform))
+            if window is None or window.version != ICON_VERSION:
+                continue
+            start = window.index_after(cutoff)
+            volume = len(window.times) - start
+            if volume < FLUCTUATION_MIN_SALES:
+                continue
+            prices = window.prices[start:]
+            latest = sorted(prices[-FLUCTUATION_LATEST_TRADES:])
+            mid = len(latest) // 2
+            median = latest[mid] if len(latest) % 2 else (latest[mid - 1] + latest[mid]) / 2
+            rows.append((platform, card_id, window.name, float(median),
+                         window.cum[-1] - window.cum[start], min(prices), max(prices), volume))
+        return pd.DataFrame(rows, columns=FLUCTUATION_FEATURE_COLUMNS)
+
+    def evaluate(self, keys):
+        """Run both rules over the changed cards and alert on the ones that newly qualify."""
+        started = time.perf_counter()
+        now = _now()
+        alerts = []
+        for platform in PLATFORMS:
+            features = self.drop_features(keys, platform, now)
+            alerts.extend(self._transitions("drop", platform, keys, features, drop_candidates_from_features(features)))
+        features = self.fluctuation_features(keys, now)
+        fluctuation_df = fluctuation_candidates_from_features(features)
+        for platform in PLATFORMS:
+            alerts.extend(self._transitions(
+                "fluctuation", platform, keys, features, fluctuation_df[fluctuation_df["platform"] == platform]))
+
+        self.stats["evaluations"] += 1
+        self.stats["eval_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        for rule, platform, row in alerts:
+            self._send(rule, platform, row)
+        return alerts
+
+    def _transitions(self, rule, platform, keys, features, candidates):
+        """Candidate rows for cards that did not qualify at their previous evaluation."""
+        # Candidate frames keep the index of the feature row they were scored from
+        qualifying = {features.at[i, "card_id"]: row for i, row in candidates.iterrows()}
+
+        alerts = []
+        for card_id, plat in keys:
+            if plat != platform:
+                continue
+            state = (rule, platform, card_id)
+            if card_id in qualifying:
+                if state not in self._active:
+                    self._active.add(state)
+                    alerts.append((rule, platform, qualifying[card_id]))
+            else:
+                self._active.discard(state)
+        return alerts
+
+    def _send(self, rule, platform, row):
+        # Imported here so the daemon only needs Discord settings once it actually alerts
+        from deal_finder import format_drop_alert, format_fluctuation_alert, drop_alert_key, fluctuation_alert_key
+        if rule == "drop":
+            self.notify(format_drop_alert(platform, row), **drop_alert_key(platform, row))
+        else:
+            self.notify(format_fluctuation_alert(platform, row), **fluctuation_alert_key(platform, row))
+        self.stats["alerts"] += 1
+
+    # ------------------- LOOP -------------------
+
+    def on_sale_event(self, event):
+        """sale_events callback; safe to call from any thread, e.g. insert_sale_db's."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._queue_event, event.get("card_id"))
+
+    def _queue_event(self, card_id):
+        self.stats["events"] += 1
+        self._event_cards.add(card_id)
+        self._wake.set()
+
+    def _take_event_cards(self):
+        """Cards to refresh after a wake-up, or None for a full poll (timer, or an event without a card)."""
+        cards, self._event_cards = self._event_cards, set()
+        if not cards or None in cards:
+            return None
+        return cards
+
+    def _evaluate_quietly(self, changed):
+        # Seed the active set so start-up doesn't alert on every card already in a dip
+        notify, self.notify = self.notify, lambda message, **kwargs: None
+        self.evaluate(changed)
+        self.notify = notify
+        self.stats["alerts"] = 0
+
+    async def serve(self, poll_seconds=POLL_SECONDS, socket_path=None):
+        """
+        Poll market_sales every poll_seconds, and immediately whenever a sale
+        event arrives (in-process via on_sale_event or over socket_path).
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._evaluate_quietly(await asyncio.to_thread(self.poll))
+        print(f"Loaded {self.stats['rows']} recent sales into {len(self.windows)} windows")
+
+        last_full = time.monotonic()
+        transport = None
+        if socket_path:
+            transport = await sale_events.listen(self.on_sale_event, socket_path)
+            print(f"Listening for sale events on {socket_path}")
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), poll_seconds)
+                    # A scraper burst sends one event per card, so gather them into one poll
+                    await asyncio.sleep(EVENT_COALESCE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+                self.expire()
+                # Events name the cards that traded, so only those are re-read. A full poll
+                # still runs every poll_seconds, even while events keep arriving
+                cards = self._take_event_cards()
+                if time.monotonic() - last_full >= poll_seconds:
+                    cards = None
+                if cards is None:
+                    last_full = time.monotonic()
+                changed = await asyncio.to_thread(self.poll, cards)
+                if changed:
+                    self.evaluate(changed)
+                    print(f"{len(changed)} card/platforms updated, evaluated in {self.stats['eval_ms']} ms")
+        finally:
+            if transport is not None:
+                transport.close()
+
+    def run(self, poll_seconds=POLL_SECONDS, socket_path=None):
+        asyncio.run(self.serve(poll_seconds, socket_path))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--poll", type=int, default=POLL_SECONDS, help="seconds between fallback market_sales polls")
+    ap.add_argument("--socket", default=sale_events.SALE_EVENTS_SOCKET, help="Unix socket the scraper publishes sale events to")
+    ap.add_argument("--no-socket", action="store_true", help="poll only")
+    args = ap.parse_args()
+
+    from deal_finder import alerts
+    alerts.start()
+    try:
+        DealDaemon(notify=alerts.submit).run(args.poll, None if args.no_socket else args.socket)
+    finally:
+        alerts.close(timeout=30)
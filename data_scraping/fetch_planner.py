@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import threading
+from db_utils import pooled_connection, ADELAIDE
+
+# Scheduling policy, in hours
+MIN_INTERVAL_HOURS = 0.75   # never refetch within the same hourly run window
+MAX_INTERVAL_HOURS = 48     # even dead cards are checked every couple of days
+TARGET_NEW_SALES = 5        # refetch once this many new sales are expected
+RATE_SMOOTHING = 0.3        # EWMA weight given to the newest trade-rate observation
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def content_hash(body):
+    """Hash of the sales table only, so per-request page chrome doesn't look like a change."""
+    start = body.find(b"<tbody")
+    end = body.find(b"</tbody>", start)
+    if start != -1 and end != -1:
+        body = body[start:end]
+    return hashlib.sha1(body).hexdigest()
+
+
+def observed_trade_rate(sales):
+    """Trades per hour implied by the span of sale times on one sales page."""
+    times = [s["sale_time"] for s in sales if s.get("sale_time")]
+    if len(times) < 2:
+        return 0.0
+    span_hours = (max(times) - min(times)).total_seconds() / 3600
+    # A page full of sales in the same minute still means "very liquid"
+    return (len(times) - 1) / max(span_hours, 1 / 60)
+
+
+class FetchPlanner:
+    """
+    Decides which (card_id, platform) sales pages are worth downloading this run.
+    Each pair keeps its last observed sale, a smoothed trades-per-hour estimate
+    and validators (ETag/Last-Modified/content hash) from the last download.
+    A page is due once rate * hours since its last observed sale reaches
+    TARGET_NEW_SALES, so busy cards refresh every run and illiquid ones only
+    every day or two.
+    """
+
+    def __init__(self):
+        self._state = {}
+        self._dirty = set()
+        self._staged = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.stats = {"due": 0, "skipped": 0, "not_modified": 0, "same_content": 0, "changed": 0}
+
+    def load(self):
+        state = {}
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT card_id, platform, last_sale_time, trades_per_hour,
+                           last_fetched, content_hash, etag, last_modified
+                    FROM card_fetch_state
+                """)
+                for row in cur.fetchall():
+                    state[(row["card_id"], row["platform"])] = row
+
+        with self._lock:
+            self._state = state
+            self._dirty.clear()
+            self.loaded = True
+        print(f"Loaded fetch state for {len(state)} card/platform pairs")
+
+    def due_platforms(self, card_id, platforms, now=None):
+        now = now or _utcnow()
+        due = []
+        for platform in platforms:
+            state = self._state.get((card_id, platform))
+            if self._is_due(state, now):
+                due.append(platform)
+                self.stats["due"] += 1
+            else:
+                self.stats["skipped"] += 1
+        return due
+
+    @staticmethod
+    def _is_due(state, now):
+        if state is None or state["last_fetched"] is None:
+            return True
+        hours = (now - state["last_fetched"]).total_seconds() / 3600
+        if hours < MIN_INTERVAL_HOURS:
+            return False
+        if hours >= MAX_INTERVAL_HOURS:
+            return True
+        if state["last_sale_time"] is not None:
+            # now and last_fetched are UTC, sale times naive Adelaide wall time
+            local_now = now.replace(tzinfo=datetime.timezone.utc).astimezone(ADELAIDE).replace(tzinfo=None)
+            hours = max((local_now - state["last_sale_time"]).total_seconds() / 3600, 0.0)
+        return (state["trades_per_hour"] or 0.0) * hours >= TARGET_NEW_SALES
+
+    def validators(self, card_id, platform):
+        state = self._state.get((card_id, platform)) or {}
+        return state.get("etag"), state.get("last_modified")
+
+    def is_same_content(self, card_id, platform, body_hash):
+        state = self._state.get((card_id, platform))
+        return state is not None and state["content_hash"] == body_hash
+
+    def record_unchanged(self, card_id, platform, not_modified=False):
+        """The page was 304 or byte-identical: no new trades since the last fetch."""
+        self.stats["not_modified" if not_modified else "same_content"] += 1
+        self._update(card_id, platform, observed_rate=0.0)
+
+    def record_fetch(self, card_id, platform, sales, body_hash, etag=None, last_modified=None):
+        """
+        Stage the new state for a changed page. It is applied by confirm() once the
+        sales are stored, so a failed insert never marks the page as already seen.
+        """
+        times = [s["sale_time"] for s in sales if s.get("sale_time")]
+        newest = max(times).astimezone(ADELAIDE).replace(tzinfo=None) if times else None
+        with self._lock:
+            self._staged[(card_id, platform)] = dict(
+                observed_rate=observed_trade_rate(sales),
+                last_sale_time=newest,
+                content_hash=body_hash,
+                etag=etag,
+                last_modified=last_modified,
+            )
+
+    def confirm(self, card_id):
+        with self._lock:
+            keys = [key for key in self._staged if key[0] == card_id]
+            staged = [(key[1], self._staged.pop(key)) for key in keys]
+        for platform, fields in staged:
+            self.stats["changed"] += 1
+            self._update(card_id, platform, **fields)
+
+    def _update(self, card_id, platform, observed_rate, **fields):
+        key = (card_id, platform)
+        with self._lock:
+            state = dict(self._state.get(key) or {
+                "card_id": card_id, "platform": platform, "last_sale_time": None,
+                "trades_per_hour": None, "content_hash": None, "etag": None, "last_modified": None,
+            })
+            previous = state["trades_per_hour"]
+            state["trades_per_hour"] = observed_rate if previous is None else (
+                RATE_SMOOTHING * observed_rate + (1 - RATE_SMOOTHING) * previous
+            )
+            state["last_fetched"] = _utcnow()
+            for field, value in fields.items():
+                if value is not None:
+                    state[field] = value
+            self._state[key] = state
+            self._dirty.add(key)
+
+    def save(self):
+        with self._lock:
+            rows = [
+                (s["card_id"], s["platform"], s["last_sale_time"], s["trades_per_hour"],
+                 s["last_fetched"], s["content_hash"], s["etag"], s["last_modified"])
+                for s in (self._state[key] for key in self._dirty)
+            ]
+            self._dirty.clear()
+        if not rows:
+            return
+
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany("""
+                    INSERT INTO card_fetch_state (
+                        card_id, platform, last_sale_time, trades_per_hour,
+                        last_fetched, content_hash, etag, last_modified
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        last_sale_time=VALUES(last_sale_time),
+                        trades_per_hour=VALUES(trades_per_hour),
+                        last_fetched=VALUES(last_fetched),
+                        content_hash=VALUES(content_hash),
+                        etag=VALUES(etag),
+                        last_modified=VALUES(last_modified)
+                """, rows)
+            conn.commit()
+        print(f"Saved fetch state for {len(rows)} card/platform pairs")
+
+
+fetch_planner = FetchPlanner()
+
+def load_fetch_plan():
+    fetch_planner.load()
+
+
+def save_fetch_plan():
+    fetch_planner.save()
+    print(f"Fetch plan: {fetch_planner.stats}")
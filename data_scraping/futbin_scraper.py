@@ -2,15 +2,30 @@ import asyncio
 import requests
 from bs4 import BeautifulSoup
 import datetime
-import random
 from collections import defaultdict
 from unidecode import unidecode
 import re
+import os
 import pytz
-import aiohttp
-from db_utils import insert_card_stats, insert_card, insert_card_playstyles, insert_card_roles, async_insert_sale_db, get_connection
+from functools import lru_cache
+from http_client import create_session, fetch_bytes, fetch_conditional, request_stats, rate_limiter_stats
+from fetch_planner import fetch_planner, content_hash
+from parse_pool import get_parse_pool
+from db_utils import CardMetadataBatcher, async_insert_sale_db, card_exists, pooled_connection, pool_stats
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional, parse_sales falls back to BeautifulSoup
+    lxml_html = None
 
 BASE_URL = "https://www.futbin.com"
+# Players scraped concurrently; the request rate itself is set by the adaptive limiter
+MAX_CONCURRENT_PLAYERS = 16
+SALES_PLATFORMS = ["pc", "ps"]
+# Listing pages fetched concurrently per version during href discovery
+LISTING_WINDOW = 4
+# Backend for parse_sales: "lxml" (fast) or "bs4"
+SALES_PARSER = os.getenv("SALES_PARSER", "lxml")
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                   "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -22,21 +37,79 @@ def extract_card_id(href: str) -> int | None:
     match = re.search(r"/player/(\d+)/", href)
     return int(match.group(1)) if match else None
 
-def collect_all_hrefs(version):
+def load_known_hrefs(version):
     hrefs = set()
-    new_hrefs = 0
-    conn = get_connection()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT href FROM hrefs WHERE version=%s", (version,))
+            for row in cur.fetchall():
+                hrefs.add(row['href']) 
+    return hrefs
 
-    # Load existing hrefs from DB
-    with conn.cursor() as cur:
-        cur.execute("SELECT href FROM hrefs WHERE version=%s", (version,))
-        for row in cur.fetchall():
-            hrefs.add(row['href']) 
 
+def save_hrefs(new_entries):
+    # Bulk insert new hrefs into DB
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO hrefs (card_id, href, version)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE card_id=card_id;
+            """, new_entries)
+        conn.commit()
+
+
+def parse_listing_page(html):
+    """
+    Parse a players listing page into (card_id, href) pairs worth tracking.
+    Returns None when the page has no player rows at all (past the last page).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    rows = soup.find_all("tr", class_="player-row")
+    if not rows:
+        return None
+
+    entries = []
+    for row in rows:
+        name_tag = row.find("a", class_="table-player-name")
+        if name_tag and "href" in name_tag.attrs:
+            href = name_tag["href"]
+            card_id = extract_card_id(href)
+            version_detail = row.find("div", class_="table-player-revision")
+            price = row.find("div", class_="price")
+            if "SBC" in version_detail.get_text():
+                continue
+            if price:
+                price_val = price.get_text(strip=True).replace(",", "")
+                if price_val == "0":
+                    continue
+            else:
+                continue
+            entries.append((card_id, href))
+    return entries
+
+
+def _listing_url(version, page_num):
+    return f"{BASE_URL}/26/players?page={page_num}&version={version}"
+
+
+def _take_new_entries(entries, hrefs, version):
+    new_entries = []
+    for card_id, href in entries:
+        if href not in hrefs:
+            hrefs.add(href)
+            new_entries.append((card_id, href, version))
+    return new_entries
+
+
+def collect_all_hrefs(version):
+    # Load existing hrefs from DB
+    hrefs = load_known_hrefs(version)
+    new_hrefs = 0
     page_num = 1
 
     while True:
-        url = f"{BASE_URL}/26/players?page={page_num}&version={version}"
+        url = _listing_url(version, page_num)
         print(f"[Page {page_num}] Fetching {url}")
 
         response = requests.get(url, headers=HEADERS)
@@ -44,140 +117,199 @@ def collect_all_hrefs(version):
             print(f"Failed to fetch page {page_num}")
             break
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        rows = soup.find_all("tr", class_="player-row")
+        entries = parse_listing_page(response.text)
 
         # Stop only when page has no rows at all
-        if not rows:
+        if entries is None:
             print(f"No player rows found, stopping at page {page_num}")
             break
 
-        page_new_hrefs = 0
-        new_entries = []
-
-        for row in rows:
-            name_tag = row.find("a", class_="table-player-name")
-            if name_tag and "href" in name_tag.attrs:
-                href = name_tag["href"]
-                card_id = extract_card_id(href)
-                version_detail = row.find("div", class_="table-player-revision")
-                price = row.find("div", class_="price")
-                if "SBC" in version_detail.get_text():
-                    continue
-                if price:
-                    price_val = price.get_text(strip=True).replace(",", "")
-                    if price_val == "0":
-                        continue
-                else:
-                    continue
-
-                if href not in hrefs:
-                    hrefs.add(href)
-                    page_new_hrefs += 1
-                    new_hrefs += 1
-                    new_entries.append((card_id, href, version))
-
-        # Bulk insert new hrefs into DB
+        new_entries = _take_new_entries(entries, hrefs, version)
         if new_entries:
-            with conn.cursor() as cur:
-                cur.executemany("""
-                    INSERT INTO hrefs (card_id, href, version)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE card_id=card_id;
-                """, new_entries)
-            conn.commit()
-
-        print(f"Page {page_num}: collected {page_new_hrefs} new hrefs")
+            save_hrefs(new_entries)
+        new_hrefs += len(new_entries)
+
+        print(f"Page {page_num}: collected {len(new_entries)} new hrefs")
         page_num += 1
 
     print(f"Collected {new_hrefs} new hrefs in total.")
-    conn.close()
     return list(hrefs)
 
 
+async def stream_version_hrefs(session, version, known=None, window=LISTING_WINDOW):
+    """
+    Crawl a version's listing pages, up to `window` pages in flight at once, and
+    yield every new (card_id, href, version) as soon as its page is parsed and saved.
+    Pages are consumed in order and the crawl stops at the first empty or failed page.
+    """
+    if known is None:
+        known = await asyncio.to_thread(load_known_hrefs, version)
+    parse_pool = get_parse_pool()
 
+    async def fetch_page(page_num):
+        html = await fetch_bytes(session, _listing_url(version, page_num), headers=HEADERS)
+        return await parse_pool.run(parse_listing_page, html)
+
+    in_flight = {}
+    next_page = 1
+    page_num = 1
+    new_hrefs = 0
 
-def load_meta_hrefs(version, min_price=5000):
-    conn = get_connection()
     try:
+        while True:
+            while len(in_flight) < window:
+                in_flight[next_page] = asyncio.create_task(fetch_page(next_page))
+                next_page += 1
+
+            try:
+                entries = await in_flight.pop(page_num)
+            except Exception as e:
+                print(f"[{version}] Failed to fetch page {page_num}: {e}")
+                break
+
+            # Stop only when page has no rows at all
+            if entries is None:
+                print(f"[{version}] No player rows found, stopping at page {page_num}")
+                break
+
+            new_entries = _take_new_entries(entries, known, version)
+            if new_entries:
+                await asyncio.to_thread(save_hrefs, new_entries)
+                for entry in new_entries:
+                    yield entry
+            new_hrefs += len(new_entries)
+
+            print(f"[{version}] Page {page_num}: collected {len(new_entries)} new hrefs")
+            page_num += 1
+    finally:
+        # Pages past the last one were speculative, drop them
+        for task in in_flight.values():
+            task.cancel()
+        await asyncio.gather(*in_flight.values(), return_exceptions=True)
+
+    print(f"Collected {new_hrefs} new {version} hrefs in total.")
+
+
+async def collect_all_hrefs_async(session, version):
+    """Same result as collect_all_hrefs, crawled concurrently on the shared session."""
+    hrefs = await asyncio.to_thread(load_known_hrefs, version)
+    async for _ in stream_version_hrefs(session, version, known=hrefs):
+        pass
+    return list(hrefs)
+
+
+
+
+def load_meta_hrefs(version, min_price=5000):
+    """Hrefs for cards with no trades yet or currently selling above min_price on any platform."""
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
+            # Both subqueries are primary-key lookups on card_price_summary
             cur.execute("""
                 SELECT DISTINCT c.href
                 FROM hrefs c
-                LEFT JOIN market_sales ms ON c.card_id = ms.card_id
                 WHERE c.version = %s
-                  AND (ms.sold_price > %s OR ms.sold_price IS NULL);
+                  AND (
+                    NOT EXISTS (SELECT 1 FROM card_price_summary s WHERE s.card_id = c.card_id)
+                    OR EXISTS (
+                        SELECT 1 FROM card_price_summary s
+                        WHERE s.card_id = c.card_id AND s.median_price > %s
+                    )
+                  );
             """, (version, min_price))
             rows = cur.fetchall()
             return [row['href'] for row in rows]
-    finally:
-        conn.close()
 
 
 
-async def scrape_fc26_players(version):
+async def store_sales(card_id, all_prices, metadata_exists=True):
+    await async_insert_sale_db(card_id, all_prices)
+    fetch_planner.confirm(card_id)
+    print(f"✅ Processed player {card_id} (metadata {'exists' if metadata_exists else 'added'})")
+
+
+async def process_player(href, session, metadata_writer):
+    """Scrape one player's metadata (if new) and latest sales, then store them."""
+    try:
+        # Extract card_id from href
+        card_id = int(href.split("/")[3])
+
+        # Check if metadata already exists in DB
+        metadata_exists = await asyncio.to_thread(card_exists, card_id)
+
+        metadata_written = None
+        if not metadata_exists:
+            # Scrape full metadata
+            metadata = await scrape_futbin_player_async(session, href)
+            if not metadata:
+                print(f"Skipped player {href} because metadata could not be scraped")
+                return None
+
+            # Queue metadata for the next batched write
+            metadata_written = metadata_writer.add(metadata)
+        else:
+            print(f"Metadata already exists for player {card_id}, skipping scraping")
+            metadata = None  # we don't need metadata for printing
+
+        # Only download sales pages that are expected to hold new trades
+        platforms = fetch_planner.due_platforms(card_id, SALES_PLATFORMS)
+        if not platforms and metadata_written is None:
+            print(f"Skipped sales for player {card_id}, no new trades expected yet")
+            return card_id
+
+        sales_href = href.replace("player", "sales")
+        sales = await get_sales(sales_href, session, card_id, platforms)
+        all_prices = []
+        for platform, s in sales.items():
+            for sale in s:
+                sale["platform"] = platform
+                all_prices.append(sale)
+
+        if metadata_written is None:
+            await store_sales(card_id, all_prices, metadata_exists)
+        else:
+            # Sales reference cards, so they can only go in once this card's batch commits.
+            # Waiting for that here would hold the caller's slot until the batch fills or
+            # times out, so the writer stores them in the background instead
+            metadata_writer.after_commit(metadata_written, store_sales(card_id, all_prices, metadata_exists))
+
+        return card_id
+
+    except Exception as e:
+        print(f"Error scraping {href}: {e}")
+        return None
+
+
+async def scrape_fc26_players(version, session=None):
 
     # Load hrefs
     hrefs = load_meta_hrefs(version)
     print(f"Loaded {len(hrefs)} hrefs.")
 
-    sem = asyncio.Semaphore(2)  # concurrency limit
+    # Request pacing comes from the shared adaptive rate limiter in http_client,
+    # this only caps how many players are held in memory at once
+    sem = asyncio.Semaphore(MAX_CONCURRENT_PLAYERS)
+    metadata_writer = CardMetadataBatcher("26")
+    owns_session = session is None
+    if owns_session:
+        session = create_session(HEADERS)
 
-    async def process_player(href):
+    async def limited(href):
         async with sem:
-            await asyncio.sleep(random.uniform(0.5,2))
-            try:
-                # Extract card_id from href
-                card_id = int(href.split("/")[3])
-
-                # Check if metadata already exists in DB
-                conn = get_connection()
-                metadata_exists = False
-                try:
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT 1 FROM cards WHERE card_id=%s LIMIT 1", (card_id,))
-                        metadata_exists = cur.fetchone() is not None
-                finally:
-                    conn.close()
-
-                if not metadata_exists:
-                    # Scrape full metadata
-                    metadata = await asyncio.to_thread(scrape_futbin_player, href)
-                    if not metadata:
-                        print(f"Skipped player {href} because metadata could not be scraped")
-                        return None
-
-                    # Insert metadata into DB
-                    insert_card(card_id, metadata["details"], "26")
-                    insert_card_stats(card_id, metadata["stats"])
-                    insert_card_roles(card_id, metadata["roles"])
-                    insert_card_playstyles(card_id, metadata["playstyles"])
-                else:
-                    print(f"Metadata already exists for player {card_id}, skipping scraping")
-                    metadata = None  # we don't need metadata for printing
-
-                # Always scrape market sales
-                sales_href = href.replace("player", "sales")
-                sales = await get_sales(sales_href)
-                all_prices = []
-                for platform, s in sales.items():
-                    for sale in s:
-                        sale["platform"] = platform
-                        all_prices.append(sale)
-
-                await async_insert_sale_db(card_id, all_prices)
-                print(f"✅ Processed player {card_id} (metadata {'exists' if metadata_exists else 'added'})")
-
-                return card_id
+            return await process_player(href, session, metadata_writer)
 
-            except Exception as e:
-                print(f"Error scraping {href}: {e}")
-                return None
-
-    tasks = [process_player(href) for href in hrefs]
-    for coro in asyncio.as_completed(tasks):
-        await coro
+    try:
+        tasks = [limited(href) for href in hrefs]
+        for coro in asyncio.as_completed(tasks):
+            await coro
+        await metadata_writer.close()
+    finally:
+        if owns_session:
+            await session.close()
 
+    print(f"DB pool usage for {version}: {pool_stats()}")
+    print(f"HTTP stats for {version}: {request_stats.summary()}")
+    print(f"Rate limits for {version}: {rate_limiter_stats()}")
     return
 
 
@@ -202,7 +334,23 @@ def scrape_futbin_player(href):
         print(f"Failed to fetch {href}")
         return None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    return parse_futbin_player(response.text, href)
+
+
+async def scrape_futbin_player_async(session, href):
+    url = f"{BASE_URL}{href}"
+    try:
+        html = await fetch_bytes(session, url, headers=HEADERS)
+    except Exception as e:
+        print(f"Failed to fetch {href}: {e}")
+        return None
+
+    # BeautifulSoup parsing is CPU-bound, hand the raw page to a parser process
+    return await get_parse_pool().run(parse_futbin_player, html, href)
+
+
+def parse_futbin_player(html, href):
+    soup = BeautifulSoup(html, 'html.parser')
 
     player_info_box = soup.find("div", class_="player-header-info-box")
     player_card = soup.find("div", class_="playercard-l")
@@ -332,8 +480,15 @@ def scrape_futbin_player(href):
         wrapper = soup.find("div", {"data-base-stat-id": stat_id})
         values = {}
         if wrapper:
-            for stat_div in wrapper.select(".player-stat-value"):
-                stat_name_div = stat_div.find_previous("div", class_="player-stat-name")
+            # Names and values come back in document order, so each value's label
+            # is the last name seen instead of a find_previous walk per stat
+            stat_name_div = None
+            for stat_div in wrapper.select("div.player-stat-name, .player-stat-value"):
+                if stat_div.name == "div" and "player-stat-name" in stat_div.get("class", []):
+                    stat_name_div = stat_div
+                    continue
+                if stat_name_div is None:
+                    stat_name_div = stat_div.find_previous("div", class_="player-stat-name")
                 stat_name = stat_name_div.text.strip() if stat_name_div else "Unknown"
 
                 stat_name = normalize_column(stat_name)
@@ -370,13 +525,57 @@ def scrape_futbin_player(href):
 
 # Scrape Live Hourly Prices
 async def fetch_sales(session, url):
-    """Fetch page content asynchronously."""
-    async with session.get(url, headers=HEADERS) as resp:
-        return await resp.text()
+    """Fetch raw page content asynchronously."""
+    return await fetch_bytes(session, url, headers=HEADERS)
+
+
+
+UK_TZ = pytz.timezone("Europe/London")
+ADELAIDE_TZ = pytz.timezone("Australia/Adelaide")
+SALES_CUTOFF = ADELAIDE_TZ.localize(datetime.datetime(2024, 1, 1))
+
+
+@lru_cache(maxsize=8192)
+def _sale_time_to_adelaide(sale_time_str, year):
+    # Sales pages repeat the same minute many times, so the strptime/localize work is cached
+    naive_dt = datetime.datetime.strptime(sale_time_str, "%b %d, %I:%M %p")
+    naive_dt = naive_dt.replace(year=year)
+    uk_dt = UK_TZ.localize(naive_dt)           # make it aware
+    return uk_dt.astimezone(ADELAIDE_TZ)
+
+
+def _sale_row(sale_time_str, price_text, sold_price_text, sale_type, year):
+    """Build one sale dict from the cell texts, or None if it has no usable sale time."""
+    # Parse date/time
+    adelaide_dt = _sale_time_to_adelaide(sale_time_str, year) if sale_time_str else None
+
+    # Parse prices
+    price = int(price_text.replace(",", "")) if price_text else None
+
+    try:
+        sold_price = int(sold_price_text.replace(",", "")) if sold_price_text else 0
+    except ValueError:
+        sold_price = 0
+
+    if adelaide_dt and adelaide_dt >= SALES_CUTOFF:
+        return {
+            "sale_time": adelaide_dt,  # now fully aware datetime
+            "listed_price": price,
+            "sold_price": sold_price,
+            "sale_type": sale_type
+        }
+    return None
+
 
+def parse_sales(html, backend=None):
+    """Parse a sales page into sale dicts using the bs4 or lxml backend (SALES_PARSER)."""
+    backend = backend or SALES_PARSER
+    if backend == "lxml" and lxml_html is not None:
+        return _parse_sales_lxml(html)
+    return _parse_sales_bs4(html)
 
 
-def parse_sales(html):
+def _parse_sales_bs4(html):
     try:
         soup = BeautifulSoup(html, "html.parser")
         sales_table = soup.find("tbody")
@@ -385,45 +584,76 @@ def parse_sales(html):
             return []
 
         sales_data = []
-        uk = pytz.timezone("Europe/London")
-        adelaide = pytz.timezone("Australia/Adelaide")
-        cutoff = adelaide.localize(datetime.datetime(2024, 1, 1))
+        year = datetime.datetime.now().year
 
         for row in sales_table.find_all("tr"):
             cols = row.find_all("td")
 
-            # Parse date/time
             date_span = cols[0].find("span", class_="sales-date-time")
             sale_time_str = date_span.get_text(strip=True) if date_span else None
-            if sale_time_str:
-                naive_dt = datetime.datetime.strptime(sale_time_str, "%b %d, %I:%M %p")
-                naive_dt = naive_dt.replace(year=datetime.datetime.now().year)
-                uk_dt = uk.localize(naive_dt)           # make it aware
-                adelaide_dt = uk_dt.astimezone(adelaide)
-            else:
-                adelaide_dt = None
-
-            # Parse prices
-            price_text = cols[1].get_text(strip=True)
-            price = int(price_text.replace(",", "")) if price_text else None
-
-            sold_price_text = cols[2].get_text(strip=True)
-            try:
-                sold_price = int(sold_price_text.replace(",", "")) if sold_price_text else 0
-            except ValueError:
-                sold_price = 0
 
             # Sale type
             type_div = cols[5].find("div", class_="inline-popup-content")
             sale_type = type_div.get_text(strip=True) if type_div else None
 
-            if adelaide_dt and adelaide_dt >= cutoff:
-                sales_data.append({
-                    "sale_time": adelaide_dt,  # now fully aware datetime
-                    "listed_price": price,
-                    "sold_price": sold_price,
-                    "sale_type": sale_type
-                })
+            sale = _sale_row(
+                sale_time_str,
+                cols[1].get_text(strip=True),
+                cols[2].get_text(strip=True),
+                sale_type,
+                year
+            )
+            if sale:
+                sales_data.append(sale)
+
+    except Exception as e:
+        print(f"Error parsing sales: {e}")
+
+    return sales_data
+
+
+def _lxml_text(el):
+    # Same result as BeautifulSoup get_text(strip=True)
+    return "".join(part.strip() for part in el.itertext())
+
+
+def _lxml_find_class(el, tag, css_class):
+    for child in el.iter(tag):
+        if css_class in (child.get("class") or "").split():
+            return child
+    return None
+
+
+def _parse_sales_lxml(html):
+    sales_data = []
+    try:
+        doc = lxml_html.fromstring(html)
+        sales_table = next(doc.iter("tbody"), None)
+        if sales_table is None:
+            print(f"No sales table found")
+            return []
+
+        year = datetime.datetime.now().year
+
+        for row in sales_table.iter("tr"):
+            cols = list(row.iter("td"))
+
+            date_span = _lxml_find_class(cols[0], "span", "sales-date-time")
+            sale_time_str = _lxml_text(date_span) if date_span is not None else None
+
+            # Sale type
+            type_div = _lxml_find_class(cols[5], "div", "inline-popup-content")
+            sale_type = _lxml_text(type_div) if type_div is not None else None
+
+            sale = _sale_row(
+                sale_time_str,
+                _lxml_text(cols[1]),
+                _lxml_text(cols[2]),
+                sale_type,
+                year
+            )
+            if sale:
+                sales_data.append(sale)
 
     except Exception as e:
         print(f"Error parsing sales: {e}")
@@ -432,21 +662,39 @@ def parse_sales(html):
 
 
 
-async def get_sales(sales_href):
-    platforms = ["pc", "ps"]
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for platform in platforms:
-            url = f"{BASE_URL}{sales_href}?platform={platform}"
-            tasks.append(fetch_sales(session, url))
+async def get_sales(sales_href, session, card_id=None, platforms=SALES_PLATFORMS):
+    parse_pool = get_parse_pool()
+
+    async def fetch_platform(platform):
+        url = f"{BASE_URL}{sales_href}?platform={platform}"
+        if card_id is None:
+            return await parse_pool.run(parse_sales, await fetch_sales(session, url))
+
+        # Ask the server whether the page changed, and fall back to a content hash
+        etag, last_modified = fetch_planner.validators(card_id, platform)
+        status, html, etag, last_modified = await fetch_conditional(
+            session, url, headers=HEADERS, etag=etag, last_modified=last_modified
+        )
+        if status == 304:
+            fetch_planner.record_unchanged(card_id, platform, not_modified=True)
+            return []
+
+        body_hash = content_hash(html)
+        if fetch_planner.is_same_content(card_id, platform, body_hash):
+            fetch_planner.record_unchanged(card_id, platform)
+            return []
+
+        # Parse HTML in the parser processes
+        sales = await parse_pool.run(parse_sales, html)
+        fetch_planner.record_fetch(card_id, platform, sales, body_hash, etag, last_modified)
+        return sales
 
-        html_results = await asyncio.gather(*tasks, return_exceptions=True)
+    results = await asyncio.gather(*(fetch_platform(p) for p in platforms), return_exceptions=True)
 
-    # Parse HTML for each platform
     sales_by_platform = {}
-    for platform, html in zip(platforms, html_results):
-        if isinstance(html, str):
-            sales_by_platform[platform] = parse_sales(html)
+    for platform, sales in zip(platforms, results):
+        if isinstance(sales, list):
+            sales_by_platform[platform] = sales
         else:
             sales_by_platform[platform] = []
 
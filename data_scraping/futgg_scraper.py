@@ -2,7 +2,6 @@ import asyncio
 import requests
 from bs4 import BeautifulSoup
 import datetime
-import random
 from collections import defaultdict
 from unidecode import unidecode
 import re
@@ -11,7 +10,10 @@ import aiohttp
 import psutil
 import json
 import os
-from db_utils import insert_card_stats, insert_card, insert_card_playstyles, insert_card_roles, add_price_to_database, async_insert_sale_db
+from db_utils import CardMetadataBatcher, async_insert_sale_db
+from http_client import create_session, fetch_bytes, rate_limiter_stats
+from parse_pool import get_parse_pool
+from futbin_scraper import normalize_column
 
 BASE_URL = "https://www.fut.gg"
 CHROME_PATH = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
@@ -22,6 +24,10 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
+# Players scraped concurrently; the request rate itself is set by the adaptive limiter,
+# whose budget is shared with futbin_scraper
+MAX_CONCURRENT_PLAYERS = 16
+
 version_ids = {
     "gold": 1,
     "gold_rare": 2,
@@ -34,22 +40,37 @@ version_ids = {
 
 # Main
 
+def _hrefs_path(version):
+    return f"data_scraping/futgg_hrefs/{version}_hrefs.txt"
+
+
+def _listing_url(version, page_num):
+    return f"{BASE_URL}/players/?page={page_num}&quality_id=[{version_ids[version]}]"
+
+
+def parse_listing_page(html):
+    """Player hrefs on a fut.gg listing page, or None when the page has no player rows (past the last page)."""
+    soup = BeautifulSoup(html, "html.parser")
+    players = soup.find_all("a", class_="group/player")
+    if not players:
+        return None
+    return [player["href"] for player in players if player and "href" in player.attrs]
+
+
+def save_hrefs(version, hrefs):
+    with open(_hrefs_path(version), "w", encoding="utf-8") as f:
+        for href in sorted(hrefs):  # optional: sort to keep order consistent
+            f.write(href + "\n")
+
+
 def collect_futgg_hrefs(version):
-    hrefs = set()
-    href_lines = 0
-    # Load existing hrefs from file
-    if os.path.exists(f"data_scraping/futgg_hrefs/{version}_hrefs.txt"):
-        with open(f"data_scraping/futgg_hrefs/{version}_hrefs.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                hrefs.add(line.strip())
-                href_lines += 1
-
-    completed_pages = href_lines // 30  # integer division
+    hrefs = set(load_hrefs(version))
+    completed_pages = len(hrefs) // 30  # integer division
     page_num = 1 + completed_pages
     new_hrefs = 0
 
     while True:
-        url = f"{BASE_URL}/players/?page={page_num}&quality_id=[{version_ids[version]}]"
+        url = _listing_url(version, page_num)
         print(f"[Page {page_num}] Fetching {url}")
 
         response = requests.get(url, headers=HEADERS)
@@ -57,35 +78,58 @@ def collect_futgg_hrefs(version):
             print(f"Failed to fetch page {page_num}")
             break
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        players = soup.find_all("a", class_="group/player")
-
-        if not players:
+        entries = parse_listing_page(response.text)
+        if entries is None:
             print(f"No player rows found, stopping at page {page_num}")
             break
 
-        page_new_hrefs = 0
-        for player in players:
-            if player and "href" in player.attrs:
-                href = player["href"]
-                if href not in hrefs:
-                    hrefs.add(href)
-                    page_new_hrefs += 1
-                    new_hrefs += 1
-
+        page_new_hrefs = len(set(entries) - hrefs)
+        hrefs.update(entries)
+        new_hrefs += page_new_hrefs
         if page_new_hrefs == 0:
             print(f"No new hrefs found on page {page_num}, stopping.")
             break
 
         print(f"Page {page_num}: collected {page_new_hrefs} new hrefs")
-
         page_num += 1
 
-    # Save all hrefs back to file
-    with open(f"data_scraping/futgg_hrefs/{version}_hrefs.txt", "w", encoding="utf-8") as f:
-        for href in sorted(hrefs):  # optional: sort to keep order consistent
-            f.write(href + "\n")
+    save_hrefs(version, hrefs)
+    print(f"Collected {new_hrefs} new hrefs in total.")
+    return list(hrefs)
+
+
+async def collect_futgg_hrefs_async(session, version):
+    """Same result as collect_futgg_hrefs, fetched on the shared session with parsing in the parse pool."""
+    hrefs = set(await asyncio.to_thread(load_hrefs, version))
+    page_num = 1 + len(hrefs) // 30
+    new_hrefs = 0
+    parse_pool = get_parse_pool()
+
+    while True:
+        url = _listing_url(version, page_num)
+        print(f"[Page {page_num}] Fetching {url}")
+        try:
+            html = await fetch_bytes(session, url, headers=HEADERS)
+        except Exception as e:
+            print(f"Failed to fetch page {page_num}: {e}")
+            break
+
+        entries = await parse_pool.run(parse_listing_page, html)
+        if entries is None:
+            print(f"No player rows found, stopping at page {page_num}")
+            break
+
+        page_new_hrefs = len(set(entries) - hrefs)
+        hrefs.update(entries)
+        new_hrefs += page_new_hrefs
+        if page_new_hrefs == 0:
+            print(f"No new hrefs found on page {page_num}, stopping.")
+            break
+
+        print(f"Page {page_num}: collected {page_new_hrefs} new hrefs")
+        page_num += 1
 
+    await asyncio.to_thread(save_hrefs, version, hrefs)
     print(f"Collected {new_hrefs} new hrefs in total.")
     return list(hrefs)
 
@@ -93,65 +137,70 @@ def collect_futgg_hrefs(version):
 def load_hrefs(version):
     """Load hrefs from hrefs.txt if it exists."""
     hrefs = []
-    if os.path.exists(f"data_scraping/futgg_hrefs/{version}_hrefs.txt"):
-        with open(f"data_scraping/futgg_hrefs/{version}_hrefs.txt", "r", encoding="utf-8") as f:
+    if os.path.exists(_hrefs_path(version)):
+        with open(_hrefs_path(version), "r", encoding="utf-8") as f:
             hrefs = [line.strip() for line in f if line.strip()]
         print(f"Loaded {len(hrefs)} {version} hrefs from file.")
     return hrefs
 
-async def scrape_fc26_players(version):
+
+async def process_player(href, session, metadata_writer):
+    """Scrape one player's metadata and latest sales, then store them."""
+    try:
+        metadata = await scrape_futgg_player_async(session, href)
+        if not metadata:
+            print(f"Skipped player {href} because metadata could not be scraped")
+            return None
+        card_id = metadata["id"]
+
+        sales_href = href.replace("player", "sales")
+        sales = await get_sales(sales_href, session)
+        all_prices = []
+        for platform, platform_sales in sales.items():
+            for sale in platform_sales:
+                sale["platform"] = platform
+                all_prices.append(sale)
+
+        # Sales reference cards, so they go in once the card's metadata batch commits
+        metadata_writer.after_commit(metadata_writer.add(metadata), store_sales(card_id, all_prices))
+        print(f"Scraped {metadata['details']['name']}")
+        return card_id
+
+    except Exception as e:
+        print(f"Error scraping {href}: {e}")
+        return None
+
+
+async def store_sales(card_id, all_prices):
+    await async_insert_sale_db(card_id, all_prices)
+
+
+async def scrape_fc26_players(version, session=None):
 
     # Load hrefs
-    hrefs = load_hrefs("26", version)
+    hrefs = await asyncio.to_thread(load_hrefs, version)
     print(f"Loaded {len(hrefs)} futgg hrefs")
-    results = []
 
-    sem = asyncio.Semaphore(5)  # concurrency limit
+    # Players in flight at once; pacing comes from the adaptive rate limiter in http_client
+    sem = asyncio.Semaphore(MAX_CONCURRENT_PLAYERS)
+    metadata_writer = CardMetadataBatcher("26")
+    owns_session = session is None
+    if owns_session:
+        session = create_session(HEADERS)
 
-    async def process_player(href):
+    async def limited(href):
         async with sem:
-            await asyncio.sleep(random.uniform(0.5,2))
-            metadata = scrape_futgg_player(href)
-            if not metadata: return None
-            card_id = metadata["id"]
-            sales_href = href.replace("player", "sales")
-            sales = await get_sales(sales_href)
-            result = {
-                "card_id": card_id,
-                "details": metadata["details"],
-                "playstyles": metadata["playstyles"],
-                "roles": metadata["roles"],
-                "stats": metadata["stats"],
-                "market_sales": sales
-            }
-            print(f"Scraped {metadata['details']['name']}")
-            return result
-
-    tasks = [process_player(href) for href in hrefs]
-    for coro in asyncio.as_completed(tasks):
-        res = await coro
-        if res is None:
-            print("Skipped a player because scraping returned None")
-            continue  # skip this iteration
-        
-        res_card_id =  res["card_id"]
-        
-        # Insert Scraped Data to Database 
-        # Insert player into DB
-        insert_card(res_card_id, res["details"], "26")
-        # Insert stats
-        insert_card_stats(res_card_id, res["stats"])
-        # Insert roles/playstyles if available
-        insert_card_roles(res_card_id, res["roles"])
-        insert_card_playstyles(res_card_id, res["playstyles"])
+            return await process_player(href, session, metadata_writer)
 
-        all_prices = []
-        for platform, sales in res["market_sales"].items():
-            for sale in sales:
-                sale["platform"] = platform
-                all_prices.append(sale)
-        await async_insert_sale_db(res_card_id, all_prices)
-    
+    try:
+        results = await asyncio.gather(*(limited(href) for href in hrefs))
+        await metadata_writer.close()
+    finally:
+        if owns_session:
+            await session.close()
+
+    print(f"Scraped {sum(r is not None for r in results)}/{len(hrefs)} futgg players")
+    print(f"Rate limits: {rate_limiter_stats()}")
     return
 
 
@@ -165,7 +214,23 @@ def scrape_futbin_player(href):
         print(f"Failed to fetch {href}")
         return None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    return parse_player_page(response.text, href)
+
+
+async def scrape_futgg_player_async(session, href):
+    url = f"{BASE_URL}{href}"
+    try:
+        html = await fetch_bytes(session, url, headers=HEADERS)
+    except Exception as e:
+        print(f"Failed to fetch {href}: {e}")
+        return None
+
+    # BeautifulSoup parsing is CPU-bound, hand the raw page to a parser process
+    return await get_parse_pool().run(parse_player_page, html, href)
+
+
+def parse_player_page(html, href):
+    soup = BeautifulSoup(html, 'html.parser')
 
     player_info_box = soup.find("div", class_="player-header-info-box")
     player_card = soup.find("div", class_="playercard-l")
@@ -334,8 +399,7 @@ def scrape_futbin_player(href):
 # Scrape Live Hourly Prices
 async def fetch_sales(session, url):
     """Fetch page content asynchronously."""
-    async with session.get(url, headers=HEADERS) as resp:
-        return await resp.text()
+    return await fetch_bytes(session, url, headers=HEADERS)
 
 
 
@@ -409,21 +473,21 @@ def parse_sales(html):
     return sales_data
 
 
-async def get_sales(sales_href):
+async def get_sales(sales_href, session):
     platforms = ["pc", "ps"]
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for platform in platforms:
-            url = f"{BASE_URL}{sales_href}?platform={platform}"
-            tasks.append(fetch_sales(session, url))
+    tasks = []
+    for platform in platforms:
+        url = f"{BASE_URL}{sales_href}?platform={platform}"
+        tasks.append(fetch_sales(session, url))
 
-        html_results = await asyncio.gather(*tasks, return_exceptions=True)
+    html_results = await asyncio.gather(*tasks, return_exceptions=True)
 
-    # Parse HTML for each platform
+    # Parse HTML for each platform off the event loop
+    parse_pool = get_parse_pool()
     sales_by_platform = {}
     for platform, html in zip(platforms, html_results):
-        if isinstance(html, str):
-            sales_by_platform[platform] = parse_sales(html)
+        if isinstance(html, bytes):
+            sales_by_platform[platform] = await parse_pool.run(parse_sales, html)
         else:
             sales_by_platform[platform] = []
 
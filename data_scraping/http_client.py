@@ -0,0 +1,254 @@
+import asyncio
+import random
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import aiohttp
+
+# Connection reuse settings for the shared scraper session
+CONNECTOR_LIMIT = 32
+CONNECTOR_LIMIT_PER_HOST = 8
+DNS_CACHE_TTL = 300        # seconds
+KEEPALIVE_TIMEOUT = 30     # seconds an idle socket is kept open
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+
+# Adaptive rate limit per budget (requests/sec)
+RATE_START = 2.0
+RATE_MIN = 0.25
+RATE_MAX = 10.0
+RATE_BURST = 4             # tokens a quiet host can bank
+RATE_INCREASE = 0.1        # additive increase, roughly req/s gained per healthy second
+RATE_DECREASE = 0.5        # multiplicative cut on 429/5xx/errors
+RATE_SLOW_DECREASE = 0.8   # gentler cut when responses get slow
+RATE_SLOW_LATENCY = 4.0    # seconds
+RATE_CUT_COOLDOWN = 5.0    # seconds between cuts so one bad burst counts once
+# Hosts that draw from one limiter; any other host gets a limiter of its own
+RATE_BUDGETS = {
+    "www.futbin.com": "market",
+    "www.fut.gg": "market",
+}
+
+# Retry policy
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0         # seconds, doubled every attempt
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    def __init__(self, url, status):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+class RequestStats:
+    """Per-request latency and outcome counters for one scraper run."""
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.statuses = {}
+
+    def record(self, latency, status=None):
+        self.requests += 1
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        # Keep a bounded sample so long runs don't grow without limit
+        if len(self.latencies) < self.max_samples:
+            self.latencies.append(latency)
+        else:
+            self.latencies[random.randrange(self.max_samples)] = latency
+
+    def summary(self):
+        if not self.latencies:
+            return {"requests": self.requests, "errors": self.errors, "retries": self.retries}
+        ordered = sorted(self.latencies)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "statuses": dict(self.statuses),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p50_ms": round(pick(0.50) * 1000, 1),
+            "p95_ms": round(pick(0.95) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+        }
+
+
+request_stats = RequestStats()
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate follows AIMD: every healthy response nudges
+    the rate up, 429/5xx/connection errors halve it and slow responses trim it.
+    """
+
+    def __init__(self, rate=RATE_START, min_rate=RATE_MIN, max_rate=RATE_MAX, burst=RATE_BURST):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._last_cut = 0.0
+        self._lock = None
+        self._started = time.monotonic()
+        self._recent = deque()
+        self.requests = 0
+        self.cuts = 0
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    self._recent.append(now)
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_response(self, status, latency):
+        if status == 429 or status >= 500:
+            self._cut(RATE_DECREASE)
+        elif latency > RATE_SLOW_LATENCY:
+            self._cut(RATE_SLOW_DECREASE)
+        else:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE / max(self.rate, 1.0))
+
+    def on_error(self):
+        self._cut(RATE_DECREASE)
+
+    def _cut(self, factor):
+        now = time.monotonic()
+        if now - self._last_cut < RATE_CUT_COOLDOWN:
+            return
+        self._last_cut = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.cuts += 1
+
+    def achieved_rps(self, window=60.0):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > window:
+            self._recent.popleft()
+        return len(self._recent) / min(window, max(now - self._started, 1e-9))
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "rate_limit": round(self.rate, 2),
+            "achieved_rps_1m": round(self.achieved_rps(), 2),
+            "achieved_rps_total": round(self.requests / elapsed, 2),
+            "requests": self.requests,
+            "cuts": self.cuts,
+        }
+
+
+# Shared by every scraper in the process, keyed by budget, so futbin and fut.gg
+# traffic draws from the one "market" budget in RATE_BUDGETS
+_rate_limiters = {}
+
+def get_rate_limiter(host):
+    budget = RATE_BUDGETS.get(host, host)
+    if budget not in _rate_limiters:
+        _rate_limiters[budget] = AdaptiveRateLimiter()
+    return _rate_limiters[budget]
+
+
+def rate_limiter_stats():
+    return {budget: limiter.summary() for budget, limiter in _rate_limiters.items()}
+
+
+def create_session(headers=None):
+    """One keep-alive session per scraper run; close it (or use async with) when the run ends."""
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTOR_LIMIT,
+        limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT, headers=headers)
+
+
+def _backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)  # jitter so workers don't retry in lockstep
+
+
+async def fetch_text(session, url, headers=None, retries=MAX_RETRIES, stats=request_stats):
+    """GET a page and return its decoded body, retrying timeouts, connection errors and 429/5xx responses."""
+    return await _fetch(session, url, headers, retries, stats, raw=False)
+
+
+async def fetch_bytes(session, url, headers=None, retries=MAX_RETRIES, stats=request_stats):
+    """Like fetch_text but returns the undecoded body, e.g. to hand to a parser process."""
+    return await _fetch(session, url, headers, retries, stats, raw=True)
+
+
+async def fetch_conditional(session, url, headers=None, etag=None, last_modified=None,
+                            retries=MAX_RETRIES, stats=request_stats):
+    """
+    Conditional GET for pages we have seen before.
+    Returns (status, body, etag, last_modified); status 304 means unchanged and body is None.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return await _fetch(session, url, headers, retries, stats, raw=True, conditional=True)
+
+
+async def _fetch(session, url, headers, retries, stats, raw, conditional=False):
+    limiter = get_rate_limiter(urlsplit(url).netloc)
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as resp:
+                body = await resp.read() if raw else await resp.text()
+                latency = time.perf_counter() - started
+                stats.record(latency, resp.status)
+                limiter.on_response(resp.status, latency)
+
+                if conditional and resp.status in (200, 304):
+                    return (
+                        resp.status,
+                        body if resp.status == 200 else None,
+                        resp.headers.get("ETag"),
+                        resp.headers.get("Last-Modified"),
+                    )
+                if resp.status == 200:
+                    return body
+                if resp.status not in RETRY_STATUSES or attempt == retries:
+                    raise FetchError(url, resp.status)
+                delay = _backoff_delay(attempt, resp.headers.get("Retry-After"))
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats.record(time.perf_counter() - started)
+            limiter.on_error()
+            if attempt == retries:
+                raise
+            delay = _backoff_delay(attempt)
+            print(f"Retrying {url} in {delay:.1f}s after {type(e).__name__}")
+
+        stats.retries += 1
+        await asyncio.sleep(delay)
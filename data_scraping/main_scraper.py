@@ -1,24 +1,134 @@
-from futbin_scraper import scrape_fc26_players, collect_all_hrefs
+from futbin_scraper import stream_version_hrefs, load_meta_hrefs, process_player, HEADERS
+from http_client import create_session, request_stats, rate_limiter_stats
+from parse_pool import shutdown_parse_pool
+from fetch_planner import load_fetch_plan, save_fetch_plan
 # from futgg_scraper import collect_futgg_hrefs
-from db_utils import initcardTable
+from market_storage import ensure_future_partitions
+from sale_events import enable_socket_publishing
+from db_utils import initcardTable, ensure_price_summary, ensure_candles, load_sale_watermarks, CardMetadataBatcher, pool_stats
 import asyncio
+import time
+
+VERSIONS = ["gold_rare", "icons", "heroes", "gold_if", "cornerstones"]
+
+# Players processed at once across every version, one per worker. Listing pages and sales
+# pages all go through the shared adaptive limiter in http_client, which sets the request rate.
+PLAYER_WORKERS = 16
+QUEUE_SIZE = 200  # backpressure between discovery and player processing
+
+
+async def discover_version(version, session, queue, seen):
+    """
+    Queue a version's already-known hrefs that are worth scraping, then stream
+    newly discovered hrefs into the same queue while the listing crawl runs.
+    """
+    queued = 0
+
+    async def enqueue(href):
+        nonlocal queued
+        if href in seen:
+            return
+        seen.add(href)
+        await queue.put(href)
+        queued += 1
+
+    async def queue_known():
+        for href in await asyncio.to_thread(load_meta_hrefs, version):
+            await enqueue(href)
+
+    async def queue_discovered():
+        # New cards have no price summary yet, so they are always worth scraping
+        async for _, href, _ in stream_version_hrefs(session, version):
+            await enqueue(href)
+
+    # Run both at once so the crawl isn't stuck behind a full queue of known cards.
+    # If either fails, stop the other so the error surfaces now instead of after it finishes
+    tasks = [asyncio.create_task(queue_known()), asyncio.create_task(queue_discovered())]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    print(f"[{version}] queued {queued} players")
+
+
+async def player_worker(queue, session, metadata_writer, processed):
+    while True:
+        href = await queue.get()
+        try:
+            if await process_player(href, session, metadata_writer) is not None:
+                processed.append(href)
+        finally:
+            queue.task_done()
+
+
+async def run_pipeline(versions=VERSIONS):
+    """
+    Discover hrefs for all versions concurrently while a fixed pool of workers
+    drains the shared queue, so players start processing as soon as the first
+    version's hrefs are known.
+    """
+    started = time.monotonic()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    metadata_writer = CardMetadataBatcher("26")
+    seen = set()
+    processed = []
+
+    # One keep-alive session for every request in the run
+    async with create_session(HEADERS) as session:
+        workers = [
+            asyncio.create_task(player_worker(queue, session, metadata_writer, processed))
+            for _ in range(PLAYER_WORKERS)
+        ]
+
+        results = await asyncio.gather(
+            *(discover_version(version, session, queue, seen) for version in versions),
+            return_exceptions=True
+        )
+        for version, result in zip(versions, results):
+            if isinstance(result, Exception):
+                print(f"[{version}] href discovery failed: {result}")
+
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await metadata_writer.close()
+    shutdown_parse_pool()
+
+    elapsed = time.monotonic() - started
+    print(f"Processed {len(processed)}/{len(seen)} players across {len(versions)} versions in {elapsed:.0f}s")
+    print(f"DB pool usage: {pool_stats()}")
+    print(f"HTTP stats: {request_stats.summary()}")
+    print(f"Rate limits: {rate_limiter_stats()}")
+
 
 async def main():
 
     # Init Tables
     initcardTable()
+    # Day partitions for the sales this run will insert
+    ensure_future_partitions()
+    # Backfill the per-card price summary the first time it exists
+    ensure_price_summary()
+    # ...and the OHLCV candles
+    ensure_candles()
+    # Latest stored sale per card/platform, used to skip already-seen sales
+    load_sale_watermarks()
+    # Per card/platform refresh schedule, used to skip pages with no new trades
+    load_fetch_plan()
+    # Push each committed card to a running deal daemon, if any
+    enable_socket_publishing()
     # collect_futgg_hrefs(version)
 
     # Collect Silver Sales From FutGG
     # await scrape_fc26_players_futgg(version)
     
-    # Collect Hrefs From Futbin
-  
-    # Create tasks for all versions
-    versions = ["gold_rare", "icons", "heroes", "gold_if", "cornerstones"]
-    for version in versions:
-        collect_all_hrefs(version)  # synchronous
-        await scrape_fc26_players(version)  # async
+    # Collect Hrefs From Futbin and scrape every version through one pipeline
+    try:
+        await run_pipeline(VERSIONS)
+    finally:
+        save_fetch_plan()
     
     print("Finished Scraping Process!")
 
@@ -26,4 +136,4 @@ async def main():
 # Using the special variable 
 # __name__
 if __name__=="__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
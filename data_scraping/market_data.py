@@ -0,0 +1,192 @@
+"""
+Typed access to market_sales and cards, shared by the notebook, deal_finder,
+the Parquet cache and the backtester.
+
+Sales rows only carry ids, categoricals and 32-bit numbers; card attributes
+stay in a separate dimension table indexed by card_id and are joined onto the
+sales on demand with with_cards(), so a season of sales fits in memory:
+
+    sales = load_sales(start="2025-09-26", source="cache")
+    cards = load_cards(game=26)
+    df = with_cards(sales, cards, ["name", "version"])
+
+    python data_scraping/market_data.py --start 2025-09-26 [--source cache]   # memory report
+"""
+import argparse
+import pandas as pd
+import pymysql
+
+SALE_DTYPES = {
+    "sale_id": "int32",
+    "card_id": "int32",
+    "platform": "category",
+    "sale_type": "category",
+    "sale_time": "datetime64[s]",
+    "listed_price": "int32",
+    "sold_price": "int32",
+}
+
+CARD_DTYPES = {
+    "card_id": "int32",
+    "name": "category",
+    "game": "int16",
+    "version": "category",
+    "nationality": "category",
+    "league": "category",
+    "club": "category",
+    "position": "category",
+    "rating": "int16",
+    "weak_foot": "int8",
+    "skill_move": "int8",
+    "height": "int16",
+    "accelerate": "category",
+}
+
+SALE_COLUMNS = list(SALE_DTYPES)
+CARD_COLUMNS = list(CARD_DTYPES)
+SOURCES = ["db", "cache"]
+BATCH_ROWS = 200_000
+
+
+def compact(df):
+    """Cast the sales/cards columns present in df to their compact dtypes (in place) and return it."""
+    if "sold_price" in df.columns:
+        # NULL and 0 both mean unsold (see market_sales.was_sold), so unsold rows become 0
+        df["sold_price"] = df["sold_price"].fillna(0)
+    for col, dtype in {**SALE_DTYPES, **CARD_DTYPES}.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype.startswith("int") and df[col].isna().any():
+            dtype = dtype.capitalize()  # nullable integer, e.g. cards without a rating
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def _concat(frames):
+    """pd.concat that keeps categoricals categorical when the batches saw different values."""
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            columns[col] = pd.api.types.union_categoricals([f[col] for f in frames])
+        else:
+            columns[col] = pd.concat([f[col] for f in frames], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _load_sales_db(start, end, platforms, columns):
+    from db_utils import get_connection
+
+    sql = f"SELECT {', '.join(columns)} FROM market_sales WHERE 1 = 1"
+    params = []
+    if start is not None:
+        sql += " AND sale_time >= %s"
+        params.append(start)
+    if end is not None:
+        sql += " AND sale_time < %s"
+        params.append(end)
+    if platforms is not None:
+        sql += f" AND platform IN ({', '.join(['%s'] * len(platforms))})"
+        params.extend(platforms)
+
+    conn = get_connection()
+    frames = []
+    try:
+        # Streamed and compacted batch by batch, so the untyped rows never all sit in memory at once
+        with conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                frames.append(compact(pd.DataFrame(rows, columns=columns)))
+    finally:
+        conn.close()
+    if not frames:
+        return compact(pd.DataFrame({col: pd.Series(dtype=object) for col in columns}))
+    return _concat(frames)
+
+
+def load_sales(start=None, end=None, platforms=None, columns=None, source="db", cache_dir=None):
+    """Sales with start <= sale_time < end, compact dtypes, no card attributes."""
+    columns = columns or SALE_COLUMNS
+    if source == "cache":
+        from sales_cache import read_sales, CACHE_DIR
+        return compact(read_sales(cache_dir or CACHE_DIR, start, end, platforms, columns).to_pandas())
+    return _load_sales_db(start, end, platforms, columns)
+
+
+def load_cards(game=None, source="db", cache_dir=None):
+    """The cards dimension table indexed by card_id."""
+    if source == "cache":
+        from sales_cache import read_cards, CACHE_DIR
+        cards = read_cards(cache_dir or CACHE_DIR).to_pandas()
+    else:
+        from db_utils import pooled_connection
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {', '.join(CARD_COLUMNS)} FROM cards")
+                cards = pd.DataFrame(cur.fetchall(), columns=CARD_COLUMNS)
+    cards = compact(cards)
+    if game is not None:
+        cards = cards[cards["game"] == game]
+    return cards.set_index("card_id", drop=False).rename_axis(None)
+
+
+def with_cards(sales, cards, columns=None, how="left"):
+    """
+    sales with the given card attributes (default: all) joined on card_id.
+    how="inner" drops sales of cards missing from cards, e.g. another game's.
+    """
+    columns = [c for c in (columns or CARD_COLUMNS) if c != "card_id"]
+    return sales.join(cards[columns], on="card_id", how=how)
+
+
+def footprint(df):
+    """Deep memory use of a frame in bytes."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def as_untyped(df):
+    """What the same frame costs with read_sql's object strings and 64-bit numbers."""
+    untyped = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            series = series.astype("datetime64[ns]")
+        elif pd.api.types.is_integer_dtype(series):
+            series = series.astype("float64" if series.isna().any() else "int64")
+        untyped[col] = series
+    return pd.DataFrame(untyped)
+
+
+def memory_report(frames):
+    """Print the footprint of each labelled frame; frames is {label: DataFrame}."""
+    width = max(len(label) for label in frames)
+    for label, df in frames.items():
+        print(f"  {label:<{width}}  {len(df):>12,} rows  {footprint(df) / 1e6:>10.1f} MB")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", default=None, help="first sale_time to load (default: everything)")
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--game", type=int, default=None)
+    ap.add_argument("--source", choices=SOURCES, default="db")
+    args = ap.parse_args()
+
+    sales = load_sales(args.start, args.end, source=args.source)
+    cards = load_cards(args.game, source=args.source)
+    joined = with_cards(sales, cards, how="left" if args.game is None else "inner")
+    print("Before (the notebook's merged frame):")
+    memory_report({"sales + cards merged": as_untyped(joined)})
+    print("After:")
+    memory_report({
+        "sales": sales,
+        "cards dimension": cards,
+        "sales + name/version": with_cards(sales, cards, ["name", "version"]),
+        "sales + all card columns": joined,
+    })
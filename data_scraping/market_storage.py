@@ -0,0 +1,192 @@
+"""
+Partition maintenance for market_sales.
+
+market_sales is range partitioned by day on TO_DAYS(sale_time), with a trailing
+p_future partition catching anything past the last day partition. Run from cron:
+
+    python market_storage.py migrate          # once, converts an existing unpartitioned table
+    python market_storage.py extend --days 7  # keep a week of empty day partitions ahead
+    python market_storage.py retain --days 90 # roll up and drop raw sales older than 90 days
+"""
+import argparse
+import datetime
+import os
+from db_utils import get_connection, ADELAIDE
+
+TABLE = "market_sales"
+FUTURE_PARTITION = "p_future"
+DAYS_AHEAD = 7
+RETAIN_DAYS = int(os.getenv("SALES_RETAIN_DAYS", "90"))
+
+# MySQL's TO_DAYS() counts from year 0, Python's toordinal() from year 1
+TO_DAYS_OFFSET = 365
+
+
+def _today():
+    # sale_time is stored as naive Adelaide wall time, so days and partitions follow Adelaide's calendar
+    return datetime.datetime.now(ADELAIDE).date()
+
+
+def _to_days(day):
+    return day.toordinal() + TO_DAYS_OFFSET
+
+
+def _from_days(days):
+    return datetime.date.fromordinal(days - TO_DAYS_OFFSET)
+
+
+def _partition_name(day):
+    return f"p{day:%Y%m%d}"
+
+
+def _day_partitions_sql(first_day, last_day):
+    """One partition per day, each holding sales strictly before the following midnight."""
+    parts = []
+    day = first_day
+    while day <= last_day:
+        parts.append(f"PARTITION {_partition_name(day)} VALUES LESS THAN ({_to_days(day + datetime.timedelta(days=1))})")
+        day += datetime.timedelta(days=1)
+    return parts
+
+
+def list_partitions(cur):
+    """[(name, upper bound as a date or None for MAXVALUE)] in range order."""
+    cur.execute("""
+        SELECT partition_name, partition_description
+        FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+    """, (TABLE,))
+    return [
+        (row["partition_name"],
+         None if row["partition_description"] == "MAXVALUE" else _from_days(int(row["partition_description"])))
+        for row in cur.fetchall()
+    ]
+
+
+def is_partitioned(cur):
+    return bool(list_partitions(cur))
+
+
+def migrate_market_sales():
+    """Convert a pre-partitioning market_sales table in place. Safe to re-run."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    if is_partitioned(cur):
+        print(f"{TABLE} is already partitioned")
+        conn.close()
+        return
+
+    # Partitioned InnoDB tables can't carry foreign keys
+    cur.execute("""
+        SELECT constraint_name FROM information_schema.referential_constraints
+        WHERE constraint_schema = DATABASE() AND table_name = %s
+    """, (TABLE,))
+    for row in cur.fetchall():
+        cur.execute(f"ALTER TABLE {TABLE} DROP FOREIGN KEY {row['constraint_name']}")
+        print(f"Dropped foreign key {row['constraint_name']}")
+
+    # Every unique key must include the partitioning column
+    cur.execute(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (sale_id, sale_time)")
+
+    cur.execute(f"SELECT DATE(MIN(sale_time)) AS first_day FROM {TABLE}")
+    first_day = cur.fetchone()["first_day"]
+    today = _today()
+    parts = _day_partitions_sql(first_day or today, today + datetime.timedelta(days=DAYS_AHEAD))
+    parts.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+
+    print(f"Repartitioning {TABLE} into {len(parts)} partitions, this rewrites the table...")
+    cur.execute(f"ALTER TABLE {TABLE} PARTITION BY RANGE (TO_DAYS(sale_time)) ({', '.join(parts)})")
+    conn.close()
+    print(f"{TABLE} migrated")
+
+
+def ensure_future_partitions(days_ahead=DAYS_AHEAD):
+    """Split p_future so every day up to today + days_ahead has its own partition."""
+    conn = get_connection()
+    cur = conn.cursor()
+    partitions = list_partitions(cur)
+    if not partitions:
+        print(f"{TABLE} is not partitioned yet, run: python market_storage.py migrate")
+        conn.close()
+        return
+
+    bounds = [bound for _, bound in partitions if bound is not None]
+    # A partition bounded by day D + 1 holds day D, so the next new partition is for the last bound itself
+    first_day = max(bounds) if bounds else _today()
+    last_day = _today() + datetime.timedelta(days=days_ahead)
+    if first_day > last_day:
+        conn.close()
+        return
+
+    parts = _day_partitions_sql(first_day, last_day)
+    parts.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    cur.execute(f"ALTER TABLE {TABLE} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({', '.join(parts)})")
+    conn.close()
+    print(f"Added {len(parts) - 1} day partitions to {TABLE} (through {last_day})")
+
+
+ROLLUP_SQL = f"""
+    INSERT INTO market_sales_daily (
+        card_id, platform, sale_date, listings, sold_count,
+        avg_sold_price, min_sold_price, max_sold_price, avg_listed_price
+    )
+    SELECT card_id, platform, DATE(sale_time),
+           COUNT(*),
+           SUM(was_sold),
+           ROUND(AVG(CASE WHEN was_sold = 1 THEN sold_price END)),
+           MIN(CASE WHEN was_sold = 1 THEN sold_price END),
+           MAX(CASE WHEN was_sold = 1 THEN sold_price END),
+           ROUND(AVG(listed_price))
+    FROM {TABLE} PARTITION ({{partition}})
+    GROUP BY card_id, platform, DATE(sale_time)
+    ON DUPLICATE KEY UPDATE
+        listings=VALUES(listings),
+        sold_count=VALUES(sold_count),
+        avg_sold_price=VALUES(avg_sold_price),
+        min_sold_price=VALUES(min_sold_price),
+        max_sold_price=VALUES(max_sold_price),
+        avg_listed_price=VALUES(avg_listed_price)
+"""
+
+
+def apply_retention(retain_days=RETAIN_DAYS):
+    """
+    Roll every day partition that ends before the retention cutoff into
+    market_sales_daily, then drop it. Partitions are day aligned, so each
+    rollup rewrites whole days and a rerun after a failed drop is harmless.
+    """
+    cutoff = _today() - datetime.timedelta(days=retain_days)
+    conn = get_connection()
+    cur = conn.cursor()
+    expired = [name for name, bound in list_partitions(cur) if bound is not None and bound <= cutoff]
+    if not expired:
+        print(f"No {TABLE} partitions older than {cutoff}")
+        conn.close()
+        return
+
+    for name in expired:
+        cur.execute(ROLLUP_SQL.format(partition=name))
+        conn.commit()
+        cur.execute(f"ALTER TABLE {TABLE} DROP PARTITION {name}")
+        print(f"Rolled up and dropped partition {name}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="partition an existing market_sales table")
+    extend = sub.add_parser("extend", help="create upcoming day partitions")
+    extend.add_argument("--days", type=int, default=DAYS_AHEAD)
+    retain = sub.add_parser("retain", help="roll up and drop old partitions")
+    retain.add_argument("--days", type=int, default=RETAIN_DAYS)
+    args = ap.parse_args()
+
+    if args.command == "migrate":
+        migrate_market_sales()
+    elif args.command == "extend":
+        ensure_future_partitions(args.days)
+    else:
+        apply_retention(args.days)
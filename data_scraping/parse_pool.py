@@ -0,0 +1,61 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of parser processes; 0 parses in a worker thread instead
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Pages allowed to wait for a parser before fetchers have to wait too
+PARSE_BACKLOG_PER_WORKER = 2
+
+
+class ParsePool:
+    """
+    CPU-bound parsing stage backed by a ProcessPoolExecutor.
+    Parser functions must be importable module-level functions that take raw
+    page bytes and return plain dicts/lists so results pickle cheaply.
+    The pending semaphore is the backpressure: once max_pending pages are
+    queued, run() blocks so fetchers cannot race ahead of the parsers.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, max_pending=None):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._pending = asyncio.Semaphore(max_pending or max(1, workers) * PARSE_BACKLOG_PER_WORKER)
+        self.parsed = 0
+        self.waits = 0
+
+    async def run(self, fn, *args):
+        if self._pending.locked():
+            self.waits += 1
+        async with self._pending:
+            if self._executor is None:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, fn, *args)
+        self.parsed += 1
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def summary(self):
+        return {"workers": self.workers, "parsed": self.parsed, "backpressure_waits": self.waits}
+
+
+_parse_pool = None
+
+def get_parse_pool():
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ParsePool()
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        print(f"Parse pool: {_parse_pool.summary()}")
+        _parse_pool = None
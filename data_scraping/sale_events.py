@@ -0,0 +1,99 @@
+"""
+Notifications fired after new sales are committed by db_utils.insert_sale_db.
+
+In-process code subscribes a callback; other processes on the same host (the
+deal daemon) listen on a Unix datagram socket the scraper publishes to once
+enable_socket_publishing() is called. Publishing never blocks or raises: with
+nobody listening the events are simply dropped and pollers catch up later.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+
+SALE_EVENTS_SOCKET = os.getenv("SALE_EVENTS_SOCKET", "/tmp/fifa_sale_events.sock")
+
+_subscribers = []
+_lock = threading.Lock()
+
+
+def subscribe(callback):
+    """callback(event) runs on the inserting thread; event is {"card_id", "platforms", "rows"}."""
+    with _lock:
+        _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def publish_sales(card_id, platforms, rows):
+    with _lock:
+        subscribers = list(_subscribers)
+    if not subscribers:
+        return
+    event = {"card_id": card_id, "platforms": sorted(platforms), "rows": rows}
+    for callback in subscribers:
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"Sale event subscriber failed: {e}")
+
+
+class SocketPublisher:
+    """Subscriber that forwards each event as one JSON datagram to a Unix socket."""
+
+    def __init__(self, path=SALE_EVENTS_SOCKET):
+        self.path = path
+        self.sent = 0
+        self.dropped = 0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+
+    def __call__(self, event):
+        try:
+            self._sock.sendto(json.dumps(event).encode(), self.path)
+            self.sent += 1
+        except OSError:
+            # No listener, or its buffer is full: the daemon's poll picks the rows up anyway
+            self.dropped += 1
+
+    def close(self):
+        self._sock.close()
+
+
+_socket_publisher = None
+
+def enable_socket_publishing(path=SALE_EVENTS_SOCKET):
+    global _socket_publisher
+    if _socket_publisher is None:
+        _socket_publisher = SocketPublisher(path)
+        subscribe(_socket_publisher)
+    return _socket_publisher
+
+
+class _EventProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def datagram_received(self, data, addr):
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        self.callback(event)
+
+
+async def listen(callback, path=SALE_EVENTS_SOCKET):
+    """Bind the event socket and call callback(event) for each datagram. Returns the transport."""
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a previous listener
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _EventProtocol(callback), local_addr=path, family=socket.AF_UNIX
+    )
+    return transport
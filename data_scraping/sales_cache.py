@@ -0,0 +1,237 @@
+"""
+Local Parquet mirror of market_sales and cards for analysis work.
+
+Rather than pulling all of market_sales through the tunnel on every kernel
+restart, sync appends only the rows with a sale_id above the last synced one
+to a dataset partitioned by sale day, and refreshes the (small) cards table:
+
+    python data_scraping/sales_cache.py sync [--cache market_cache]
+    python data_scraping/sales_cache.py compact    # merge each day's sync files into one
+    python data_scraping/sales_cache.py info
+
+load_sales_frame() then reads a date range back as the joined sales/cards frame
+the notebook builds, typed by market_data.py; market_data.load_sales(source="cache")
+and load_cards(source="cache") give the sales and the cards dimension separately.
+Raw sales dropped from MySQL by retention (market_storage.py) stay in the cache.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pymysql
+from market_data import SALE_DTYPES, CARD_DTYPES, load_sales, load_cards, with_cards
+
+CACHE_DIR = os.getenv("SALES_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "market_cache"))
+BATCH_ROWS = 200_000
+# Rows just below the last synced sale_id can commit after a sync has moved past
+# them, so each sync re-reads this many ids and keeps the ones it hasn't cached
+SALE_ID_LAG = 1000
+
+
+def _arrow_type(dtype):
+    if dtype == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == "datetime64[s]":
+        return pa.timestamp("s")
+    return pa.from_numpy_dtype(dtype)
+
+
+# Stored with the same types market_data loads them as (sold_price keeps its NULLs on disk)
+SALES_SCHEMA = pa.schema([(col, _arrow_type(dtype)) for col, dtype in SALE_DTYPES.items()])
+SALES_COLUMNS = SALES_SCHEMA.names
+CARDS_SCHEMA = pa.schema([(col, _arrow_type(dtype)) for col, dtype in CARD_DTYPES.items()])
+
+DAY_PARTITIONING = ds.partitioning(pa.schema([("sale_date", pa.string())]), flavor="hive")
+
+
+def _paths(cache_dir):
+    return {
+        "sales": os.path.join(cache_dir, "market_sales"),
+        "cards": os.path.join(cache_dir, "cards.parquet"),
+        "state": os.path.join(cache_dir, "state.json"),
+    }
+
+
+def load_state(cache_dir=CACHE_DIR):
+    path = _paths(cache_dir)["state"]
+    if not os.path.exists(path):
+        return {"last_sale_id": 0, "recent_ids": [], "rows": 0, "synced_at": None}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(cache_dir, state):
+    path = _paths(cache_dir)["state"]
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # the state only moves once the files it describes are written
+
+
+def _sales_table(rows):
+    columns = dict(zip(SALES_COLUMNS, zip(*rows)))
+    columns["platform"] = [p.lower() if p else p for p in columns["platform"]]
+    arrays = []
+    for field in SALES_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], pa.string()).dictionary_encode().cast(field.type))
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    table = pa.Table.from_arrays(arrays, schema=SALES_SCHEMA)
+    sale_date = pc.strftime(table["sale_time"], format="%Y-%m-%d")
+    return table.append_column("sale_date", sale_date)
+
+
+def _write_sales(cache_dir, rows):
+    table = _sales_table(rows)
+    ds.write_dataset(
+        table, _paths(cache_dir)["sales"], format="parquet", partitioning=DAY_PARTITIONING,
+        # One new file per day per batch, named after the batch's first sale_id so nothing is overwritten
+        basename_template=f"sync-{rows[0][0]}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _sync_cards(cache_dir):
+    cards = load_cards(source="db")
+    table = pa.Table.from_pandas(cards, schema=CARDS_SCHEMA, preserve_index=False)
+    path = _paths(cache_dir)["cards"]
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return len(cards)
+
+
+def sync(cache_dir=CACHE_DIR):
+    """Append market_sales rows above the cached sale_id watermark and refresh cards."""
+    from db_utils import get_connection
+
+    os.makedirs(cache_dir, exist_ok=True)
+    state = load_state(cache_dir)
+    recent = set(state["recent_ids"])
+    last = state["last_sale_id"]
+    started = time.perf_counter()
+    new_rows = 0
+
+    cards = _sync_cards(cache_dir)
+    conn = get_connection()
+    try:
+        # Unbuffered cursor so a first sync of the whole history streams in batches
+        with conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute(f"""
+                SELECT {', '.join(SALES_COLUMNS)} FROM market_sales
+                WHERE sale_id > %s
+                ORDER BY sale_id
+            """, (max(last - SALE_ID_LAG, 0),))
+            while True:
+                rows = cur.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                rows = [row for row in rows if row[0] not in recent]
+                if not rows:
+                    continue
+                _write_sales(cache_dir, rows)
+                new_rows += len(rows)
+                last = max(last, rows[-1][0])
+                recent.update(row[0] for row in rows)
+                recent = {sale_id for sale_id in recent if sale_id > last - SALE_ID_LAG}
+                state.update(last_sale_id=last, recent_ids=sorted(recent), rows=state["rows"] + len(rows))
+                _save_state(cache_dir, state)
+    finally:
+        conn.close()
+
+    state["synced_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    _save_state(cache_dir, state)
+    print(f"Synced {new_rows:,} new sales and {cards:,} cards in {time.perf_counter() - started:.1f}s "
+          f"(cache holds {state['rows']:,} sales up to sale_id {last})")
+    return new_rows
+
+
+def compact(cache_dir=CACHE_DIR):
+    """Rewrite every day partition made of several sync files as one file ordered by sale_id."""
+    sales_dir = _paths(cache_dir)["sales"]
+    if not os.path.isdir(sales_dir):
+        return 0
+    merged = 0
+    for day in sorted(os.listdir(sales_dir)):
+        day_dir = os.path.join(sales_dir, day)
+        files = sorted(f for f in os.listdir(day_dir) if f.endswith(".parquet"))
+        if len(files) < 2:
+            continue
+        table = pq.read_table(day_dir, schema=SALES_SCHEMA).sort_by("sale_id")
+        tmp_dir = day_dir + ".tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        pq.write_table(table, os.path.join(tmp_dir, f"day-{table['sale_id'][0].as_py()}.parquet"))
+        shutil.rmtree(day_dir)
+        os.replace(tmp_dir, day_dir)
+        merged += 1
+    return merged
+
+
+def _day(value):
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def read_sales(cache_dir=CACHE_DIR, start=None, end=None, platforms=None, columns=None):
+    """Cached sales with start <= sale_time < end as an Arrow table; whole days outside the range are skipped."""
+    dataset = ds.dataset(_paths(cache_dir)["sales"], format="parquet", schema=SALES_SCHEMA.append(
+        pa.field("sale_date", pa.string())), partitioning=DAY_PARTITIONING)
+    conditions = []
+    if start is not None:
+        conditions += [ds.field("sale_date") >= _day(start), ds.field("sale_time") >= pd.Timestamp(start)]
+    if end is not None:
+        conditions += [ds.field("sale_date") <= _day(end), ds.field("sale_time") < pd.Timestamp(end)]
+    if platforms is not None:
+        conditions.append(ds.field("platform").isin(list(platforms)))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    return dataset.to_table(columns=columns or SALES_COLUMNS, filter=condition)
+
+
+def read_cards(cache_dir=CACHE_DIR):
+    """The cached cards table as an Arrow table."""
+    return pq.read_table(_paths(cache_dir)["cards"])
+
+
+def load_sales_frame(cache_dir=CACHE_DIR, start=None, end=None, platforms=None, game=None, card_columns=None):
+    """
+    The notebook's df_26: cached sales in [start, end) with card_columns (default:
+    all) joined on, in market_data's compact dtypes. Unlike the notebook's left
+    merge, sales of cards outside game are dropped when game is given.
+    """
+    sales = load_sales(start, end, platforms, source="cache", cache_dir=cache_dir)
+    cards = load_cards(game, source="cache", cache_dir=cache_dir)
+    return with_cards(sales, cards, card_columns, how="left" if game is None else "inner")
+
+
+def info(cache_dir=CACHE_DIR):
+    state = load_state(cache_dir)
+    sales_dir = _paths(cache_dir)["sales"]
+    days = sorted(os.listdir(sales_dir)) if os.path.isdir(sales_dir) else []
+    size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(cache_dir) for f in files)
+    print(f"Cache:      {os.path.abspath(cache_dir)}")
+    print(f"Sales:      {state['rows']:,} up to sale_id {state['last_sale_id']}")
+    print(f"Days:       {len(days)}" + (f" ({days[0].split('=')[1]} to {days[-1].split('=')[1]})" if days else ""))
+    print(f"Size:       {size / 1e6:.1f} MB")
+    print(f"Last sync:  {state['synced_at']}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("command", choices=["sync", "compact", "info"])
+    ap.add_argument("--cache", default=CACHE_DIR)
+    args = ap.parse_args()
+
+    if args.command == "sync":
+        sync(args.cache)
+    elif args.command == "compact":
+        print(f"Compacted {compact(args.cache)} day partitions")
+    else:
+        info(args.cache)
@@ -0,0 +1,817 @@
+"""
+The trading strategies shared by deal_finder, the deal daemon, the backtester
+and the notebook.
+
+Every detector (dip, rising trend, low-volatility snipe, range and icon
+fluctuation) reads one per-card feature table built by card_features() from a
+single sort of the sales frame: per time window and price floor it holds sale
+counts, sums, min/max, the means and spreads of the last N trades, medians of
+the latest trades and quantile-trimmed ranges. build_features() asks each
+detector which windows it needs, so running all of them costs one sort plus a
+few grouped passes:
+
+    features = build_features(df)                  # once per tick
+    dips = detect(features, "dip")
+    found = run_strategies(df, ["dip", "fluctuation"], params={"dip": {"short_hours": 6}})
+
+drop_candidates() and fluctuation_candidates() are the frame-in, candidates-out
+forms deal_finder used before, and the *_rules() functions are the array cores
+the backtester replays.
+"""
+import numpy as np
+import pandas as pd
+
+# Dip strategy settings
+SHORT_HOURS = 2
+LONG_HOURS = 8
+SHORT_TRADES = 10
+LONG_TRADES = 100
+MIN_SHORT_SALES = 15
+MIN_LONG_SALES = 40
+
+# (price floor, medium dip %, high dip %), dearest band first; get_thresholds is the scalar form
+THRESHOLD_BANDS = ((200_000, 3, 5), (50_000, 5, 8), (0, 10, 14))
+
+RATING_ORDER = {"🔥 High": 2, "⚡ Medium": 1}
+
+ICON_VERSION = "All Icons"
+GOLD_VERSION = "Gold Rare"
+MIN_DROP_PRICE = 10000      # dip rows start above this price
+ICON_HOURS = 6
+
+# Icon fluctuation settings
+FLUCTUATION_MIN_SALES = 5
+FLUCTUATION_LATEST_TRADES = 5
+FLUCTUATION_MIN_SPREAD = 15
+FLUCTUATION_MIN_MARGIN = 8
+FLUCTUATION_MAX_PRICE = 500_000
+
+DROP_COLUMNS = [
+    "name", "version", "last_short_avg", "last_long_avg", "drop_%", "sales_volume",
+    "suggested_buy", "suggested_sell_raw", "suggested_sell_after_tax",
+    "potential_profit", "profit_margin_%", "investment_rating", "rating_priority",
+]
+
+DROP_FEATURE_COLUMNS = [
+    "card_id", "name", "version", "short_count", "short_sum", "short_taken",
+    "long_sum", "long_taken", "sales_volume",
+]
+
+FLUCTUATION_FEATURE_COLUMNS = [
+    "platform", "card_id", "name", "latest_price", "price_sum", "min_price", "max_price", "sales_volume",
+]
+
+FLUCTUATION_COLUMNS = [
+    "platform", "name", "latest_sale", "best_buy", "best_sell",
+    "avg_price", "min_price", "max_price", "spread_%",
+    "sales_volume", "profit_margin_%",
+]
+
+RISING_COLUMNS = [
+    "platform", "name", "version", "last_short_avg", "last_long_avg", "rise_%", "sales_volume",
+    "suggested_buy", "suggested_sell", "potential_profit", "investment_rating", "rating_priority",
+]
+
+SNIPE_COLUMNS = [
+    "platform", "name", "avg_price", "std_dev", "volatility_%", "lowest_sale", "undercut_%",
+    "sales_volume", "suggested_buy", "suggested_sell", "net_profit",
+]
+
+RANGE_COLUMNS = [
+    "platform", "name", "latest_sale", "avg_price", "min_price", "max_price", "spread_%",
+    "sales_volume", "best_buy", "best_sell", "profit_margin_%",
+]
+
+# Detector settings; detect(..., params=...) overrides any of them.
+# The dip and icon fluctuation defaults are the live bot's, the others come from the notebook
+DIP_PARAMS = {
+    "short_hours": SHORT_HOURS,
+    "long_hours": LONG_HOURS,
+    "short_trades": SHORT_TRADES,
+    "long_trades": LONG_TRADES,
+    "min_short_sales": MIN_SHORT_SALES,
+    "min_long_sales": MIN_LONG_SALES,
+    "min_price": MIN_DROP_PRICE,
+    "bands": THRESHOLD_BANDS,
+}
+
+FLUCTUATION_PARAMS = {
+    "hours": ICON_HOURS,
+    "version": ICON_VERSION,
+    "min_sales": FLUCTUATION_MIN_SALES,
+    "latest_trades": FLUCTUATION_LATEST_TRADES,
+}
+
+RISING_PARAMS = {
+    "hours": 12,
+    "version": GOLD_VERSION,
+    "min_sales": 60,
+    "short_trades": 10,
+    "long_trades": 200,
+    "min_rise_%": 5,
+}
+
+SNIPE_PARAMS = {
+    "hours": 24,
+    "min_price": 6000,
+    "trades": 200,
+    "max_volatility_%": 5,
+    "min_undercut_%": 10,   # lowest of the last trades at least this far below their average
+}
+
+RANGE_PARAMS = {
+    "hours": 8,
+    "min_price": 1,
+    "min_sales": 20,
+    "latest_trades": 5,
+    # Prices outside these quantiles, or above latest_cap x the latest median, are dropped as outliers
+    "trim": (0.05, 0.95),
+    "latest_cap": 1.05,
+    "min_spread_%": 15,
+    "min_avg_price": 5000,
+    "min_margin_%": 5,
+}
+
+
+def get_thresholds(price):
+    if price >= 200_000:       # elite cards
+        return 3, 5            # MEDIUM=3%, HIGH=5%
+    elif price >= 50_000:      # mid-tier cards
+        return 5, 8
+    else:                      # cheap fodder
+        return 10, 14
+
+
+def thresholds_for(prices, bands=THRESHOLD_BANDS):
+    """Array form of get_thresholds: (medium, high) dip % per price."""
+    conditions = [prices >= floor for floor, _, _ in bands[:-1]]
+    medium = np.select(conditions, [m for _, m, _ in bands[:-1]], default=bands[-1][1])
+    high = np.select(conditions, [h for _, _, h in bands[:-1]], default=bands[-1][2])
+    return medium, high
+
+
+# ------------------- FEATURE TABLE -------------------
+
+def window_label(hours, min_price=0):
+    """Column prefix of a feature window, e.g. "8h", "24h_over6000" or "all"."""
+    label = "all" if hours is None else f"{hours:g}h"
+    return f"{label}_over{min_price:g}" if min_price else label
+
+
+def merge_needs(*needs):
+    """Combine detector needs; each maps (hours, min_price) windows to the stats wanted over them."""
+    merged = {}
+    for need in needs:
+        for window, want in need.items():
+            into = merged.setdefault(window, {"last": set(), "last_stats": set(), "latest": set(), "trim": None})
+            for key in ("last", "last_stats", "latest"):
+                into[key] |= set(want.get(key, ()))
+            trim = want.get("trim")
+            if trim is not None:
+                if into["trim"] not in (None, trim):
+                    raise ValueError(f"Conflicting trims for window {window_label(*window)}: {into['trim']} and {trim}")
+                into["trim"] = trim
+    return merged
+
+
+def _group_quantile(values, starts, counts, q):
+    """
+    Quantile q of each group of values, already sorted within groups; np.quantile's
+    linear method step for step, which is what Series.quantile calls, so results match it exactly.
+    """
+    virtual = (counts - 1) * q
+    below = np.floor(virtual)
+    gamma = virtual - below
+    below = below.astype(np.int64)
+    above = np.minimum(below + 1, counts - 1)
+    a = values[starts + below]
+    b = values[starts + above]
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+
+def _group_median(values, starts, counts):
+    """Median of each group of values, already sorted within groups."""
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+
+def _slices(starts, lengths):
+    """Row indices of the [start, start + length) slices, and which slice each row is from."""
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    first = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return first + np.arange(len(owner)), owner
+
+
+def _slice_reduce(ufunc, values, starts, lengths):
+    """ufunc.reduce over every [start, start + length) slice of values; NaN for empty slices."""
+    out = np.full(len(starts), np.nan)
+    nonempty = lengths > 0
+    bounds = np.column_stack((starts[nonempty], starts[nonempty] + lengths[nonempty])).ravel()
+    if len(bounds):
+        # reduceat reduces between consecutive bounds, so every other result is a slice
+        out[nonempty] = ufunc.reduceat(np.r_[values, 0], bounds)[::2]
+    return out
+
+
+def _sorted_by_price(owner, prices):
+    """prices sorted by (owner, price), with the owners present and where each one's run starts and how long it is."""
+    if not len(owner):
+        return owner, prices, owner, owner
+    # Sold prices are whole coins, so (owner, price) packs into one int64 key
+    price_bits = int(prices.max()).bit_length()
+    if int(owner.max()).bit_length() + price_bits < 63:
+        order = np.argsort((owner.astype(np.int64) << price_bits) | prices.astype(np.int64))
+    else:
+        order = np.lexsort((prices, owner))
+    owner, prices = owner[order], prices[order]
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    return owner[starts], prices, starts, np.diff(np.r_[starts, len(owner)])
+
+
+def _floor_rows(prices, times, reference, group, n_groups, min_price):
+    """The sorted sales priced above min_price, with prefix sums and where each card's run starts."""
+    if min_price > 0:
+        keep = prices > min_price
+        prices, times, reference, group = prices[keep], times[keep], reference[keep], group[keep]
+    starts = np.searchsorted(group, np.arange(n_groups))
+    return {
+        "prices": prices, "times": times, "reference": reference, "starts": starts,
+        "sizes": np.diff(np.r_[starts, len(prices)]), "cum": np.r_[0.0, np.cumsum(prices)],
+    }
+
+
+def _window_features(table, label, rows, hours, want):
+    prices, starts, cum = rows["prices"], rows["starts"], rows["cum"]
+    n_groups = len(starts)
+    # Each card's rows run newest first, so its window is a prefix of them
+    if hours is None:
+        lengths = rows["sizes"]
+    else:
+        inside = np.r_[0, np.cumsum(rows["times"] > rows["reference"] - pd.Timedelta(hours=hours).to_timedelta64())]
+        lengths = inside[starts + rows["sizes"]] - inside[starts]
+    table[f"{label}_count"] = lengths
+    table[f"{label}_sum"] = cum[starts + lengths] - cum[starts]
+    table[f"{label}_min"] = _slice_reduce(np.minimum, prices, starts, lengths)
+    table[f"{label}_max"] = _slice_reduce(np.maximum, prices, starts, lengths)
+
+    for n in sorted(want["last"] | want["last_stats"]):
+        taken = np.minimum(lengths, n)
+        total = cum[starts + taken] - cum[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / taken
+        table[f"{label}_last{n}_sum"] = total
+        table[f"{label}_last{n}_taken"] = taken
+        table[f"{label}_last{n}_mean"] = mean
+        if n in want["last_stats"]:
+            # Two passes rather than a sum of squares, which loses precision on 7-figure prices
+            idx, owner = _slices(starts, taken)
+            squares = np.bincount(owner, (prices[idx] - mean[owner]) ** 2, minlength=n_groups)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                table[f"{label}_last{n}_std"] = np.where(taken > 1, np.sqrt(squares / (taken - 1)), np.nan)
+            table[f"{label}_last{n}_min"] = _slice_reduce(np.minimum, prices, starts, taken)
+
+    latest = {}
+    for k in sorted(want["latest"] | ({want["trim"][2]} if want["trim"] else set())):
+        idx, owner = _slices(starts, np.minimum(lengths, k))
+        groups, values, sub_starts, sub_counts = _sorted_by_price(owner, prices[idx])
+        median = np.full(n_groups, np.nan)
+        median[groups] = _group_median(values, sub_starts, sub_counts)
+        table[f"{label}_latest{k}_median"] = latest[k] = median
+
+    if want["trim"]:
+        q_low, q_high, k, cap = want["trim"]
+        idx, owner = _slices(starts, lengths)
+        groups, values, sub_starts, sub_counts = _sorted_by_price(owner, prices[idx])
+        low = np.full(n_groups, np.nan)
+        high = np.full(n_groups, np.nan)
+        low[groups] = _group_quantile(values, sub_starts, sub_counts, q_low)
+        high[groups] = _group_quantile(values, sub_starts, sub_counts, q_high)
+        table[f"{label}_q{q_low * 100:g}"] = low
+        table[f"{label}_q{q_high * 100:g}"] = high
+        # Sorted by price, the kept prices of a card are one run, so its ends are the min and max
+        owner = np.repeat(groups, sub_counts)
+        kept = (values >= low[owner]) & (values <= high[owner]) & (values <= latest[k][owner] * cap)
+        table[f"{label}_trim_count"] = np.bincount(owner[kept], minlength=n_groups)
+        table[f"{label}_trim_sum"] = np.bincount(owner[kept], values[kept], minlength=n_groups)
+        kept_at = np.flatnonzero(kept)
+        trim_min = np.full(n_groups, np.nan)
+        trim_max = np.full(n_groups, np.nan)
+        trim_max[owner[kept_at]] = values[kept_at]
+        trim_min[owner[kept_at[::-1]]] = values[kept_at[::-1]]
+        table[f"{label}_trim_min"] = trim_min
+        table[f"{label}_trim_max"] = trim_max
+
+
+def card_features(df, needs, now=None):
+    """
+    One row per (platform, card) sold in df with the stats needs asks for.
+    needs maps (hours, min_price) windows, the sales in (now - hours, now] priced
+    above min_price, to {"last": [N, ...], "last_stats": [N, ...], "latest": [K, ...],
+    "trim": (q_low, q_high, K, cap)}; every window gets <label>_count/_sum/_min/_max
+    and each entry adds its own columns (see window_label). now defaults to each
+    platform's latest sale in df, and hours=None takes every row in df. Of sales
+    at the same time, the one with the highest sale_id (or the last row) is newest.
+    """
+    base = ["platform", "card_id"] + [col for col in ("name", "version") if col in df.columns]
+    sold = (df["sold_price"] > 0).to_numpy()
+    if not sold.any():
+        return pd.DataFrame(columns=base)
+
+    platform_codes, platforms = pd.factorize(df["platform"], sort=True)
+    platforms = np.asarray(platforms)
+    times = df["sale_time"].to_numpy()
+    if now is None:
+        reference = np.array([times[platform_codes == code].max() for code in range(len(platforms))])
+    else:
+        reference = np.full(len(platforms), np.datetime64(pd.Timestamp(now))).astype(times.dtype)
+        # Sales after now are in the future of a replayed tick, so no window may see them
+        sold = sold & (times <= reference[0])
+        if not sold.any():
+            return pd.DataFrame(columns=base)
+
+    # The one sort every detector shares: by platform and card, newest sale first.
+    # Packed into one int64 key when it fits, which sorts about twice as fast as a lexsort
+    sold_at = np.flatnonzero(sold)
+    # sale_time is only minute-precise, so same-minute sales are put newest first
+    # before the stable sort: highest sale_id first (as the SQL queries and the
+    # backtester order them), or without sale_ids the last row first
+    if "sale_id" in df.columns:
+        sold_at = sold_at[np.argsort(-df["sale_id"].to_numpy(dtype=np.int64)[sold_at], kind="stable")]
+    else:
+        sold_at = sold_at[::-1]
+    platform_codes, times = platform_codes[sold_at], times[sold_at]
+    card_ids = df["card_id"].to_numpy()[sold_at]
+    age = times.astype(np.int64)
+    age = age.max() - age
+    age_bits = int(age.max()).bit_length()
+    groups = platform_codes.astype(np.int64) * (int(card_ids.max()) + 1) + card_ids
+    if int(groups.max()).bit_length() + age_bits < 63:
+        order = np.argsort((groups << age_bits) | age, kind="stable")
+    else:
+        order = np.lexsort((age, groups))
+    platform_codes, card_ids, times, groups = platform_codes[order], card_ids[order], times[order], groups[order]
+    prices = df["sold_price"].to_numpy(dtype=np.float64)[sold_at[order]]
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(order)]))
+    first_rows = df.iloc[sold_at[order[starts]]]
+    table = {"platform": platforms[platform_codes[starts]], "card_id": card_ids[starts]}
+    for col in base[2:]:
+        table[col] = first_rows[col].to_numpy()
+
+    row_reference = reference[platform_codes]
+    floors = {}
+    for (hours, min_price), want in merge_needs(needs).items():
+        if min_price not in floors:
+            floors[min_price] = _floor_rows(prices, times, row_reference, group, len(starts), min_price)
+        _window_features(table, window_label(hours, min_price), floors[min_price], hours, want)
+    return pd.DataFrame(table)
+
+
+# ------------------- DIP -------------------
+
+def dip_needs(params):
+    short = (params["short_hours"], params["min_price"])
+    long = (params["long_hours"], params["min_price"])
+    return merge_needs({short: {"last": [params["short_trades"]]}}, {long: {"last": [params["long_trades"]]}})
+
+
+def _dip_frame(features, params):
+    """The drop_features frame read off a feature table, keeping its index."""
+    short = window_label(params["short_hours"], params["min_price"])
+    long = window_label(params["long_hours"], params["min_price"])
+    features = features[features[f"{long}_count"] > 0]
+    return pd.DataFrame(index=features.index, data={
+        "card_id": features["card_id"],
+        "name": features["name"],
+        "version": features["version"],
+        "short_count": features[f"{short}_count"],
+        "short_sum": features[f"{short}_last{params['short_trades']}_sum"],
+        "short_taken": features[f"{short}_last{params['short_trades']}_taken"],
+        "long_sum": features[f"{long}_last{params['long_trades']}_sum"],
+        "long_taken": features[f"{long}_last{params['long_trades']}_taken"],
+        "sales_volume": features[f"{long}_count"],
+    })
+
+
+def drop_features(df, platform=None):
+    """
+    One row per card from raw sales: how many sales fall in the short window and
+    the sums/counts behind the last-SHORT_TRADES and last-LONG_TRADES averages.
+    deal_finder's SQL query mode returns the same frame straight from MySQL.
+    """
+    if platform is not None:
+        df = df[df["platform"] == platform]
+    # The live fetch has already applied the price floor
+    params = {**DIP_PARAMS, "min_price": 0}
+    features = card_features(df, dip_needs(params))
+    if features.empty:
+        return pd.DataFrame(columns=DROP_FEATURE_COLUMNS)
+    return _dip_frame(features, params).reset_index(drop=True)
+
+
+def drop_rules(short_count, short_sum, short_taken, long_sum, long_taken, volume,
+               min_short_sales=MIN_SHORT_SALES, min_long_sales=MIN_LONG_SALES, bands=THRESHOLD_BANDS):
+    """
+    Array core of the dip rules, one element per card. Returns the keep mask and
+    the prices behind it; shared by drop_candidates_from_features and the backtester,
+    whose parameter sweep overrides the defaults.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        short_avg = short_sum / short_taken
+        long_avg = long_sum / long_taken
+        drop_pct = (long_avg - short_avg) / long_avg * 100
+
+    medium, high = thresholds_for(long_avg, bands)
+    buy = np.round(short_avg * 0.97)
+    raw_sell = np.round(long_avg * 0.98)
+    after_tax = np.trunc(raw_sell * 0.95)  # EA 5% tax
+    profit = after_tax - buy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = profit / buy * 100
+
+    keep = (
+        (short_count >= min_short_sales)
+        & (volume >= min_long_sales)
+        & (short_avg >= 5000)  # skip unusable cards
+        & (drop_pct >= medium)
+        & (margin >= 3)
+    )
+    return {
+        "keep": keep, "short_avg": short_avg, "long_avg": long_avg, "drop_pct": drop_pct, "high": high,
+        "buy": buy, "raw_sell": raw_sell, "after_tax": after_tax, "profit": profit, "margin": margin,
+    }
+
+
+def drop_candidates_from_features(features, min_short_sales=MIN_SHORT_SALES, min_long_sales=MIN_LONG_SALES,
+                                  bands=THRESHOLD_BANDS):
+    """Apply the dip thresholds, tax and margin rules to a drop_features frame."""
+    if features.empty:
+        return pd.DataFrame(columns=DROP_COLUMNS)
+
+    volume = features["sales_volume"].to_numpy(dtype=np.int64)
+    r = drop_rules(
+        features["short_count"].to_numpy(dtype=np.int64),
+        features["short_sum"].to_numpy(dtype=np.float64),
+        features["short_taken"].to_numpy(dtype=np.float64),
+        features["long_sum"].to_numpy(dtype=np.float64),
+        features["long_taken"].to_numpy(dtype=np.float64),
+        volume, min_short_sales, min_long_sales, bands,
+    )
+    keep = r["keep"]
+    if not keep.any():
+        return pd.DataFrame(columns=DROP_COLUMNS)
+
+    rating = np.where(r["drop_pct"][keep] >= r["high"][keep], "🔥 High", "⚡ Medium")
+    # Indexed like the feature rows they came from, so callers can map back to card_id
+    buy_df = pd.DataFrame(index=features.index[keep], data={
+        "name": features["name"].to_numpy()[keep],
+        "version": features["version"].to_numpy()[keep],
+        "last_short_avg": np.round(r["short_avg"][keep], 2),
+        "last_long_avg": np.round(r["long_avg"][keep], 2),
+        "drop_%": np.round(r["drop_pct"][keep], 2),
+        "sales_volume": volume[keep],
+        "suggested_buy": r["buy"][keep].astype(np.int64),
+        "suggested_sell_raw": r["raw_sell"][keep].astype(np.int64),   # before tax
+        "suggested_sell_after_tax": r["after_tax"][keep].astype(np.int64),
+        "potential_profit": r["profit"][keep].astype(np.int64),
+        # Only a handful of rows survive, so round these like the scalar version did
+        "profit_margin_%": [round(float(m), 2) for m in r["margin"][keep]],
+        "investment_rating": rating,
+    })
+    buy_df["rating_priority"] = buy_df["investment_rating"].map(RATING_ORDER)
+    return buy_df.sort_values(["rating_priority", "drop_%"], ascending=[False, False])
+
+
+def drop_candidates(df, platform=None):
+    """
+    Cards whose average of the last SHORT_TRADES sales in the short window sits
+    far enough below the average of the last LONG_TRADES sales in the long
+    window, ranked by rating then dip size.
+    """
+    return drop_candidates_from_features(drop_features(df, platform))
+
+
+def detect_dip(features, params=DIP_PARAMS):
+    """drop_candidates over every platform of a feature table, with a platform column."""
+    gold = features[features["version"] != ICON_VERSION] if not features.empty else features
+    if gold.empty:
+        return pd.DataFrame(columns=["platform"] + DROP_COLUMNS)
+    buy_df = drop_candidates_from_features(
+        _dip_frame(gold, params), params["min_short_sales"], params["min_long_sales"], params["bands"])
+    buy_df.insert(0, "platform", gold.loc[buy_df.index, "platform"].to_numpy())
+    return buy_df
+
+
+# ------------------- ICON FLUCTUATION -------------------
+
+def fluctuation_needs(params):
+    return {(params["hours"], 0): {"latest": [params["latest_trades"]]}}
+
+
+def _fluctuation_frame(features, params):
+    """The fluctuation_features frame read off a feature table, keeping its index."""
+    window = window_label(params["hours"])
+    features = features[features[f"{window}_count"] >= params["min_sales"]]
+    return pd.DataFrame(index=features.index, data={
+        "platform": features["platform"],
+        "card_id": features["card_id"],
+        "name": features["name"],
+        "latest_price": features[f"{window}_latest{params['latest_trades']}_median"],
+        "price_sum": features[f"{window}_sum"],
+        "min_price": features[f"{window}_min"],
+        "max_price": features[f"{window}_max"],
+        "sales_volume": features[f"{window}_count"],
+    })
+
+
+def fluctuation_features(df):
+    """
+    One row per (platform, card) with at least FLUCTUATION_MIN_SALES sales: the
+    median of the latest FLUCTUATION_LATEST_TRADES prices, price sum, min, max and
+    volume. deal_finder's SQL query mode returns the same frame straight from MySQL.
+    """
+    # The live fetch has already picked the window, so every row counts
+    params = {**FLUCTUATION_PARAMS, "hours": None}
+    features = card_features(df, fluctuation_needs(params))
+    if features.empty:
+        return pd.DataFrame(columns=FLUCTUATION_FEATURE_COLUMNS)
+    return _fluctuation_frame(features, params).reset_index(drop=True)
+
+
+def fluctuation_rules(volume, price_sum, min_price, max_price, latest_price):
+    """Array core of the fluctuation rules, one element per card; shared with the backtester."""
+    avg_price = price_sum / volume
+    spread = (max_price - min_price) / avg_price * 100
+    buy = np.round(min_price * 1.02)
+    sell = np.round(avg_price * 0.98)
+    # The threshold applies to the 2dp figure, rounded the same way as the scalar version
+    margin = np.array([round(m, 2) for m in ((sell * 0.95 - buy) / buy * 100).tolist()])
+
+    keep = (
+        (spread >= FLUCTUATION_MIN_SPREAD)
+        & (avg_price > 10000)
+        & (margin > FLUCTUATION_MIN_MARGIN)
+        & (latest_price < FLUCTUATION_MAX_PRICE)
+    )
+    return {"keep": keep, "avg_price": avg_price, "spread": spread, "buy": buy, "sell": sell, "margin": margin}
+
+
+def fluctuation_candidates_from_features(features):
+    """Apply the spread and margin rules to a fluctuation_features frame."""
+    if features.empty:
+        return pd.DataFrame(columns=FLUCTUATION_COLUMNS)
+
+    volume = features["sales_volume"].to_numpy(dtype=np.int64)
+    min_price = features["min_price"].to_numpy(dtype=np.float64)
+    max_price = features["max_price"].to_numpy(dtype=np.float64)
+    latest_price = features["latest_price"].to_numpy(dtype=np.float64)
+    r = fluctuation_rules(volume, features["price_sum"].to_numpy(dtype=np.float64), min_price, max_price, latest_price)
+    keep = r["keep"]
+    if not keep.any():
+        return pd.DataFrame(columns=FLUCTUATION_COLUMNS)
+
+    fluctuation_df = pd.DataFrame(index=features.index[keep], data={
+        "platform": features["platform"].to_numpy()[keep],
+        "name": features["name"].to_numpy()[keep],
+        "latest_sale": latest_price[keep],
+        "best_buy": r["buy"][keep].astype(np.int64),
+        "best_sell": r["sell"][keep].astype(np.int64),
+        "avg_price": r["avg_price"][keep].astype(np.int64),
+        "min_price": min_price[keep].astype(np.int64),
+        "max_price": max_price[keep].astype(np.int64),
+        "spread_%": np.round(r["spread"][keep], 2),
+        "sales_volume": volume[keep],
+        "profit_margin_%": r["margin"][keep],
+    })
+    fluctuation_df["buy_diff"] = (fluctuation_df["latest_sale"] - fluctuation_df["best_buy"]).abs()
+    fluctuation_df = fluctuation_df.sort_values(["platform", "buy_diff"], kind="stable")
+    return fluctuation_df[FLUCTUATION_COLUMNS]
+
+
+def fluctuation_candidates(df):
+    """
+    Icons whose recent sales swing widely enough to buy near the bottom of the
+    range and sell near its average, for every platform in df at once. Rows are
+    grouped by platform and ranked by how close the latest price is to the buy price.
+    """
+    return fluctuation_candidates_from_features(fluctuation_features(df))
+
+
+def detect_fluctuation(features, params=FLUCTUATION_PARAMS):
+    """fluctuation_candidates for the icons of a feature table."""
+    icons = features[features["version"] == params["version"]] if not features.empty else features
+    if icons.empty:
+        return pd.DataFrame(columns=FLUCTUATION_COLUMNS)
+    return fluctuation_candidates_from_features(_fluctuation_frame(icons, params))
+
+
+# ------------------- RISING TREND -------------------
+
+def rising_needs(params):
+    return {(params["hours"], 0): {"last": [params["short_trades"], params["long_trades"]]}}
+
+
+def detect_rising(features, params=RISING_PARAMS):
+    """
+    Cards (of params["version"]) whose last few sales average at least
+    min_rise_% above their longer run average, rated by rise, margin and volume.
+    """
+    window = window_label(params["hours"])
+    cards = features[features["version"] == params["version"]] if not features.empty else features
+    if cards.empty:
+        return pd.DataFrame(columns=RISING_COLUMNS)
+    cards = cards[cards[f"{window}_count"] >= params["min_sales"]]
+    short_avg = cards[f"{window}_last{params['short_trades']}_mean"].to_numpy()
+    long_avg = cards[f"{window}_last{params['long_trades']}_mean"].to_numpy()
+    volume = cards[f"{window}_count"].to_numpy()
+
+    keep = short_avg > (1 + params["min_rise_%"] / 100) * long_avg
+    if not keep.any():
+        return pd.DataFrame(columns=RISING_COLUMNS)
+    cards, short_avg, long_avg, volume = cards[keep], short_avg[keep], long_avg[keep], volume[keep]
+    buy = np.round(short_avg * 0.99)    # buy slightly below the current price
+    sell = np.round(short_avg * 1.03)   # sell slightly above it
+    profit = sell - buy
+    rise = (short_avg - long_avg) / long_avg * 100
+    margin = profit / buy * 100
+    rating = np.select(
+        [(rise >= 15) & (margin >= 5) & (volume >= 30), (rise >= 10) & (margin >= 3) & (volume >= 20)],
+        ["🔥 High", "⚡ Medium"], default="⚠️ Low",
+    )
+
+    rising_df = pd.DataFrame(index=cards.index, data={
+        "platform": cards["platform"].to_numpy(),
+        "name": cards["name"].to_numpy(),
+        "version": cards["version"].to_numpy(),
+        "last_short_avg": [round(float(v), 2) for v in short_avg],
+        "last_long_avg": [round(float(v), 2) for v in long_avg],
+        "rise_%": [round(float(v), 2) for v in rise],
+        "sales_volume": volume,
+        "suggested_buy": buy.astype(np.int64),
+        "suggested_sell": sell.astype(np.int64),
+        "potential_profit": profit.astype(np.int64),
+        "investment_rating": rating,
+    })
+    rising_df["rating_priority"] = rising_df["investment_rating"].map(RATING_ORDER).fillna(0).astype(np.int64)
+    return rising_df.sort_values(["rating_priority", "rise_%"], ascending=[False, False])
+
+
+# ------------------- LOW-VOLATILITY SNIPE -------------------
+
+def snipe_needs(params):
+    return {(params["hours"], params["min_price"]): {"last_stats": [params["trades"]]}}
+
+
+def detect_snipe(features, params=SNIPE_PARAMS):
+    """
+    Cards whose last `trades` sales are stable (low coefficient of variation)
+    yet include an undercut well below their average, best net profit first.
+    """
+    window = window_label(params["hours"], params["min_price"])
+    last = f"{window}_last{params['trades']}"
+    cards = features[features[f"{window}_count"] >= params["trades"]] if not features.empty else features
+    if cards.empty:
+        return pd.DataFrame(columns=SNIPE_COLUMNS)
+    avg_price = cards[f"{last}_mean"].to_numpy()
+    std_dev = cards[f"{last}_std"].to_numpy()
+    lowest = cards[f"{last}_min"].to_numpy()
+    cv = std_dev / avg_price  # coefficient of variation
+
+    keep = (cv < params["max_volatility_%"] / 100) & (lowest < (1 - params["min_undercut_%"] / 100) * avg_price)
+    if not keep.any():
+        return pd.DataFrame(columns=SNIPE_COLUMNS)
+    cards, avg_price, std_dev, lowest, cv = cards[keep], avg_price[keep], std_dev[keep], lowest[keep], cv[keep]
+    buy = np.round(lowest * 0.97)       # just below the dip
+    sell = np.round(avg_price * 0.98)   # just below the average
+    ea_tax = np.round(sell * 0.05)
+
+    snipe_df = pd.DataFrame(index=cards.index, data={
+        "platform": cards["platform"].to_numpy(),
+        "name": cards["name"].to_numpy(),
+        "avg_price": [round(float(v), 2) for v in avg_price],
+        "std_dev": [round(float(v), 2) for v in std_dev],
+        "volatility_%": [round(float(v), 2) for v in cv * 100],
+        "lowest_sale": lowest.astype(np.int64),
+        "undercut_%": [round(float(v), 2) for v in (avg_price - lowest) / avg_price * 100],
+        "sales_volume": cards[f"{last}_taken"].to_numpy(),
+        "suggested_buy": buy.astype(np.int64),
+        "suggested_sell": sell.astype(np.int64),
+        "net_profit": (sell - buy - ea_tax).astype(np.int64),
+    })
+    return snipe_df.sort_values("net_profit", ascending=False, kind="stable")
+
+
+# ------------------- RANGE -------------------
+
+def range_needs(params):
+    q_low, q_high = params["trim"]
+    window = (params["hours"], params["min_price"])
+    return {window: {"latest": [params["latest_trades"]],
+                     "trim": (q_low, q_high, params["latest_trades"], params["latest_cap"])}}
+
+
+def detect_range(features, params=RANGE_PARAMS):
+    """
+    Cards trading in a wide range once outliers are trimmed: buy just above the
+    bottom of the range, sell just under its average. Best margin first.
+    """
+    window = window_label(params["hours"], params["min_price"])
+    cards = features[features[f"{window}_count"] >= params["min_sales"]] if not features.empty else features
+    if cards.empty:
+        return pd.DataFrame(columns=RANGE_COLUMNS)
+    volume = cards[f"{window}_trim_count"].to_numpy()
+    min_price = cards[f"{window}_trim_min"].to_numpy()
+    max_price = cards[f"{window}_trim_max"].to_numpy()
+    latest = cards[f"{window}_latest{params['latest_trades']}_median"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_price = cards[f"{window}_trim_sum"].to_numpy() / volume
+        spread = (max_price - min_price) / avg_price * 100
+    buy = np.round(min_price * 1.02)    # buy slightly above the bottom
+    sell = np.round(avg_price * 0.98)   # sell slightly below the average
+
+    keep = (volume >= params["min_sales"]) & (spread >= params["min_spread_%"]) & (avg_price > params["min_avg_price"])
+    # The threshold applies to the 2dp margin, rounded the same way as the notebook
+    margin = np.full(len(cards), np.nan)
+    margin[keep] = [round(m, 2) for m in ((sell[keep] - buy[keep]) / buy[keep] * 100).tolist()]
+    with np.errstate(invalid="ignore"):
+        keep &= (margin > params["min_margin_%"]) & (buy <= latest)
+    if not keep.any():
+        return pd.DataFrame(columns=RANGE_COLUMNS)
+
+    range_df = pd.DataFrame(index=cards.index[keep], data={
+        "platform": cards["platform"].to_numpy()[keep],
+        "name": cards["name"].to_numpy()[keep],
+        "latest_sale": latest[keep],
+        "avg_price": avg_price[keep].astype(np.int64),
+        "min_price": min_price[keep].astype(np.int64),
+        "max_price": max_price[keep].astype(np.int64),
+        "spread_%": [round(float(v), 2) for v in spread[keep]],
+        "sales_volume": volume[keep],
+        "best_buy": buy[keep].astype(np.int64),
+        "best_sell": sell[keep].astype(np.int64),
+        "profit_margin_%": margin[keep],
+    })
+    return range_df.sort_values("profit_margin_%", ascending=False, kind="stable")
+
+
+# ------------------- RUNNING DETECTORS -------------------
+
+# name -> (default params, the feature windows it reads, detector)
+DETECTORS = {
+    "dip": (DIP_PARAMS, dip_needs, detect_dip),
+    "rising": (RISING_PARAMS, rising_needs, detect_rising),
+    "snipe": (SNIPE_PARAMS, snipe_needs, detect_snipe),
+    "range": (RANGE_PARAMS, range_needs, detect_range),
+    "fluctuation": (FLUCTUATION_PARAMS, fluctuation_needs, detect_fluctuation),
+}
+
+
+def _detector_params(name, params):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector {name!r}, expected one of {list(DETECTORS)}")
+    return {**DETECTORS[name][0], **(params or {})}
+
+
+def build_features(df, detectors=None, params=None, now=None):
+    """
+    The feature table for detectors (default: all of them) over raw sales with
+    platform, card_id, name, version, sale_time and sold_price columns. params
+    maps detector names to overrides, which must match the ones later passed to detect().
+    """
+    params = params or {}
+    needs = [DETECTORS[name][1](_detector_params(name, params.get(name))) for name in detectors or DETECTORS]
+    return card_features(df, merge_needs(*needs), now)
+
+
+def detect(features, name, params=None):
+    """Candidates of one detector from a build_features table."""
+    return DETECTORS[name][2](features, _detector_params(name, params))
+
+
+def run_strategies(df, detectors=None, params=None, now=None):
+    """Build the feature table once and run every detector on it; returns {name: candidates}."""
+    detectors = list(detectors or DETECTORS)
+    params = params or {}
+    features = build_features(df, detectors, params, now)
+    return {name: detect(features, name, params.get(name)) for name in detectors}
+
+
+def live_features(sales, now, platforms=("pc", "ps")):
+    """
+    deal_finder's pandas-mode features from one fetch of raw sales, cut the way its
+    SQL query mode cuts them: {"dip": {platform: drop_features frame}, "fluctuation":
+    fluctuation_features frame}. The dip windows end at each platform's latest gold
+    sale above MIN_DROP_PRICE, not at a newer icon sale, and the icon window is the
+    ICON_HOURS up to now, the database's NOW() when the sales were fetched.
+    """
+    now = pd.Timestamp(now)
+    times = sales["sale_time"]
+    is_icon = (sales["version"] == ICON_VERSION).to_numpy()
+    gold = sales[~is_icon & (sales["sold_price"] > MIN_DROP_PRICE).to_numpy()
+                 & (times >= now - pd.Timedelta(hours=LONG_HOURS)).to_numpy()]
+    icons = sales[is_icon & (times >= now - pd.Timedelta(hours=ICON_HOURS)).to_numpy()]
+    return {
+        "dip": {plat: drop_features(gold, plat) for plat in platforms},
+        "fluctuation": fluctuation_features(icons),
+    }